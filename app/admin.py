@@ -1,8 +1,13 @@
 """SQLAdmin configuration for the KinoVzor application."""
 
+import json
+
 from sqladmin import Admin, ModelView
 from sqladmin.authentication import AuthenticationBackend
 from starlette.requests import Request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import db
 from app.database import engine
 from app.users.models import User
 from app.movies.models import Movie
@@ -114,6 +119,40 @@ class FavoriteAdmin(ModelView, model=Favorite):
     column_default_sort = [(Favorite.id, True)]
 
 
+@event.listens_for(Session, "after_flush")
+def _collect_changed_tables(session, flush_context):
+    """Remember which tables an admin edit touched.
+
+    Review edits bypass db._apply_rating_change, so the summaries of the
+    movies involved are recomputed here, in the same transaction; the
+    ranking triggers follow from movie_rating_summary.
+    """
+    changed = session.info.setdefault("changed_tables", set())
+    movie_ids = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        changed.add(obj.__table__.name)
+        if isinstance(obj, Review):
+            movie_ids.add(obj.movie_id)
+            movie_ids.update(inspect(obj).attrs.movie_id.history.deleted)
+    if movie_ids:
+        changed.add("movie_rating_summary")
+        connection = session.connection()
+        for statement in db.RATING_SUMMARY_REFRESH:
+            connection.exec_driver_sql(statement, (json.dumps(sorted(movie_ids)),))
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_changed_tables(session):
+    """Bump the db.py version counters so cached API responses are refreshed"""
+    for table in session.info.pop("changed_tables", ()):
+        db.notify_change(table)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_tables(session):
+    session.info.pop("changed_tables", None)
+
+
 def setup_admin(app: FastAPI) -> None:
     """Setup SQLAdmin for the FastAPI application.
     
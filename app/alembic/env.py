@@ -13,7 +13,9 @@ sys.path.insert(0, str(base_path))
 from app.config import get_db_url
 from app.database import Base
 from app.users.models import User
-from app.movies.models import Movie, Review, Rating, Favorite
+from app.movies.models import Movie
+from app.reviews.models import Review
+from app.favorites.models import Favorite
 
 config = context.config
 
@@ -40,7 +42,8 @@ def run_migrations_offline() -> None:
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode."""
     configuration = config.get_section(config.config_ini_section)
-    configuration["sqlalchemy.url"] = get_db_url()
+    # Migrations run on a sync engine, so drop the async driver from the URL
+    configuration["sqlalchemy.url"] = get_db_url().replace("+aiosqlite", "")
 
     connectable = engine_from_config(
         configuration,
@@ -0,0 +1,51 @@
+"""Indexes for the lookups in app/db.py
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+
+
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns, unique) - kept in sync with INDEXES in init_db.py
+INDEXES = [
+    # GET /api/movies filters and sort orders
+    ('ix_movies_title', 'movies', ['title'], False),
+    ('ix_movies_year', 'movies', ['year'], False),
+    ('ix_movies_genre', 'movies', ['genre'], False),
+    ('ix_movies_genre_title', 'movies', ['genre', 'title'], False),
+    ('ix_movies_genre_year', 'movies', ['genre', 'year'], False),
+    # get_user_by_username
+    ('ix_users_username', 'users', ['username'], False),
+    # get_movie_reviews, rating aggregates, delete_movie / delete_user
+    ('ix_reviews_movie_rating', 'reviews', ['movie_id', 'rating'], False),
+    ('ix_reviews_movie_approved_created', 'reviews', ['movie_id', 'approved', 'created_at'], False),
+    ('ix_reviews_movie_created', 'reviews', ['movie_id', 'created_at'], False),
+    ('ix_reviews_user', 'reviews', ['user_id'], False),
+    # ON CONFLICT targets of create_or_update_rating / add_favorite
+    ('ux_ratings_user_movie', 'ratings', ['user_id', 'movie_id'], True),
+    ('ux_favorites_user_movie', 'favorites', ['user_id', 'movie_id'], True),
+    ('ix_ratings_movie', 'ratings', ['movie_id'], False),
+    ('ix_favorites_movie', 'favorites', ['movie_id'], False),
+]
+
+
+def upgrade() -> None:
+    # Remove duplicates that would violate the unique indexes
+    op.execute("DELETE FROM ratings WHERE id NOT IN (SELECT MAX(id) FROM ratings GROUP BY user_id, movie_id)")
+    op.execute("DELETE FROM favorites WHERE id NOT IN (SELECT MIN(id) FROM favorites GROUP BY user_id, movie_id)")
+
+    for name, table, columns, unique in INDEXES:
+        op.create_index(name, table, columns, unique=unique, if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,101 @@
+"""Full-text search index over movies and approved reviews
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+
+
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+TRIGGER_NAMES = [
+    'search_movies_insert',
+    'search_movies_update',
+    'search_movies_delete',
+    'search_reviews_insert',
+    'search_reviews_update',
+    'search_reviews_delete',
+]
+
+
+# The layout of this revision - one row per movie, with the text of all its
+# approved reviews - as it stood then; app/search.py has moved on (see 008)
+def _fold_sql(expr: str) -> str:
+    return f"replace(replace(COALESCE({expr}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _reviews_sql(movie_id: str) -> str:
+    return (
+        "(SELECT group_concat(text, ' ') FROM "
+        f"(SELECT text FROM reviews WHERE movie_id = {movie_id} AND approved = 1 ORDER BY id))"
+    )
+
+
+def _refresh_reviews_sql(movie_id: str) -> str:
+    return f"UPDATE search_index SET reviews = {_fold_sql(_reviews_sql(movie_id))} WHERE rowid = {movie_id};"
+
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_movies_insert AFTER INSERT ON movies BEGIN
+        INSERT INTO search_index (rowid, title, description, reviews)
+        VALUES (new.id, {_fold_sql('new.title')}, {_fold_sql('new.description')}, '');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_movies_update AFTER UPDATE OF title, description ON movies BEGIN
+        UPDATE search_index SET title = {_fold_sql('new.title')}, description = {_fold_sql('new.description')}
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_movies_delete AFTER DELETE ON movies BEGIN
+        DELETE FROM search_index WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_reviews_insert AFTER INSERT ON reviews WHEN new.approved = 1 BEGIN
+        {_refresh_reviews_sql('new.movie_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_reviews_update AFTER UPDATE OF text, approved, movie_id ON reviews
+    WHEN old.approved = 1 OR new.approved = 1 BEGIN
+        {_refresh_reviews_sql('old.movie_id')}
+        {_refresh_reviews_sql('new.movie_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_reviews_delete AFTER DELETE ON reviews WHEN old.approved = 1 BEGIN
+        {_refresh_reviews_sql('old.movie_id')}
+    END
+    """,
+]
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "title, description, reviews, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    for statement in TRIGGERS:
+        op.execute(statement)
+    # Index the existing movies and reviews
+    op.execute("DELETE FROM search_index")
+    op.execute(
+        "INSERT INTO search_index (rowid, title, description, reviews) "
+        f"SELECT m.id, {_fold_sql('m.title')}, {_fold_sql('m.description')}, {_fold_sql(_reviews_sql('m.id'))} "
+        "FROM movies m"
+    )
+
+
+def downgrade() -> None:
+    for name in TRIGGER_NAMES:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS search_index")
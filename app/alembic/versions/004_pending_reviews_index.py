@@ -0,0 +1,25 @@
+"""Partial index for the moderation queue
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # get_pending_reviews: unapproved reviews only, oldest first (kept in sync with init_db.INDEXES)
+    op.create_index('ix_reviews_pending', 'reviews', ['created_at', 'id'], if_not_exists=True,
+                    sqlite_where=sa.text('approved = 0'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_reviews_pending', table_name='reviews', if_exists=True)
@@ -0,0 +1,53 @@
+"""Item-to-item recommendation tables and change triggers
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+
+import init_db
+from app import recommend
+
+
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+TABLE_NAMES = ['user_preferences', 'preference_users', 'movie_pref_norms', 'movie_neighbors', 'preference_changes']
+
+TRIGGER_NAMES = [
+    'recommend_ratings_insert',
+    'recommend_ratings_delete',
+    'recommend_ratings_update',
+    'recommend_reviews_insert',
+    'recommend_reviews_delete',
+    'recommend_reviews_update',
+    'recommend_favorites_insert',
+    'recommend_favorites_delete',
+]
+
+
+def upgrade() -> None:
+    for name in TABLE_NAMES:
+        op.execute(init_db.TABLES[name])
+    op.create_index('ix_user_preferences_movie', 'user_preferences', ['movie_id', 'weight'], if_not_exists=True)
+    for statement in recommend.TRIGGERS:
+        op.execute(statement)
+    # Mark every existing interaction as changed: the first refresh (or
+    # `python kinovzor.py recommend rebuild`) then computes all neighbor lists
+    op.execute(
+        "INSERT OR IGNORE INTO preference_changes (user_id, movie_id) "
+        f"SELECT user_id, movie_id FROM ({recommend._signals_sql()})"
+    )
+
+
+def downgrade() -> None:
+    for name in TRIGGER_NAMES:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.drop_index('ix_user_preferences_movie', table_name='user_preferences', if_exists=True)
+    for name in TABLE_NAMES:
+        op.execute(f"DROP TABLE IF EXISTS {name}")
@@ -0,0 +1,57 @@
+"""Top-rated and trending leaderboards
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import init_db
+from app import db, rankings
+
+
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+TRIGGER_NAMES = [
+    'rankings_summary_insert',
+    'rankings_summary_update',
+    'rankings_summary_delete',
+    'rankings_prior',
+    'rankings_movies_delete',
+]
+
+
+def upgrade() -> None:
+    # top_score is kept from movie_rating_summary, which until now only init_db.upgrade_db created
+    if not sa.inspect(op.get_bind()).has_table('movie_rating_summary'):
+        op.execute(init_db.TABLES['movie_rating_summary'])
+        op.execute(
+            "INSERT INTO movie_rating_summary (movie_id, rating_count, rating_sum, "
+            f"rating_1, rating_2, rating_3, rating_4, rating_5) {db._RATING_AGGREGATE_SQL} GROUP BY movie_id"
+        )
+    op.execute(init_db.TABLES['movie_rankings'])
+    op.execute(init_db.TABLES['ranking_state'])
+    # kept in sync with init_db.INDEXES
+    op.create_index('ix_movie_rankings_top', 'movie_rankings', ['top_score', 'movie_id'], if_not_exists=True,
+                    sqlite_where=sa.text('top_score IS NOT NULL'))
+    op.create_index('ix_movie_rankings_trending', 'movie_rankings', ['trending_score', 'movie_id'],
+                    if_not_exists=True, sqlite_where=sa.text('trending_score > 0'))
+    # Rank the existing movies before the triggers take over
+    rankings.fill(op.get_bind().connection.dbapi_connection.cursor())
+    for statement in rankings.TRIGGERS:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    for name in TRIGGER_NAMES:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.drop_index('ix_movie_rankings_trending', table_name='movie_rankings', if_exists=True)
+    op.drop_index('ix_movie_rankings_top', table_name='movie_rankings', if_exists=True)
+    op.execute("DROP TABLE IF EXISTS ranking_state")
+    op.execute("DROP TABLE IF EXISTS movie_rankings")
@@ -0,0 +1,45 @@
+"""Indexes for the paginated review feeds
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+
+
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns) - kept in sync with INDEXES in init_db.py
+INDEXES = [
+    # list_reviews of a movie by rating, approved or all
+    ('ix_reviews_movie_rating_created', 'reviews', ['movie_id', 'rating', 'created_at']),
+    ('ix_reviews_movie_approved_rating', 'reviews', ['movie_id', 'approved', 'rating', 'created_at']),
+    # list_reviews of a user, newest first or by rating; delete_user
+    ('ix_reviews_user_approved_created', 'reviews', ['user_id', 'approved', 'created_at']),
+    ('ix_reviews_user_approved_rating', 'reviews', ['user_id', 'approved', 'rating', 'created_at']),
+]
+
+# Prefixes of the indexes above (init_db.SUPERSEDED_INDEXES)
+SUPERSEDED = [
+    ('ix_reviews_movie_rating', 'reviews', ['movie_id', 'rating']),
+    ('ix_reviews_user', 'reviews', ['user_id']),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+    for name, table, _ in SUPERSEDED:
+        op.drop_index(name, table_name=table, if_exists=True)
+
+
+def downgrade() -> None:
+    for name, table, columns in SUPERSEDED:
+        op.create_index(name, table, columns, if_not_exists=True)
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,39 @@
+"""Full-text index with one row per approved review
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17
+
+"""
+from alembic import context, op
+
+import init_db
+from app import search
+
+
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # search_index loses its reviews column; FTS5 tables can't be altered
+    for name in search.TRIGGER_NAMES:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS search_index")
+    op.execute(init_db.TABLES['search_index'])
+    op.execute(init_db.TABLES['review_search_index'])
+    for statement in search.TRIGGERS:
+        op.execute(statement)
+    for statement in search.REBUILD:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    for name in search.TRIGGER_NAMES:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS review_search_index")
+    op.execute("DROP TABLE IF EXISTS search_index")
+    # Back to the per-movie layout of revision 003
+    context.script.get_revision('003').module.upgrade()
@@ -0,0 +1,35 @@
+"""Indexed sort key for GET /api/movies?sort=rating
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+
+import init_db
+from app import db
+
+
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    definition = init_db.COLUMNS[('movie_rating_summary', 'rating_average')]
+    op.execute(f"ALTER TABLE movie_rating_summary ADD COLUMN rating_average {definition}")
+    # kept in sync with init_db.INDEXES
+    op.create_index('ix_movie_rating_summary_average', 'movie_rating_summary', ['rating_average', 'movie_id'],
+                    if_not_exists=True)
+    # Every movie gets a summary row, then the trigger adds one for each new movie
+    op.execute(db.RATING_SUMMARY_FILL)
+    for statement in db.RATING_SUMMARY_TRIGGERS:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS rating_summary_movies_insert")
+    op.drop_index('ix_movie_rating_summary_average', table_name='movie_rating_summary', if_exists=True)
+    op.execute("ALTER TABLE movie_rating_summary DROP COLUMN rating_average")
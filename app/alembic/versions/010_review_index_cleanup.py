@@ -0,0 +1,32 @@
+"""Drop the review indexes the approved / unapproved ranges replace
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+
+
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns) - kept in sync with init_db.SUPERSEDED_INDEXES. Pages of
+# all of a movie's reviews merge two ranges of the (movie_id, approved, ...) indexes.
+SUPERSEDED = [
+    ('ix_reviews_movie_rating_created', 'reviews', ['movie_id', 'rating', 'created_at']),
+    ('ix_reviews_movie_created', 'reviews', ['movie_id', 'created_at']),
+]
+
+
+def upgrade() -> None:
+    for name, table, _ in SUPERSEDED:
+        op.drop_index(name, table_name=table, if_exists=True)
+
+
+def downgrade() -> None:
+    for name, table, columns in SUPERSEDED:
+        op.create_index(name, table, columns, if_not_exists=True)
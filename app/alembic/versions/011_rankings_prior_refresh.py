@@ -0,0 +1,32 @@
+"""Move the top-rated prior out of the rating write transaction
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+
+from app import rankings
+
+
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # kept in sync with init_db.SUPERSEDED_TRIGGERS; rankings.refresh() moves the prior now
+    op.execute("DROP TRIGGER IF EXISTS rankings_prior")
+
+
+def downgrade() -> None:
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS rankings_prior AFTER UPDATE OF rating_count, rating_sum ON ranking_state "
+        "WHEN new.rating_count > 0 "
+        f"AND abs(new.rating_sum * 1.0 / new.rating_count - new.prior_mean) > {rankings.PRIOR_TOLERANCE} "
+        "BEGIN "
+        "UPDATE ranking_state SET prior_mean = new.rating_sum * 1.0 / new.rating_count WHERE id = 1; "
+        f"{rankings._RERANK_TOP}; END"
+    )
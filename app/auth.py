@@ -0,0 +1,110 @@
+"""JWT authentication shared by the routers.
+
+Verified tokens are cached by their SHA-256 until the token's ``exp``, so
+a request with a known cookie skips the HMAC check. User rows resolved by
+get_current_user are cached for AUTH_USER_CACHE_TTL seconds and dropped
+as soon as db.update_user / db.delete_user touch the user.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+import jwt
+from fastapi import Depends, HTTPException, Request
+
+from app import db
+from app.cache import TTLCache
+from app.config import (
+    AUTH_TOKEN_CACHE_SIZE,
+    AUTH_USER_CACHE_SIZE,
+    AUTH_USER_CACHE_TTL,
+    JWT_ALGORITHM,
+    JWT_SECRET_KEY,
+    TOKEN_EXPIRE_HOURS,
+)
+from app.users.dao import UserDAO
+
+_token_cache = TTLCache(AUTH_TOKEN_CACHE_SIZE)
+_user_cache = TTLCache(AUTH_USER_CACHE_SIZE if AUTH_USER_CACHE_TTL > 0 else 0, ttl=AUTH_USER_CACHE_TTL)
+
+
+def create_jwt_token(user_id: int) -> str:
+    """Create a JWT token for a user"""
+    payload = {
+        "user_id": user_id,
+        "exp": datetime.utcnow() + timedelta(hours=TOKEN_EXPIRE_HOURS),
+        "iat": datetime.utcnow()
+    }
+    return jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """Verified payload of ``token``; raises jwt.PyJWTError if it is invalid"""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = _token_cache.get(key)
+    if payload is None:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        _token_cache.set(key, payload, expires_at=payload.get("exp"))
+    return payload
+
+
+async def get_current_user_id(request: Request) -> int:
+    """FastAPI dependency: id of the user from the access_token cookie"""
+    token = request.cookies.get("access_token")
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    try:
+        payload = decode_token(token)
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Authentication failed")
+    user_id = payload.get("user_id")
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user_id
+
+
+async def get_optional_user_id(request: Request) -> Optional[int]:
+    """FastAPI dependency: like get_current_user_id, but None for anonymous requests"""
+    try:
+        return await get_current_user_id(request)
+    except HTTPException:
+        return None
+
+
+async def get_current_user(user_id: int = Depends(get_current_user_id), users: UserDAO = Depends()) -> Dict:
+    """FastAPI dependency: users row of the authenticated user"""
+    user = _user_cache.get(user_id)
+    if user is None:
+        user = await users.get(user_id)
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        _user_cache.set(user_id, user)
+    return user
+
+
+
+async def get_current_moderator(user: Dict = Depends(get_current_user)) -> Dict:
+    """FastAPI dependency: the authenticated user, who must be a moderator"""
+    if not user.get("is_moderator"):
+        raise HTTPException(status_code=403, detail="Moderator access required")
+    return user
+
+
+async def get_current_admin(user: Dict = Depends(get_current_user)) -> Dict:
+    """FastAPI dependency: the authenticated user, who must be an admin"""
+    if not user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+@db.on_change
+def _invalidate_user(table: str, key: Any) -> None:
+    if table == "users":
+        if key is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(key)
+
+
+def auth_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the token and user caches"""
+    return {"tokens": _token_cache.stats(), "users": _user_cache.stats()}
@@ -0,0 +1,350 @@
+"""Bulk import of users, movies, reviews and ratings from CSV / JSON Lines files.
+
+Files are read one record at a time and written with executemany, one
+transaction per chunk, so memory stays bounded by the chunk size plus
+the (title, year) -> id and email -> id maps used to resolve references.
+
+While importing, the non-unique secondary indexes and the search,
+recommendation and ranking triggers are dropped; afterwards they are
+recreated and movie_rating_summary, the search index, the recommendation
+model and the leaderboards are rebuilt in one pass each. Writes made by a running app meanwhile are
+picked up by those rebuilds.
+
+Record fields (CSV header or JSON keys):
+
+    users     email, username, password, is_moderator, is_admin
+    movies    title, year, genre, description, poster_url
+    reviews   movie_id | movie_title + movie_year, user_id | user_email,
+              text, rating, approved, created_at (ISO 8601, stored in UTC)
+    ratings   movie_id | movie_title + movie_year, user_id | user_email, value
+
+Movies are deduplicated on (title, year) and users on email, against the
+database and within the files. Passwords that aren't already hashed are
+stored as cheap bcrypt hashes (IMPORT_BCRYPT_ROUNDS), computed in worker
+processes shared by the whole import, and rehashed at full cost on first
+login.
+"""
+import csv
+import json
+import re
+import sqlite3
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app import db, rankings, recommend, search
+from app.passwords import hash_imported_passwords, import_hash_pool, pwd_context
+
+CHUNK_SIZE = 10_000
+
+_SHA256_HEX = re.compile(r"[0-9a-f]{64}")
+_TRIGGER_NAME = re.compile(r"CREATE TRIGGER IF NOT EXISTS (\w+)")
+_INDEX_NAME = re.compile(r"CREATE INDEX IF NOT EXISTS (\w+)")
+
+
+def read_records(path: Path) -> Iterator[Dict[str, Any]]:
+    """Records of a .csv or .jsonl/.ndjson file, one at a time"""
+    path = Path(path)
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _chunks(records: Iterable, size: int) -> Iterator[List]:
+    records = iter(records)
+    while chunk := list(islice(records, size)):
+        yield chunk
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _int(value: Any) -> Optional[int]:
+    value = _text(value)
+    return int(float(value)) if value is not None else None
+
+
+def _timestamp(value: Any) -> Optional[str]:
+    """ISO 8601 date / date-time as the UTC "YYYY-MM-DD HH:MM:SS" of CURRENT_TIMESTAMP; naive values are taken as UTC"""
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        value = _text(value)
+        if value is None:
+            return None
+        # fromisoformat() only takes the "Z" suffix from Python 3.11 on
+        moment = datetime.fromisoformat(value[:-1] + "+00:00" if value[-1] in "zZ" else value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.isoformat(sep=" ", timespec="seconds")
+
+
+def _flag(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def _stored_passwords(passwords: List[str], executor=None) -> List[str]:
+    """``passwords`` with the plaintext ones hashed; bcrypt and SHA-256 hashes are kept"""
+    plaintext = [i for i, password in enumerate(passwords)
+                 if pwd_context.identify(password) is None and not _SHA256_HEX.fullmatch(password)]
+    stored = list(passwords)
+    for i, hashed in zip(plaintext, hash_imported_passwords([passwords[i] for i in plaintext], executor)):
+        stored[i] = hashed
+    return stored
+
+
+class BulkImporter:
+    """Loads record streams into ``conn``; each import_* returns its counters"""
+
+    def __init__(self, conn: sqlite3.Connection, chunk_size: int = CHUNK_SIZE,
+                 progress: Callable[[str, int], None] = None):
+        self.conn = conn
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.movie_ids: Dict[Tuple[str, int], int] = {
+            (title, year): movie_id for movie_id, title, year in conn.execute("SELECT id, title, year FROM movies")
+        }
+        self.user_ids: Dict[str, int] = {
+            email: user_id for user_id, email in conn.execute("SELECT id, email FROM users")
+        }
+        self._known_movies = set(self.movie_ids.values())
+        self._known_users = set(self.user_ids.values())
+
+    def import_users(self, records: Iterable[Dict]) -> Dict[str, Any]:
+        pool = import_hash_pool()
+
+        def rows(chunk, counts):
+            accepted = []
+            for record in chunk:
+                email, password = _text(record.get("email")), _text(record.get("password"))
+                if email is None or password is None:
+                    counts["invalid"] += 1
+                elif email in self.user_ids:
+                    counts["skipped"] += 1
+                else:
+                    self.user_ids[email] = None
+                    accepted.append((email, password, _text(record.get("username")) or email.split("@")[0],
+                                     _flag(record.get("is_moderator")), _flag(record.get("is_admin"))))
+            passwords = _stored_passwords([row[1] for row in accepted], pool)
+            for (email, _, *rest), password in zip(accepted, passwords):
+                yield (email, password, *rest)
+
+        def insert(chunk, counts):
+            last_id = self._last_id("users")
+            self.conn.executemany(
+                "INSERT INTO users (email, password, username, is_moderator, is_admin) VALUES (?, ?, ?, ?, ?)",
+                rows(chunk, counts),
+            )
+            for user_id, email in self.conn.execute("SELECT id, email FROM users WHERE id > ?", (last_id,)):
+                self.user_ids[email] = user_id
+                self._known_users.add(user_id)
+                counts["inserted"] += 1
+
+        with pool or nullcontext():
+            return self._load("users", records, insert)
+
+    def import_movies(self, records: Iterable[Dict]) -> Dict[str, Any]:
+        def rows(chunk, counts):
+            for record in chunk:
+                title, genre = _text(record.get("title")), _text(record.get("genre"))
+                try:
+                    year = _int(record.get("year"))
+                except ValueError:
+                    year = None
+                if title is None or genre is None or year is None:
+                    counts["invalid"] += 1
+                elif (title, year) in self.movie_ids:
+                    counts["skipped"] += 1
+                else:
+                    self.movie_ids[(title, year)] = None
+                    yield (title, _text(record.get("description")), genre, year, _text(record.get("poster_url")))
+
+        def insert(chunk, counts):
+            last_id = self._last_id("movies")
+            self.conn.executemany(
+                "INSERT INTO movies (title, description, genre, year, poster_url) VALUES (?, ?, ?, ?, ?)",
+                rows(chunk, counts),
+            )
+            for movie_id, title, year in self.conn.execute(
+                "SELECT id, title, year FROM movies WHERE id > ?", (last_id,)
+            ):
+                self.movie_ids[(title, year)] = movie_id
+                self._known_movies.add(movie_id)
+                counts["inserted"] += 1
+
+        return self._load("movies", records, insert)
+
+    def import_reviews(self, records: Iterable[Dict]) -> Dict[str, Any]:
+        def rows(chunk, counts):
+            for record in chunk:
+                try:
+                    movie_id, user_id = self._movie_ref(record), self._user_ref(record)
+                    rating = _int(record.get("rating"))
+                    created_at = _timestamp(record.get("created_at"))
+                except ValueError:
+                    movie_id = user_id = rating = None
+                text = _text(record.get("text"))
+                if movie_id is None or user_id is False or text is None or rating not in (None, 1, 2, 3, 4, 5):
+                    counts["invalid"] += 1
+                    continue
+                counts["inserted"] += 1
+                yield movie_id, user_id, text, rating, _flag(record.get("approved")), created_at
+
+        def insert(chunk, counts):
+            self.conn.executemany(
+                "INSERT INTO reviews (movie_id, user_id, text, rating, approved, created_at) "
+                "VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))",
+                rows(chunk, counts),
+            )
+
+        return self._load("reviews", records, insert)
+
+    def import_ratings(self, records: Iterable[Dict]) -> Dict[str, Any]:
+        def rows(chunk, counts):
+            for record in chunk:
+                try:
+                    movie_id, user_id = self._movie_ref(record), self._user_ref(record)
+                    value = float(record.get("value"))
+                except (TypeError, ValueError):
+                    movie_id = user_id = None
+                if movie_id is None or not user_id:
+                    counts["invalid"] += 1
+                    continue
+                counts["inserted"] += 1
+                yield movie_id, user_id, value
+
+        def insert(chunk, counts):
+            # the last value wins, as with create_or_update_rating
+            self.conn.executemany(
+                "INSERT INTO ratings (movie_id, user_id, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id, movie_id) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP",
+                rows(chunk, counts),
+            )
+
+        return self._load("ratings", records, insert)
+
+    def _movie_ref(self, record: Dict) -> Optional[int]:
+        """Id of the movie a record refers to, None if unknown"""
+        movie_id = _int(record.get("movie_id"))
+        if movie_id is not None:
+            return movie_id if movie_id in self._known_movies else None
+        title, year = _text(record.get("movie_title")), _int(record.get("movie_year"))
+        return self.movie_ids.get((title, year))
+
+    def _user_ref(self, record: Dict) -> Any:
+        """Id of the user a record refers to, None if it names none, False if unknown"""
+        user_id = _int(record.get("user_id"))
+        if user_id is not None:
+            return user_id if user_id in self._known_users else False
+        email = _text(record.get("user_email"))
+        if email is None:
+            return None
+        return self.user_ids.get(email) or False
+
+    def _last_id(self, table: str) -> int:
+        return self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+
+    def _load(self, table: str, records: Iterable[Dict], insert: Callable[[List, Dict], None]) -> Dict[str, Any]:
+        counts = {"read": 0, "inserted": 0, "skipped": 0, "invalid": 0}
+        started = time.perf_counter()
+        for chunk in _chunks(records, self.chunk_size):
+            counts["read"] += len(chunk)
+            try:
+                insert(chunk, counts)
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            if self.progress:
+                self.progress(table, counts["read"])
+        seconds = time.perf_counter() - started
+        return {**counts, "seconds": round(seconds, 3), "rows_per_sec": round(counts["read"] / seconds) if seconds else None}
+
+
+@contextmanager
+def deferred_maintenance(conn: sqlite3.Connection) -> Iterator[None]:
+    """Drop secondary indexes and derived-table triggers for the block, then restore and rebuild.
+
+    Unique indexes stay: they back the users/ratings conflict handling. If
+    the block fails, the indexes and triggers come back and its error is
+    re-raised without the rebuilds; rows of the chunks committed before it
+    reach the derived tables with the "ratings/search/recommend/rankings
+    rebuild" commands of kinovzor.py.
+    """
+    from init_db import INDEXES
+    for statement in INDEXES:
+        name = _INDEX_NAME.match(statement)
+        if name:
+            conn.execute(f"DROP INDEX IF EXISTS {name.group(1)}")
+    for statement in db.RATING_SUMMARY_TRIGGERS + search.TRIGGERS + recommend.TRIGGERS + rankings.TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {_TRIGGER_NAME.search(statement).group(1)}")
+    conn.commit()
+
+    def restore():
+        for statement in INDEXES + db.RATING_SUMMARY_TRIGGERS + search.TRIGGERS + recommend.TRIGGERS + rankings.TRIGGERS:
+            conn.execute(statement)
+        conn.commit()
+
+    try:
+        yield
+    except BaseException:
+        restore()
+        raise
+    restore()
+    db.rebuild_rating_summary(conn)
+    search.rebuild_search_index(conn)
+    recommend.rebuild(conn)
+    rankings.rebuild(conn)
+    conn.execute("ANALYZE")
+
+
+def import_records(users: Iterable[Dict] = None, movies: Iterable[Dict] = None, reviews: Iterable[Dict] = None,
+                   ratings: Iterable[Dict] = None, chunk_size: int = CHUNK_SIZE, defer_indexes: bool = True,
+                   progress: Callable[[str, int], None] = None) -> Dict[str, Dict[str, Any]]:
+    """Import record streams (users, movies, reviews, ratings, in that order).
+
+    Returns the counters of each import_* call by table name.
+    """
+    sources = {"users": users, "movies": movies, "reviews": reviews, "ratings": ratings}
+    conn = db.get_db()
+    try:
+        conn.execute("PRAGMA cache_size = -65536")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        importer = BulkImporter(conn, chunk_size, progress)
+        report = {}
+        with deferred_maintenance(conn) if defer_indexes else nullcontext():
+            for table, records in sources.items():
+                if records is not None:
+                    report[table] = getattr(importer, f"import_{table}")(records)
+        if not defer_indexes and "reviews" in report:
+            # the search triggers stayed on, but the summary and trending activity
+            # are only kept by app/db.py
+            db.rebuild_rating_summary(conn)
+            rankings.rebuild(conn)
+    finally:
+        conn.close()
+    for table in report:
+        db.notify_change(table)
+    return report
+
+
+def import_files(users: Path = None, movies: Path = None, reviews: Path = None, ratings: Path = None,
+                 **options: Any) -> Dict[str, Dict[str, Any]]:
+    """import_records for .csv / .jsonl files"""
+    sources = {"users": users, "movies": movies, "reviews": reviews, "ratings": ratings}
+    return import_records(
+        **{table: read_records(path) for table, path in sources.items() if path is not None}, **options
+    )
@@ -10,6 +10,63 @@ DATABASE_URL = os.getenv(
 )
 DATABASE_ECHO = os.getenv("DATABASE_ECHO", "False").lower() == "true"
 
+# sqlite3 connection pool used by app/db.py
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", "30"))
+SQLITE_POOL_HEALTH_CHECK = float(os.getenv("SQLITE_POOL_HEALTH_CHECK", "30"))
+
+# JWT authentication (app/auth.py)
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")
+JWT_ALGORITHM = "HS256"
+TOKEN_EXPIRE_HOURS = int(os.getenv("TOKEN_EXPIRE_HOURS", "24"))
+# Verified tokens kept in memory, and how long user rows are cached (0 = off)
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+
+# Password hashing (app/passwords.py): worker processes, and how many
+# hash/verify calls may be in flight before requests get 429
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Plaintext passwords in bulk imports (app/bulk.py) get this cheaper cost;
+# they are rehashed with BCRYPT_ROUNDS on first login
+IMPORT_BCRYPT_ROUNDS = int(os.getenv("IMPORT_BCRYPT_ROUNDS", "4"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 8)))
+
+# Cached catalog responses (app/http_cache.py): bodies kept in memory and
+# the max-age sent to clients (0 = always revalidate with If-None-Match)
+HTTP_CACHE_SIZE = int(os.getenv("HTTP_CACHE_SIZE", "1000"))
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+
+# SQL tracing (app/sqltrace.py): log statements slower than this (0 = off),
+# flag a statement shape repeated this many times in one request as N+1
+# ("warn" logs it, "raise" fails the request, "off"), and log every
+# statement at DEBUG level
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))
+SQL_N_PLUS_ONE = os.getenv("SQL_N_PLUS_ONE", "warn").lower()
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "10"))
+SQL_TRACE = os.getenv("SQL_TRACE", "False").lower() == "true"
+
+# Add a Server-Timing header (db / serialize / app time) to every response (app/metrics.py)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "False").lower() == "true"
+
+# How often /api/movies/stats is recomputed (seconds, 0 = on every request)
+STATS_REFRESH_SECONDS = float(os.getenv("STATS_REFRESH_SECONDS", "10"))
+
+# Item-to-item recommendations (app/recommend.py): neighbors kept per movie, and
+# how often recorded rating/favorite changes are applied (seconds, 0 = only
+# through "python kinovzor.py recommend refresh")
+RECOMMEND_NEIGHBORS = int(os.getenv("RECOMMEND_NEIGHBORS", "50"))
+RECOMMEND_REFRESH_SECONDS = float(os.getenv("RECOMMEND_REFRESH_SECONDS", "60"))
+
+# Leaderboards (app/rankings.py): how many ratings at the site-wide average a
+# movie's top-rated score starts from, the half-life of trending activity, and
+# how often the prior is checked against the site-wide average (seconds, 0 =
+# never)
+TOP_PRIOR_WEIGHT = float(os.getenv("TOP_PRIOR_WEIGHT", "10"))
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24"))
+RANKINGS_REFRESH_SECONDS = float(os.getenv("RANKINGS_REFRESH_SECONDS", "60"))
+
 
 def get_db_url():
     return DATABASE_URL
@@ -0,0 +1,91 @@
+"""Async, request-scoped access to the sqlite3 helpers in app/db.py.
+
+A DBSession owns one pooled connection for the whole request. Calls are
+run on worker threads under a limiter sized to the pool, separate from
+Starlette's default threadpool, so async routers never block the event
+loop and DB work can't exhaust the threads every other endpoint needs.
+"""
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+import anyio
+from fastapi import Depends
+
+from app import db
+from app.config import SQLITE_POOL_SIZE
+
+T = TypeVar("T")
+
+# At most SQLITE_POOL_SIZE sessions hold a connection at a time; the rest
+# wait here without occupying a thread. The thread limiter has the same
+# size, so a session that holds a connection always gets a thread.
+_session_limiter = anyio.CapacityLimiter(SQLITE_POOL_SIZE)
+_thread_limiter = anyio.CapacityLimiter(SQLITE_POOL_SIZE)
+
+
+class DBSession:
+    """One pooled sqlite3 connection shared by all DAOs of a request"""
+
+    def __init__(self):
+        self._conn = None
+        self._holding = False
+        self._lock = anyio.Lock()
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run ``fn`` (typically one or more db.* helpers) on the session connection.
+
+        Pass a function calling several helpers to batch them into a
+        single thread hop.
+        """
+        async with self._lock:
+            if not self._holding:
+                await _session_limiter.acquire_on_behalf_of(self)
+                self._holding = True
+            return await anyio.to_thread.run_sync(
+                partial(self._call, fn, *args, **kwargs), limiter=_thread_limiter
+            )
+
+    def _call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if self._conn is None:
+            self._conn = db.get_pool().checkout()
+        with db.use_connection(self._conn):
+            return fn(*args, **kwargs)
+
+    async def release(self) -> None:
+        """Give the connection back to the pool before a long non-DB await (e.g. bcrypt).
+
+        The next run() checks a connection out again.
+        """
+        async with self._lock:
+            if self._conn is not None:
+                conn, self._conn = self._conn, None
+                await anyio.to_thread.run_sync(db.get_pool().checkin, conn, limiter=_thread_limiter)
+            if self._holding:
+                self._holding = False
+                _session_limiter.release_on_behalf_of(self)
+
+    async def close(self) -> None:
+        await self.release()
+
+
+async def get_session():
+    """FastAPI dependency: a DBSession released when the request finishes"""
+    session = DBSession()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+class BaseDAO:
+    """Base for the per-module DAOs; FastAPI injects the request's session"""
+
+    def __init__(self, session: DBSession = Depends(get_session)):
+        self.session = session
+
+    async def _run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return await self.session.run(fn, *args, **kwargs)
+
+    async def release(self) -> None:
+        """See DBSession.release"""
+        await self.session.release()
@@ -1,15 +1,29 @@
 """Database helper functions using sqlite3"""
+import base64
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional
 import json
 from datetime import datetime
 
+from app.config import SQLITE_POOL_SIZE, SQLITE_POOL_TIMEOUT, SQLITE_POOL_HEALTH_CHECK
+from app.sqltrace import TimedConnection
+from app.pool import ConnectionPool
+
 DB_PATH = Path(__file__).parent.parent / "kinovzor.db"
 
 def get_db() -> sqlite3.Connection:
-    """Get database connection with timeout and other optimizations"""
-    conn = sqlite3.connect(DB_PATH, timeout=30.0, check_same_thread=False)
+    """Open a new database connection with timeout and other optimizations.
+
+    Helpers don't call this directly any more: it is the factory behind the
+    connection pool, so the PRAGMAs below run once per pooled connection.
+    """
+    # TimedConnection times and traces statements (app/sqltrace.py)
+    conn = sqlite3.connect(DB_PATH, timeout=30.0, check_same_thread=False, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     # Enable WAL mode for better concurrency
     try:
@@ -23,6 +37,101 @@ def get_db() -> sqlite3.Connection:
         pass
     return conn
 
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+_current_conn: ContextVar[Optional[sqlite3.Connection]] = ContextVar("kinovzor_db_conn", default=None)
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    get_db,
+                    size=SQLITE_POOL_SIZE,
+                    timeout=SQLITE_POOL_TIMEOUT,
+                    health_check_interval=SQLITE_POOL_HEALTH_CHECK,
+                )
+    return _pool
+
+def close_pool() -> None:
+    """Close pooled connections (on shutdown or before replacing the db file)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def pool_stats() -> Dict[str, Any]:
+    """Checkout/checkin counters of the connection pool"""
+    return get_pool().stats()
+
+@contextmanager
+def connection() -> Iterator[sqlite3.Connection]:
+    """Borrow a pooled connection for the duration of the block.
+
+    Helpers called inside the block reuse the same connection instead of
+    checking out their own, so a request can wrap several helper calls:
+
+        with db.connection():
+            movie = db.get_movie_by_id(movie_id)
+            reviews = db.get_movie_reviews(movie_id)
+    """
+    conn = _current_conn.get()
+    if conn is not None:
+        yield conn
+        return
+
+    pool = get_pool()
+    conn = pool.checkout()
+    token = _current_conn.set(conn)
+    try:
+        yield conn
+    finally:
+        _current_conn.reset(token)
+        pool.checkin(conn)
+
+@contextmanager
+def use_connection(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Make helpers inside the block run on ``conn`` (see app/dao.py)"""
+    token = _current_conn.set(conn)
+    try:
+        yield conn
+    finally:
+        _current_conn.reset(token)
+
+# Write helpers call notify_change(table, key) after committing a change
+# (key is the row id, or None if many rows changed). It bumps the table's
+# version counter - the basis of the HTTP ETags in app/http_cache.py - and
+# calls the listeners, e.g. to drop cached users in app/auth.py.
+# Counters are per process and start from 0 on restart.
+_change_listeners: List[Callable[[str, Any], None]] = []
+_versions: Dict[str, int] = {}
+_changed_at: Dict[str, float] = {}
+_versions_lock = threading.Lock()
+_started_at = time.time()
+
+def on_change(listener: Callable[[str, Any], None]) -> Callable[[str, Any], None]:
+    """Register a change listener; usable as a decorator"""
+    _change_listeners.append(listener)
+    return listener
+
+def notify_change(table: str, key: Any = None) -> None:
+    with _versions_lock:
+        _versions[table] = _versions.get(table, 0) + 1
+        _changed_at[table] = time.time()
+    for listener in _change_listeners:
+        listener(table, key)
+
+def table_versions(*tables: str) -> tuple:
+    """Current version counters of ``tables``"""
+    return tuple(_versions.get(table, 0) for table in tables)
+
+def tables_changed_at(*tables: str) -> float:
+    """When any of ``tables`` last changed (process start if never)"""
+    return max([_changed_at.get(table, _started_at) for table in tables], default=_started_at)
+
 def dict_from_row(row: sqlite3.Row) -> Dict[str, Any]:
     """Convert sqlite3.Row to dict"""
     if row is None:
@@ -31,59 +140,51 @@ def dict_from_row(row: sqlite3.Row) -> Dict[str, Any]:
 
 def dicts_from_rows(rows: List[sqlite3.Row]) -> List[Dict[str, Any]]:
     """Convert list of sqlite3.Row to list of dicts"""
-    return [dict(row) for row in rows]
+    if not rows:
+        return []
+    # Column names once per result, then zip: about twice as fast as dict(row) per row
+    names = rows[0].keys()
+    return [dict(zip(names, row)) for row in rows]
 
 # Users
 def get_user_by_email(email: str) -> Optional[Dict]:
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
         user = cursor.fetchone()
         return dict_from_row(user)
-    finally:
-        conn.close()
 
 def get_user_by_username(username: str) -> Optional[Dict]:
     """Get user by username"""
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
         user = cursor.fetchone()
         return dict_from_row(user)
-    finally:
-        conn.close()
 
 def get_user_by_id(user_id: int) -> Optional[Dict]:
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
         user = cursor.fetchone()
         return dict_from_row(user)
-    finally:
-        conn.close()
 
 def create_user(email: str, password: str, username: str, is_moderator: bool = False) -> Dict:
     """Create user with optional moderator flag"""
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "INSERT INTO users (email, password, username, is_moderator) VALUES (?, ?, ?, ?)",
+            "INSERT INTO users (email, password, username, is_moderator) VALUES (?, ?, ?, ?) RETURNING *",
             (email, password, username, is_moderator)
         )
+        user = dict_from_row(cursor.fetchone())
         conn.commit()
-        user_id = cursor.lastrowid
-        return get_user_by_id(user_id)
-    finally:
-        conn.close()
+        notify_change("users", user['id'])
+        return user
 
-def update_user(user_id: int, email: str = None, username: str = None, password: str = None) -> Dict:
-    """Update user profile"""
-    conn = get_db()
-    try:
+def update_user(user_id: int, email: str = None, username: str = None, password: str = None) -> Optional[Dict]:
+    """Update user profile; None if the user doesn't exist"""
+    with connection() as conn:
         cursor = conn.cursor()
         
         updates = []
@@ -99,24 +200,35 @@ def update_user(user_id: int, email: str = None, username: str = None, password:
             updates.append("password = ?")
             params.append(password)
         
-        if updates:
-            params.append(user_id)
-            query = f"UPDATE users SET {', '.join(updates)} WHERE id = ?"
-            cursor.execute(query, params)
-            conn.commit()
+        if not updates:
+            return get_user_by_id(user_id)
         
-        return get_user_by_id(user_id)
-    finally:
-        conn.close()
+        params.append(user_id)
+        query = f"UPDATE users SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP WHERE id = ? RETURNING *"
+        cursor.execute(query, params)
+        user = dict_from_row(cursor.fetchone())
+        conn.commit()
+        if user is not None:
+            notify_change("users", user_id)
+        return user
 
 def delete_user(user_id: int) -> bool:
     """Delete user and associated data"""
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         
         # Delete favorites
         cursor.execute("DELETE FROM favorites WHERE user_id = ?", (user_id,))
+        # Take the user's review ratings out of the per-movie summaries
+        cursor.execute(f"""
+            UPDATE movie_rating_summary SET
+                rating_count = movie_rating_summary.rating_count - d.rating_count,
+                rating_sum = movie_rating_summary.rating_sum - d.rating_sum,
+                {', '.join(f'rating_{i} = movie_rating_summary.rating_{i} - d.rating_{i}' for i in range(1, 6))},
+                last_updated = CURRENT_TIMESTAMP
+            FROM ({_RATING_AGGREGATE_SQL} AND user_id = ? GROUP BY movie_id) AS d
+            WHERE movie_rating_summary.movie_id = d.movie_id
+        """, (user_id,))
         # Delete reviews
         cursor.execute("DELETE FROM reviews WHERE user_id = ?", (user_id,))
         # Delete ratings
@@ -125,49 +237,285 @@ def delete_user(user_id: int) -> bool:
         cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
         
         conn.commit()
+        for table in ("favorites", "reviews", "ratings", "movie_rating_summary"):
+            notify_change(table)
+        notify_change("users", user_id)
         return True
-    finally:
-        conn.close()
 
 # Movies
 def get_all_movies() -> List[Dict]:
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM movies ORDER BY id DESC")
         movies = cursor.fetchall()
         return dicts_from_rows(movies)
-    finally:
-        conn.close()
 
-def get_movie_by_id(movie_id: int) -> Optional[Dict]:
-    conn = get_db()
+# Movie columns plus rating aggregates from movie_rating_summary
+_MOVIE_SELECT = (
+    "SELECT m.*, COALESCE(s.rating_count, 0) AS rating_count, "
+    "ROUND(s.rating_sum * 1.0 / NULLIF(s.rating_count, 0), 1) AS rating_average "
+    "FROM movies m LEFT JOIN movie_rating_summary s ON s.movie_id = m.id"
+)
+
+# Fields a list can be projected to with ``fields=`` (name -> SQL expression).
+# The rating fields need the movie_rating_summary join of _MOVIE_SELECT.
+MOVIE_FIELDS = {
+    **{name: f"m.{name}" for name in (
+        "id", "title", "description", "genre", "year", "poster_url", "created_at", "updated_at"
+    )},
+    "rating_count": "COALESCE(s.rating_count, 0)",
+    "rating_average": "ROUND(s.rating_sum * 1.0 / NULLIF(s.rating_count, 0), 1)",
+}
+
+# The same rating columns for INSERT/UPDATE ... RETURNING on movies
+_MOVIE_RETURNING = (
+    "RETURNING *, "
+    "COALESCE((SELECT rating_count FROM movie_rating_summary WHERE movie_id = movies.id), 0) AS rating_count, "
+    "(SELECT ROUND(rating_sum * 1.0 / NULLIF(rating_count, 0), 1) FROM movie_rating_summary "
+    "WHERE movie_id = movies.id) AS rating_average"
+)
+
+# Sort orders for list_movies: sort key expression, movie id column and direction.
+# Every order ends with the movie id so keyset cursors are unambiguous.
+# sort=rating reads movie_rating_summary, which has a row for every movie,
+# in the order of ix_movie_rating_summary_average.
+MOVIE_SORTS = {
+    "popular": (None, "m.id", "DESC"),
+    "title": ("m.title", "m.id", "ASC"),
+    "year": ("m.year", "m.id", "DESC"),
+    "rating": ("s.rating_average", "s.movie_id", "DESC"),
+}
+
+def parse_fields(fields, allowed: Dict[str, str], required: List[str] = ("id",)) -> List[str]:
+    """Names from ``fields`` (comma-separated or a list), checked against ``allowed``.
+
+    ``required`` names come first whether asked for or not; ValueError on
+    an unknown name.
+    """
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    names = [name.strip() for name in fields if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}; allowed: {', '.join(allowed)}")
+    return list(dict.fromkeys([*required, *names]))
+
+def _select_list(names: List[str], allowed: Dict[str, str]) -> str:
+    return ", ".join(f"{allowed[name]} AS {name}" for name in names)
+
+def encode_cursor(sort: str, key: List[Any]) -> str:
+    """Opaque keyset cursor: base64 of the sort name and last row's sort key"""
+    raw = json.dumps({"s": sort, "k": key}, ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str) -> List[Any]:
+    """Decode a cursor made by encode_cursor; ValueError if it is malformed or for another sort"""
     try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        key = data["k"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if data.get("s") != sort or not isinstance(key, list):
+        raise ValueError("Cursor does not match sort order")
+    return key
+
+def list_movies(genre: str = None, year_from: int = None, year_to: int = None, sort: str = "popular",
+                limit: int = 50, offset: int = 0, cursor: str = None, with_total: bool = False,
+                favorites_of: int = None, fields=None) -> Dict:
+    """Filtered, sorted page of movies.
+
+    Filtering, ordering and paging all happen in SQL. Pass the returned
+    ``next_cursor`` back as ``cursor`` for keyset pagination (``offset`` is
+    ignored then); ``total`` is only counted when ``with_total`` is set.
+    With ``favorites_of`` (a user id) every movie gets ``is_favorite``,
+    joined in the same query. ``fields`` (see MOVIE_FIELDS; "id" is always
+    included) selects only those columns, and skips the rating join when
+    neither the fields nor the sort need it.
+    """
+    if sort not in MOVIE_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    key_expr, id_expr, direction = MOVIE_SORTS[sort]
+
+    where = []
+    params: List[Any] = []
+    if genre:
+        where.append("m.genre = ?")
+        params.append(genre)
+    if year_from is not None:
+        where.append("m.year >= ?")
+        params.append(year_from)
+    if year_to is not None:
+        where.append("m.year <= ?")
+        params.append(year_to)
+    filter_where, filter_params = list(where), list(params)
+
+    comparison = "<" if direction == "DESC" else ">"
+    if cursor:
+        key = decode_cursor(cursor, sort)
+        if len(key) != (1 if key_expr is None else 2):
+            raise ValueError("Invalid cursor")
+        if key_expr is None:
+            where.append(f"{id_expr} {comparison} ?")
+        else:
+            where.append(f"({key_expr}, {id_expr}) {comparison} (?, ?)")
+        params.extend(key)
+        offset = 0
+
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+    select_sql = _MOVIE_SELECT
+    if fields is not None:
+        names = parse_fields(fields, MOVIE_FIELDS)
+        select_sql = f"SELECT {_select_list(names, MOVIE_FIELDS)} FROM movies m"
+        if sort == "rating" or any(not MOVIE_FIELDS[name].startswith("m.") for name in names):
+            select_sql += " LEFT JOIN movie_rating_summary s ON s.movie_id = m.id"
+    if sort == "rating":
+        select_sql = select_sql.replace(" LEFT JOIN movie_rating_summary s", " JOIN movie_rating_summary s", 1)
+    if key_expr is None:
+        order_sql = f"ORDER BY {id_expr} {direction}"
+    else:
+        select_sql = select_sql.replace(" FROM movies m", f", {key_expr} AS sort_key FROM movies m", 1)
+        order_sql = f"ORDER BY {key_expr} {direction}, {id_expr} {direction}"
+    if favorites_of is not None:
+        # At most one row per movie: favorites is unique on (user_id, movie_id)
+        select_sql = select_sql.replace(" FROM movies m", ", f.id IS NOT NULL AS is_favorite FROM movies m", 1)
+        select_sql += " LEFT JOIN favorites f ON f.movie_id = m.id AND f.user_id = ?"
+        params.insert(0, favorites_of)
+
+    with connection() as conn:
+        cursor_ = conn.cursor()
+        cursor_.execute(
+            f"{select_sql} {where_sql} {order_sql} LIMIT ? OFFSET ?",
+            params + [limit + 1, offset]
+        )
+        rows = cursor_.fetchall()
+
+        total = None
+        if with_total:
+            filter_sql = f"WHERE {' AND '.join(filter_where)}" if filter_where else ""
+            cursor_.execute(f"SELECT COUNT(*) FROM movies m {filter_sql}", filter_params)
+            total = cursor_.fetchone()[0]
+
+    items = dicts_from_rows(rows[:limit])
+    next_cursor = None
+    if len(rows) > limit and items:
+        last = items[-1]
+        key = [last["id"]] if key_expr is None else [last["sort_key"], last["id"]]
+        next_cursor = encode_cursor(sort, key)
+    for item in items:
+        if key_expr is not None:
+            item.pop("sort_key", None)
+        if favorites_of is not None:
+            item["is_favorite"] = bool(item["is_favorite"])
+
+    return {"items": items, "next_cursor": next_cursor, "total": total}
+
+def get_movies_by_ids(movie_ids: List[int]) -> List[Dict]:
+    """Movies for several ids in one query, in the order of ``movie_ids`` (missing ids skipped)"""
+    if not movie_ids:
+        return []
+    with connection() as conn:
+        cursor = conn.cursor()
+        placeholders = ", ".join("?" for _ in movie_ids)
+        cursor.execute(f"{_MOVIE_SELECT} WHERE m.id IN ({placeholders})", list(movie_ids))
+        by_id = {row['id']: dict(row) for row in cursor.fetchall()}
+        return [by_id[movie_id] for movie_id in movie_ids if movie_id in by_id]
+
+def get_movies_full(movie_ids: List[int], user_id: int = None, approved_only: bool = True,
+                    reviews_limit: int = 20) -> List[Dict]:
+    """Movie, first page of reviews, rating stats and favorite flag for several movies in two queries.
+
+    Returns {"movie", "reviews", "reviews_next_cursor", "rating_stats",
+    "is_favorite"} per movie in the order of ``movie_ids`` (missing ids
+    skipped); is_favorite is None without ``user_id``. "reviews" are the
+    newest ``reviews_limit`` as list_reviews returns them, and
+    reviews_next_cursor continues them there (sort "newest").
+    """
+    if not movie_ids:
+        return []
+    with connection() as conn:
+        cursor = conn.cursor()
+        placeholders = ", ".join("?" for _ in movie_ids)
+        favorite = "EXISTS (SELECT 1 FROM favorites f WHERE f.movie_id = m.id AND f.user_id = ?)" if user_id is not None else "NULL"
+        cursor.execute(
+            f"SELECT m.*, COALESCE(s.rating_count, 0) AS rating_count, "
+            f"ROUND(s.rating_sum * 1.0 / NULLIF(s.rating_count, 0), 1) AS rating_average, "
+            f"{', '.join(f'COALESCE(s.rating_{i}, 0) AS summary_rating_{i}' for i in range(1, 6))}, "
+            f"s.last_updated AS summary_last_updated, {favorite} AS is_favorite "
+            f"FROM movies m LEFT JOIN movie_rating_summary s ON s.movie_id = m.id "
+            f"WHERE m.id IN ({placeholders})",
+            ([user_id] if user_id is not None else []) + list(movie_ids)
+        )
+        results = {}
+        for row in cursor.fetchall():
+            movie = dict(row)
+            histogram = {str(i): movie.pop(f'summary_rating_{i}') for i in range(1, 6)}
+            last_updated = movie.pop('summary_last_updated')
+            is_favorite = movie.pop('is_favorite')
+            results[movie['id']] = {
+                "movie": movie,
+                "reviews": [],
+                "reviews_next_cursor": None,
+                "rating_stats": {
+                    "count": movie['rating_count'],
+                    "average": movie['rating_average'],
+                    "histogram": histogram,
+                    "last_updated": last_updated if movie['rating_count'] else None
+                },
+                "is_favorite": bool(is_favorite) if is_favorite is not None else None
+            }
+        if not results:
+            return []
+
+        # One more review than the page per movie, each an index range scan
+        # of that movie's reviews however many it has (with approved_only=False
+        # one of the approved and one of the unapproved reviews, merged)
+        columns, direction = REVIEW_SORTS["newest"]
+        order = ", ".join(f"{column} {direction}" for column in columns)
+        approvals = (1,) if approved_only else (1, 0)
+        page = " UNION ALL ".join(
+            f"SELECT * FROM (SELECT id, {', '.join(columns)} FROM reviews WHERE movie_id = j.value "
+            f"AND approved = {approved} ORDER BY {order} LIMIT ?)"
+            for approved in approvals
+        )
+        cursor.execute(
+            f"SELECT {_select_list(list(REVIEW_FIELDS), REVIEW_FIELDS)} FROM json_each(?) j "
+            f"JOIN reviews r ON r.id IN (SELECT id FROM ({page}) ORDER BY {order} LIMIT ?) "
+            f"LEFT JOIN users u ON r.user_id = u.id "
+            f"ORDER BY {', '.join(f'r.{column} {direction}' for column in columns)}",
+            (json.dumps(list(results)), *[reviews_limit + 1] * (len(approvals) + 1))
+        )
+        for review in dicts_from_rows(cursor.fetchall()):
+            result = results[review['movie_id']]
+            if len(result["reviews"]) < reviews_limit:
+                result["reviews"].append(review)
+            else:
+                last = result["reviews"][-1]
+                result["reviews_next_cursor"] = encode_cursor("reviews:newest", [last[c] for c in columns])
+        return [results[movie_id] for movie_id in movie_ids if movie_id in results]
+
+def get_movie_by_id(movie_id: int) -> Optional[Dict]:
+    with connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM movies WHERE id = ?", (movie_id,))
+        cursor.execute(f"{_MOVIE_SELECT} WHERE m.id = ?", (movie_id,))
         movie = cursor.fetchone()
         return dict_from_row(movie)
-    finally:
-        conn.close()
 
 def create_movie(title: str, description: str, genre: str, year: int, poster_url: str = None) -> Dict:
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "INSERT INTO movies (title, description, genre, year, poster_url) VALUES (?, ?, ?, ?, ?)",
+            f"INSERT INTO movies (title, description, genre, year, poster_url) VALUES (?, ?, ?, ?, ?) {_MOVIE_RETURNING}",
             (title, description, genre, year, poster_url)
         )
+        movie = dict_from_row(cursor.fetchone())
         conn.commit()
-        movie_id = cursor.lastrowid
-        return get_movie_by_id(movie_id)
-    finally:
-        conn.close()
+        notify_change("movies", movie['id'])
+        return movie
 
-def update_movie(movie_id: int, title: str = None, description: str = None, genre: str = None, year: int = None, poster_url: str = None) -> Dict:
-    """Update movie information"""
-    conn = get_db()
-    try:
+def update_movie(movie_id: int, title: str = None, description: str = None, genre: str = None, year: int = None, poster_url: str = None) -> Optional[Dict]:
+    """Update movie information; None if the movie doesn't exist"""
+    with connection() as conn:
         cursor = conn.cursor()
         
         updates = []
@@ -189,20 +537,21 @@ def update_movie(movie_id: int, title: str = None, description: str = None, genr
             updates.append("poster_url = ?")
             params.append(poster_url)
         
-        if updates:
-            params.append(movie_id)
-            query = f"UPDATE movies SET {', '.join(updates)} WHERE id = ?"
-            cursor.execute(query, params)
-            conn.commit()
+        if not updates:
+            return get_movie_by_id(movie_id)
         
-        return get_movie_by_id(movie_id)
-    finally:
-        conn.close()
+        params.append(movie_id)
+        query = f"UPDATE movies SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP WHERE id = ? {_MOVIE_RETURNING}"
+        cursor.execute(query, params)
+        movie = dict_from_row(cursor.fetchone())
+        conn.commit()
+        if movie is not None:
+            notify_change("movies", movie_id)
+        return movie
 
 def delete_movie(movie_id: int) -> bool:
-    """Delete movie and associated data"""
-    conn = get_db()
-    try:
+    """Delete movie and associated data; False if the movie doesn't exist"""
+    with connection() as conn:
         cursor = conn.cursor()
         
         # Delete favorites
@@ -211,42 +560,49 @@ def delete_movie(movie_id: int) -> bool:
         cursor.execute("DELETE FROM reviews WHERE movie_id = ?", (movie_id,))
         # Delete ratings
         cursor.execute("DELETE FROM ratings WHERE movie_id = ?", (movie_id,))
+        cursor.execute("DELETE FROM movie_rating_summary WHERE movie_id = ?", (movie_id,))
         # Delete movie
         cursor.execute("DELETE FROM movies WHERE id = ?", (movie_id,))
+        deleted = cursor.rowcount > 0
         
         conn.commit()
-        return True
-    finally:
-        conn.close()
+        if deleted:
+            for table in ("favorites", "reviews", "ratings", "movie_rating_summary", "movies"):
+                notify_change(table, movie_id if table == "movies" else None)
+        return deleted
 
 # Reviews
-def create_review(movie_id: int, user_id: int, text: str, rating: int = None) -> Dict:
-    conn = get_db()
-    try:
+_REVIEW_RETURNING = "RETURNING *, (SELECT username FROM users WHERE users.id = reviews.user_id) AS username"
+
+def create_review(movie_id: int, user_id: int, text: str, rating: int = None) -> Optional[Dict]:
+    """New (unapproved) review; None if the movie doesn't exist"""
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "INSERT INTO reviews (movie_id, user_id, text, rating, approved) VALUES (?, ?, ?, ?, ?)",
-            (movie_id, user_id, text, rating, False)
+            "INSERT INTO reviews (movie_id, user_id, text, rating, approved) "
+            f"SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM movies WHERE id = ?) {_REVIEW_RETURNING}",
+            (movie_id, user_id, text, rating, False, movie_id)
         )
+        review = dict_from_row(cursor.fetchone())
+        if review is None:
+            conn.rollback()
+            return None
+        _apply_rating_change(cursor, movie_id, None, rating)
         conn.commit()
-        review_id = cursor.lastrowid
-        return get_review_by_id(review_id)
-    finally:
-        conn.close()
+        notify_change("reviews", review['id'])
+        if rating is not None:
+            notify_change("movie_rating_summary", movie_id)
+        return review
 
 def get_review_by_id(review_id: int) -> Optional[Dict]:
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT r.*, u.username FROM reviews r LEFT JOIN users u ON r.user_id = u.id WHERE r.id = ?", (review_id,))
         review = cursor.fetchone()
         return dict_from_row(review)
-    finally:
-        conn.close()
 
 def get_movie_reviews(movie_id: int, approved_only: bool = True) -> List[Dict]:
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         if approved_only:
             cursor.execute(
@@ -260,13 +616,103 @@ def get_movie_reviews(movie_id: int, approved_only: bool = True) -> List[Dict]:
             )
         reviews = cursor.fetchall()
         return dicts_from_rows(reviews)
-    finally:
-        conn.close()
 
-def update_review(review_id: int, text: str = None, rating: int = None) -> Dict:
-    """Update review information"""
-    conn = get_db()
-    try:
+# Fields of the review feeds (see MOVIE_FIELDS); text is cut by text_preview
+REVIEW_FIELDS = {
+    **{name: f"r.{name}" for name in (
+        "id", "movie_id", "user_id", "text", "rating", "approved", "created_at", "updated_at"
+    )},
+    "username": "u.username",
+}
+
+# Review feeds: sort name -> (ORDER BY columns, direction). Every key ends with
+# (created_at, id) so keyset cursors are unambiguous, and all columns run the same
+# way so one row-value comparison continues a page; the rating sorts skip unrated
+# reviews and break ties oldest-first for "lowest".
+REVIEW_SORTS = {
+    "newest": (("created_at", "id"), "DESC"),
+    "highest": (("rating", "created_at", "id"), "DESC"),
+    "lowest": (("rating", "created_at", "id"), "ASC"),
+}
+
+def list_reviews(movie_id: int = None, user_id: int = None, approved_only: bool = True, sort: str = "newest",
+                 limit: int = 20, cursor: str = None, text_preview: int = None, fields=None) -> Dict:
+    """Keyset-paginated reviews of a movie or of a user, with the author's username.
+
+    Exactly one of ``movie_id`` and ``user_id`` is given. Each page is a
+    range scan of a (movie_id or user_id, approved, [rating,] created_at)
+    index, however many reviews there are; approved_only=False merges one
+    range of approved and one of unapproved reviews.
+    With ``text_preview`` the text is cut to that many characters in SQL
+    and "text_truncated" tells whether anything was cut. ``fields`` (see
+    REVIEW_FIELDS) projects the items like in list_movies.
+    """
+    if (movie_id is None) == (user_id is None):
+        raise ValueError("Pass either movie_id or user_id")
+    if sort not in REVIEW_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    columns, direction = REVIEW_SORTS[sort]
+    owner, owner_id = ("movie_id", movie_id) if movie_id is not None else ("user_id", user_id)
+    where, params = [f"r.{owner} = ?"], [owner_id]
+    if approved_only:
+        where.append("r.approved = 1")
+    if "rating" in columns:
+        where.append("r.rating IS NOT NULL")
+    if cursor:
+        key = decode_cursor(cursor, f"reviews:{sort}")
+        if len(key) != len(columns):
+            raise ValueError("Invalid cursor")
+        where.append(f"({', '.join('r.' + c for c in columns)}) {'<' if direction == 'DESC' else '>'} "
+                     f"({', '.join('?' * len(columns))})")
+        params.extend(key)
+
+    allowed = REVIEW_FIELDS
+    if text_preview is not None:
+        allowed = {**REVIEW_FIELDS, "text": "substr(r.text, 1, ?)"}
+    names = list(allowed) if fields is None else parse_fields(fields, allowed)
+    # the cursor needs the sort key, asked for or not
+    hidden = [column for column in columns if column not in names]
+    select = _select_list(names + hidden, allowed)
+    if text_preview is not None and "text" in names:
+        select += ", length(r.text) > ? AS text_truncated"
+        params = [text_preview, text_preview] + params
+    join = " LEFT JOIN users u ON r.user_id = u.id" if "username" in names else ""
+
+    def page_sql(conditions: List[str]) -> str:
+        return (f"SELECT {select} FROM reviews r{join} WHERE {' AND '.join(conditions)} "
+                f"ORDER BY {', '.join(f'r.{c} {direction}' for c in columns)} LIMIT ?")
+
+    if approved_only:
+        sql, params = page_sql(where), params + [limit + 1]
+    else:
+        # A page of the approved and a page of the unapproved reviews, each a
+        # range of the same (owner, approved, ...) index, merged
+        sql = (
+            " UNION ALL ".join(f"SELECT * FROM ({page_sql(where + [f'r.approved = {approved}'])})"
+                               for approved in (1, 0))
+            + f" ORDER BY {', '.join(f'{c} {direction}' for c in columns)} LIMIT ?"
+        )
+        params = (params + [limit + 1]) * 2 + [limit + 1]
+
+    with connection() as conn:
+        cursor_ = conn.cursor()
+        cursor_.execute(sql, params)
+        rows = cursor_.fetchall()
+
+    items = dicts_from_rows(rows[:limit])
+    next_cursor = None
+    if len(rows) > limit and items:
+        next_cursor = encode_cursor(f"reviews:{sort}", [items[-1][c] for c in columns])
+    for item in items:
+        if "text_truncated" in item:
+            item["text_truncated"] = bool(item["text_truncated"])
+        for column in hidden:
+            del item[column]
+    return {"items": items, "next_cursor": next_cursor}
+
+def update_review(review_id: int, text: str = None, rating: int = None) -> Optional[Dict]:
+    """Update review information; None if the review doesn't exist"""
+    with connection() as conn:
         cursor = conn.cursor()
         
         updates = []
@@ -279,152 +725,413 @@ def update_review(review_id: int, text: str = None, rating: int = None) -> Dict:
             updates.append("rating = ?")
             params.append(rating)
         
-        if updates:
-            params.append(review_id)
-            query = f"UPDATE reviews SET {', '.join(updates)} WHERE id = ?"
-            cursor.execute(query, params)
-            conn.commit()
+        if not updates:
+            return get_review_by_id(review_id)
         
-        return get_review_by_id(review_id)
-    finally:
-        conn.close()
+        # The old rating is needed for the summary delta: take the write
+        # lock before reading it so a concurrent update can't slip in between
+        if not conn.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT rating FROM reviews WHERE id = ?", (review_id,))
+        current = cursor.fetchone()
+        if current is None:
+            conn.rollback()
+            return None
+        
+        params.append(review_id)
+        query = f"UPDATE reviews SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP WHERE id = ? {_REVIEW_RETURNING}"
+        cursor.execute(query, params)
+        review = dict_from_row(cursor.fetchone())
+        if rating is not None:
+            _apply_rating_change(cursor, review['movie_id'], current['rating'], rating)
+        conn.commit()
+        notify_change("reviews", review_id)
+        if rating is not None:
+            notify_change("movie_rating_summary", review['movie_id'])
+        return review
 
 def approve_review(review_id: int) -> bool:
-    conn = get_db()
-    try:
+    """False if the review doesn't exist; a newly approved review counts towards trending"""
+    with connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("UPDATE reviews SET approved = 1 WHERE id = ?", (review_id,))
+        cursor.execute(
+            "UPDATE reviews SET approved = 1, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND approved = 0 "
+            "RETURNING movie_id",
+            (review_id,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            cursor.execute("SELECT 1 FROM reviews WHERE id = ?", (review_id,))
+            return cursor.fetchone() is not None
+        _record_activity(cursor, [row[0]])
         conn.commit()
+        notify_change("reviews", review_id)
         return True
-    finally:
-        conn.close()
 
 def delete_review(review_id: int) -> bool:
-    conn = get_db()
-    try:
+    """False if the review doesn't exist"""
+    with connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM reviews WHERE id = ?", (review_id,))
+        cursor.execute("DELETE FROM reviews WHERE id = ? RETURNING movie_id, rating", (review_id,))
+        deleted = cursor.fetchone()
+        if deleted is None:
+            conn.rollback()
+            return False
+        _apply_rating_change(cursor, deleted['movie_id'], deleted['rating'], None)
         conn.commit()
+        notify_change("reviews", review_id)
+        if deleted['rating'] is not None:
+            notify_change("movie_rating_summary", deleted['movie_id'])
         return True
-    finally:
-        conn.close()
 
-# Ratings - Calculate from reviews
-def get_rating_stats(movie_id: int) -> Dict:
-    """Получаем статистику рейтинга из оценок рецензий"""
-    conn = get_db()
-    try:
+def get_pending_reviews(limit: int = 50, cursor: str = None, with_total: bool = False) -> Dict:
+    """Moderation queue: unapproved reviews, oldest first, with author and movie title.
+
+    Keyset paginated on (created_at, id) like list_movies, so every page
+    is a range scan of the partial index ix_reviews_pending.
+    """
+    where = "r.approved = 0"
+    params: List[Any] = []
+    if cursor:
+        key = decode_cursor(cursor, "pending")
+        if len(key) != 2:
+            raise ValueError("Invalid cursor")
+        where += " AND (r.created_at, r.id) > (?, ?)"
+        params.extend(key)
+
+    with connection() as conn:
+        cursor_ = conn.cursor()
+        cursor_.execute(
+            "SELECT r.*, u.username, m.title AS movie_title FROM reviews r "
+            "LEFT JOIN users u ON r.user_id = u.id LEFT JOIN movies m ON r.movie_id = m.id "
+            f"WHERE {where} ORDER BY r.created_at, r.id LIMIT ?",
+            params + [limit + 1]
+        )
+        rows = cursor_.fetchall()
+        total = None
+        if with_total:
+            cursor_.execute("SELECT COUNT(*) FROM reviews WHERE approved = 0")
+            total = cursor_.fetchone()[0]
+
+    items = dicts_from_rows(rows[:limit])
+    next_cursor = None
+    if len(rows) > limit and items:
+        next_cursor = encode_cursor("pending", [items[-1]["created_at"], items[-1]["id"]])
+    return {"items": items, "next_cursor": next_cursor, "total": total}
+
+def moderate_reviews(approve_ids: List[int] = (), reject_ids: List[int] = ()) -> Dict:
+    """Approve and reject (delete) pending reviews in one transaction.
+
+    Only unapproved reviews are touched; other ids come back in "skipped".
+    Rejected ratings leave movie_rating_summary in one statement and
+    listeners are notified once per table, however many reviews the batch
+    holds; the search triggers index each approved review on its own, and
+    approvals count towards trending.
+    """
+    approve_ids, reject_ids = list(dict.fromkeys(approve_ids)), list(dict.fromkeys(reject_ids))
+    if set(approve_ids) & set(reject_ids):
+        raise ValueError("A review can't be both approved and rejected")
+    # The ids go in as one JSON array, so the statements don't depend on the batch size
+    reject_json = json.dumps(reject_ids)
+    pending_in = "id IN (SELECT value FROM json_each(?)) AND approved = 0"
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+        rejected, ratings_changed = [], False
+        if reject_ids:
+            cursor.execute(f"""
+                UPDATE movie_rating_summary SET
+                    rating_count = movie_rating_summary.rating_count - d.rating_count,
+                    rating_sum = movie_rating_summary.rating_sum - d.rating_sum,
+                    {', '.join(f'rating_{i} = movie_rating_summary.rating_{i} - d.rating_{i}' for i in range(1, 6))},
+                    last_updated = CURRENT_TIMESTAMP
+                FROM ({_RATING_AGGREGATE_SQL} AND {pending_in} GROUP BY movie_id) AS d
+                WHERE movie_rating_summary.movie_id = d.movie_id
+            """, (reject_json,))
+            ratings_changed = cursor.rowcount > 0
+            cursor.execute(f"DELETE FROM reviews WHERE {pending_in} RETURNING id", (reject_json,))
+            rejected = [row[0] for row in cursor.fetchall()]
+        approved = []
+        if approve_ids:
+            cursor.execute(
+                f"UPDATE reviews SET approved = 1, updated_at = CURRENT_TIMESTAMP WHERE {pending_in} "
+                "RETURNING id, movie_id",
+                (json.dumps(approve_ids),)
+            )
+            rows = cursor.fetchall()
+            approved = [row[0] for row in rows]
+            _record_activity(cursor, [row[1] for row in rows])
+        conn.commit()
+
+    if approved or rejected:
+        notify_change("reviews")
+    if ratings_changed:
+        notify_change("movie_rating_summary")
+    done = set(approved) | set(rejected)
+    return {
+        "approved": sorted(approved),
+        "rejected": sorted(rejected),
+        "skipped": [review_id for review_id in approve_ids + reject_ids if review_id not in done],
+    }
+
+# Ratings - per-movie aggregates of review ratings, kept in movie_rating_summary
+_RATING_AGGREGATE_SQL = (
+    "SELECT movie_id, COUNT(rating) AS rating_count, COALESCE(SUM(rating), 0) AS rating_sum, "
+    + ", ".join(f"COALESCE(SUM(rating = {i}), 0) AS rating_{i}" for i in range(1, 6))
+    + " FROM reviews WHERE rating IS NOT NULL"
+)
+
+# Every movie has a movie_rating_summary row, zeros until it is rated, so
+# list_movies(sort="rating") can read all movies in rating_average order
+RATING_SUMMARY_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS rating_summary_movies_insert AFTER INSERT ON movies BEGIN "
+    "INSERT OR IGNORE INTO movie_rating_summary (movie_id) VALUES (new.id); END",
+]
+RATING_SUMMARY_FILL = "INSERT OR IGNORE INTO movie_rating_summary (movie_id) SELECT id FROM movies"
+
+# movie_rating_summary rows of the movies in a JSON array, recomputed from
+# reviews; plain SQL so app/admin.py can run it inside SQLAlchemy's flush
+RATING_SUMMARY_REFRESH = (
+    "DELETE FROM movie_rating_summary WHERE movie_id IN (SELECT value FROM json_each(?))",
+    "INSERT INTO movie_rating_summary (movie_id, rating_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5) "
+    f"{_RATING_AGGREGATE_SQL} AND movie_id IN (SELECT value FROM json_each(?)) GROUP BY movie_id",
+    f"{RATING_SUMMARY_FILL} WHERE id IN (SELECT value FROM json_each(?))",
+)
+
+def _apply_rating_change(cursor: sqlite3.Cursor, movie_id: int, old_rating: Optional[int], new_rating: Optional[int]) -> None:
+    """Move one review's rating from old_rating to new_rating in movie_rating_summary.
+
+    Runs on the caller's cursor so it commits (or rolls back) together
+    with the review write. None means "no rating".
+    """
+    if old_rating == new_rating:
+        return
+    count_delta = (new_rating is not None) - (old_rating is not None)
+    sum_delta = (new_rating or 0) - (old_rating or 0)
+    buckets = [(new_rating == i) - (old_rating == i) for i in range(1, 6)]
+    cursor.execute(f"""
+        INSERT INTO movie_rating_summary (movie_id, rating_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(movie_id) DO UPDATE SET
+            rating_count = rating_count + excluded.rating_count,
+            rating_sum = rating_sum + excluded.rating_sum,
+            {', '.join(f'rating_{i} = rating_{i} + excluded.rating_{i}' for i in range(1, 6))},
+            last_updated = CURRENT_TIMESTAMP
+    """, (movie_id, count_delta, sum_delta, *buckets))
+
+def _record_activity(cursor: sqlite3.Cursor, movie_ids: List[int]) -> None:
+    """Count approved reviews / new favorites of ``movie_ids`` towards the trending list (app/rankings.py).
+
+    Like _apply_rating_change, runs on the caller's cursor and transaction.
+    """
+    from app import rankings
+    rankings.record_activity(cursor, movie_ids)
+
+def get_rating_stats(movie_id: int) -> Optional[Dict]:
+    """Получаем статистику рейтинга из оценок рецензий (None, если фильма нет)"""
+    with connection() as conn:
         cursor = conn.cursor()
-        # считаем средние и количество оценок из рецензий
+        # агрегаты поддерживаются при записи рецензий, см. _apply_rating_change
         cursor.execute(
-            "SELECT COUNT(*) as count, AVG(rating) as average FROM reviews WHERE movie_id = ? AND rating IS NOT NULL",
+            "SELECT s.*, ROUND(s.rating_sum * 1.0 / NULLIF(s.rating_count, 0), 1) AS average "
+            "FROM movies m LEFT JOIN movie_rating_summary s ON s.movie_id = m.id WHERE m.id = ?",
             (movie_id,)
         )
         result = cursor.fetchone()
+        if result is None:
+            return None
         
-        if result and result['count'] > 0:
+        histogram = {str(i): (result[f'rating_{i}'] or 0) for i in range(1, 6)}
+        if result['rating_count']:
             return {
-                "count": result['count'],
-                "average": round(float(result['average']), 1)
+                "count": result['rating_count'],
+                "average": result['average'],
+                "histogram": histogram,
+                "last_updated": result['last_updated']
             }
-        return {"count": 0, "average": None}
-    finally:
-        conn.close()
+        return {"count": 0, "average": None, "histogram": histogram, "last_updated": None}
+
+def rebuild_rating_summary(conn: sqlite3.Connection = None) -> int:
+    """Recompute movie_rating_summary from reviews; returns the number of rated movies.
+
+    Uses ``conn`` when given (e.g. a plain connection during upgrade_db).
+    """
+    with (nullcontext(conn) if conn is not None else connection()) as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM movie_rating_summary")
+        cursor.execute(
+            "INSERT INTO movie_rating_summary (movie_id, rating_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5) "
+            f"{_RATING_AGGREGATE_SQL} GROUP BY movie_id"
+        )
+        rebuilt = cursor.rowcount
+        cursor.execute(RATING_SUMMARY_FILL)
+        conn.commit()
+        notify_change("movie_rating_summary")
+        return rebuilt
+
+def verify_rating_summary() -> List[Dict]:
+    """Movies whose summary row disagrees with their reviews (empty list if consistent)"""
+    columns = ["rating_count", "rating_sum"] + [f"rating_{i}" for i in range(1, 6)]
+    with connection() as conn:
+        cursor = conn.cursor()
+        # actual aggregates minus stored ones; any non-zero difference is drift
+        cursor.execute(f"""
+            SELECT movie_id, {', '.join(f'SUM({c}) AS {c}' for c in columns)}
+            FROM (
+                {_RATING_AGGREGATE_SQL} GROUP BY movie_id
+                UNION ALL
+                SELECT movie_id, {', '.join(f'-{c}' for c in columns)} FROM movie_rating_summary
+            )
+            GROUP BY movie_id
+            HAVING {' OR '.join(f'SUM({c}) != 0' for c in columns)}
+        """)
+        return [
+            {"movie_id": row['movie_id'], "difference": {c: row[c] for c in columns}}
+            for row in cursor.fetchall()
+        ]
 
 def create_or_update_rating(movie_id: int, user_id: int, value: float) -> Dict:
     """Legacy function - kept for compatibility"""
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
-        
-        # Check if rating exists
-        cursor.execute("SELECT * FROM ratings WHERE movie_id = ? AND user_id = ?", (movie_id, user_id))
-        existing = cursor.fetchone()
-        
-        if existing:
-            cursor.execute("UPDATE ratings SET value = ? WHERE movie_id = ? AND user_id = ?", (value, movie_id, user_id))
-            rating_id = existing['id']
-        else:
-            cursor.execute(
-                "INSERT INTO ratings (movie_id, user_id, value) VALUES (?, ?, ?)",
-                (movie_id, user_id, value)
-            )
-            rating_id = cursor.lastrowid
-        
+        # one statement thanks to the unique (user_id, movie_id) index
+        cursor.execute(
+            """
+            INSERT INTO ratings (movie_id, user_id, value) VALUES (?, ?, ?)
+            ON CONFLICT(user_id, movie_id) DO UPDATE SET
+                value = excluded.value,
+                updated_at = CURRENT_TIMESTAMP
+            RETURNING *
+            """,
+            (movie_id, user_id, value)
+        )
+        rating = cursor.fetchone()
         conn.commit()
-        return get_rating_by_id(rating_id)
-    finally:
-        conn.close()
+        notify_change("ratings", rating['id'])
+        return dict_from_row(rating)
 
 def get_rating_by_id(rating_id: int) -> Optional[Dict]:
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM ratings WHERE id = ?", (rating_id,))
         rating = cursor.fetchone()
         return dict_from_row(rating)
-    finally:
-        conn.close()
 
 def get_movie_ratings(movie_id: int) -> List[Dict]:
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM ratings WHERE movie_id = ?", (movie_id,))
         ratings = cursor.fetchall()
         return dicts_from_rows(ratings)
-    finally:
-        conn.close()
 
 # Favorites
-def add_favorite(movie_id: int, user_id: int) -> Dict:
-    conn = get_db()
-    try:
+def add_favorite(movie_id: int, user_id: int) -> Optional[Dict]:
+    """{"status": "added"}, {"error": ...} if already there, None if the movie doesn't exist"""
+    with connection() as conn:
         cursor = conn.cursor()
         
-        # Check if already exists
-        cursor.execute("SELECT * FROM favorites WHERE movie_id = ? AND user_id = ?", (movie_id, user_id))
-        if cursor.fetchone():
-            return {"error": "Already in favorites"}
-        
         cursor.execute(
-            "INSERT INTO favorites (movie_id, user_id) VALUES (?, ?)",
-            (movie_id, user_id)
+            "INSERT INTO favorites (movie_id, user_id) SELECT ?, ? WHERE EXISTS (SELECT 1 FROM movies WHERE id = ?) "
+            "ON CONFLICT(user_id, movie_id) DO NOTHING",
+            (movie_id, user_id, movie_id)
         )
+        added = cursor.rowcount > 0
+        if added:
+            _record_activity(cursor, [movie_id])
         conn.commit()
+        if not added:
+            if get_movie_by_id(movie_id) is None:
+                return None
+            return {"error": "Already in favorites"}
+        notify_change("favorites", movie_id)
         return {"status": "added"}
-    finally:
-        conn.close()
 
 def remove_favorite(movie_id: int, user_id: int) -> Dict:
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM favorites WHERE movie_id = ? AND user_id = ?", (movie_id, user_id))
         conn.commit()
+        notify_change("favorites", movie_id)
         return {"status": "removed"}
-    finally:
-        conn.close()
 
-def get_user_favorites(user_id: int) -> List[Dict]:
-    conn = get_db()
-    try:
+def update_favorites(user_id: int, add: List[int] = (), remove: List[int] = ()) -> Dict:
+    """Add and remove several favorites of a user in one transaction.
+
+    Returns the movie ids actually "added" and "removed" (already present
+    or absent ones are left out) and the ids in ``add`` with no movie as
+    "missing".
+    """
+    add, remove = list(dict.fromkeys(add)), list(dict.fromkeys(remove))
+    if set(add) & set(remove):
+        raise ValueError("A movie can't be both added and removed")
+    with connection() as conn:
+        cursor = conn.cursor()
+        added, removed, missing = [], [], []
+        if add:
+            cursor.execute(
+                "INSERT INTO favorites (movie_id, user_id) "
+                "SELECT id, ? FROM movies WHERE id IN (SELECT value FROM json_each(?)) "
+                "ON CONFLICT(user_id, movie_id) DO NOTHING RETURNING movie_id",
+                (user_id, json.dumps(add))
+            )
+            added = [row[0] for row in cursor.fetchall()]
+            _record_activity(cursor, added)
+            if len(added) < len(add):
+                cursor.execute(
+                    "SELECT value FROM json_each(?) WHERE value NOT IN (SELECT id FROM movies)", (json.dumps(add),)
+                )
+                missing = [row[0] for row in cursor.fetchall()]
+        if remove:
+            cursor.execute(
+                "DELETE FROM favorites WHERE user_id = ? AND movie_id IN (SELECT value FROM json_each(?)) "
+                "RETURNING movie_id",
+                (user_id, json.dumps(remove))
+            )
+            removed = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+    if added or removed:
+        notify_change("favorites")
+    order = {movie_id: i for i, movie_id in enumerate(add + remove)}
+    return {
+        "added": sorted(added, key=order.get),
+        "removed": sorted(removed, key=order.get),
+        "missing": missing,
+    }
+
+def get_favorite_ids(user_id: int, movie_ids: List[int]) -> List[int]:
+    """Which of ``movie_ids`` are favorites of the user, in the order given"""
+    if not movie_ids:
+        return []
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT m.* FROM movies m JOIN favorites f ON m.id = f.movie_id WHERE f.user_id = ?",
+            "SELECT movie_id FROM favorites WHERE user_id = ? AND movie_id IN (SELECT value FROM json_each(?))",
+            (user_id, json.dumps(list(movie_ids)))
+        )
+        found = {row[0] for row in cursor.fetchall()}
+    return [movie_id for movie_id in dict.fromkeys(movie_ids) if movie_id in found]
+
+def get_user_favorites(user_id: int, fields=None) -> List[Dict]:
+    """User's favorite movies; ``fields`` projects them like in list_movies (movie columns only)"""
+    select = "m.*"
+    if fields is not None:
+        allowed = {name: sql for name, sql in MOVIE_FIELDS.items() if sql.startswith("m.")}
+        select = _select_list(parse_fields(fields, allowed), allowed)
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT {select} FROM movies m JOIN favorites f ON m.id = f.movie_id WHERE f.user_id = ?",
             (user_id,)
         )
         movies = cursor.fetchall()
         return dicts_from_rows(movies)
-    finally:
-        conn.close()
 
 def is_favorite(movie_id: int, user_id: int) -> bool:
-    conn = get_db()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT 1 FROM favorites WHERE movie_id = ? AND user_id = ?", (movie_id, user_id))
         result = cursor.fetchone()
         return result is not None
-    finally:
-        conn.close()
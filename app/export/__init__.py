@@ -0,0 +1 @@
+# Export module
\ No newline at end of file
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Dict, Literal, Optional
+from app import dump
+from app.auth import get_current_admin
+
+router = APIRouter(prefix="/api/export", tags=["export"])
+
+
+@router.get("/{table}")
+async def export_table(
+    table: Literal["movies", "reviews", "ratings", "favorites", "users"],
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    since: Optional[str] = Query(None, description="only rows with updated_at at or after this ISO datetime"),
+    gzip: bool = Query(False, description="gzip the stream"),
+    admin: Dict = Depends(get_current_admin),
+):
+    """Stream a whole table (users without passwords) as NDJSON or CSV"""
+    try:
+        chunks = dump.export(table, format, since=since, compress=gzip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = f"{table}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if gzip else dump.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -1 +1,27 @@
-# Favorites DAO
\ No newline at end of file
+# Favorites DAO
+from typing import Dict, List, Optional
+
+from app import db
+from app.dao import BaseDAO
+
+
+class FavoriteDAO(BaseDAO):
+    async def add(self, movie_id: int, user_id: int) -> Optional[Dict]:
+        """{"status": "added"}, {"error": ...} if already there, or None if the movie doesn't exist"""
+        return await self._run(db.add_favorite, movie_id, user_id)
+
+    async def remove(self, movie_id: int, user_id: int) -> Dict:
+        return await self._run(db.remove_favorite, movie_id, user_id)
+
+    async def list_for_user(self, user_id: int, fields=None) -> List[Dict]:
+        return await self._run(db.get_user_favorites, user_id, fields=fields)
+
+    async def exists(self, movie_id: int, user_id: int) -> bool:
+        return await self._run(db.is_favorite, movie_id, user_id)
+
+    async def update_many(self, user_id: int, add: List[int], remove: List[int]) -> Dict:
+        """{"added", "removed", "missing"} movie ids; one transaction"""
+        return await self._run(db.update_favorites, user_id, add=add, remove=remove)
+
+    async def filter_favorites(self, user_id: int, movie_ids: List[int]) -> List[int]:
+        return await self._run(db.get_favorite_ids, user_id, movie_ids)
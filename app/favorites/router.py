@@ -1,32 +1,43 @@
-from fastapi import APIRouter, HTTPException, Request
-from app import db
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from app.auth import get_current_user_id
+from app.favorites.dao import FavoriteDAO
 
 router = APIRouter(prefix="/api/favorites", tags=["favorites"])
 
 
+class FavoritesBatch(BaseModel):
+    add: List[int] = Field(default_factory=list, max_length=1000)
+    remove: List[int] = Field(default_factory=list, max_length=1000)
+
+
+class FavoritesCheck(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+
+@router.post("/batch")
+async def update_favorites(data: FavoritesBatch, user_id: int = Depends(get_current_user_id), favorites: FavoriteDAO = Depends()):
+    """Add and remove several favorites at once; unknown movies go to "missing" """
+    try:
+        return await favorites.update_many(user_id, data.add, data.remove)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/check")
+async def check_favorites(data: FavoritesCheck, user_id: int = Depends(get_current_user_id), favorites: FavoriteDAO = Depends()):
+    """Which of the given movies are in user's favorites"""
+    return {"favorites": await favorites.filter_favorites(user_id, data.ids)}
+
+
 @router.post("/{movie_id}")
-def add_to_favorites(movie_id: int, request: Request):
+async def add_to_favorites(movie_id: int, user_id: int = Depends(get_current_user_id), favorites: FavoriteDAO = Depends()):
     """Add a movie to favorites"""
-    # Get user from JWT token
-    try:
-        import jwt
-        token = request.cookies.get("access_token")
-        if not token:
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        payload = jwt.decode(token, "your-secret-key", algorithms=["HS256"])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Authentication failed")
-    
-    # Check if movie exists
-    movie = db.get_movie_by_id(movie_id)
-    if not movie:
+    result = await favorites.add(movie_id, user_id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Movie not found")
     
-    result = db.add_favorite(movie_id, user_id)
-    
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
     
@@ -34,60 +45,27 @@ def add_to_favorites(movie_id: int, request: Request):
 
 
 @router.delete("/{movie_id}")
-def remove_from_favorites(movie_id: int, request: Request):
+async def remove_from_favorites(movie_id: int, user_id: int = Depends(get_current_user_id), favorites: FavoriteDAO = Depends()):
     """Remove a movie from favorites"""
-    # Get user from JWT token
-    try:
-        import jwt
-        token = request.cookies.get("access_token")
-        if not token:
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        payload = jwt.decode(token, "your-secret-key", algorithms=["HS256"])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Authentication failed")
-    
-    result = db.remove_favorite(movie_id, user_id)
+    result = await favorites.remove(movie_id, user_id)
     return result
 
 
 @router.get("/")
-def get_user_favorites(request: Request):
+async def get_user_favorites(
+    fields: Optional[str] = Query(None, description="comma-separated fields to return, e.g. id,title,year"),
+    user_id: int = Depends(get_current_user_id),
+    favorites: FavoriteDAO = Depends(),
+):
     """Get user's favorite movies"""
-    # Get user from JWT token
     try:
-        import jwt
-        token = request.cookies.get("access_token")
-        if not token:
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        payload = jwt.decode(token, "your-secret-key", algorithms=["HS256"])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Authentication failed")
-    
-    favorites = db.get_user_favorites(user_id)
-    return favorites
+        return await favorites.list_for_user(user_id, fields=fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/check/{movie_id}")
-def is_favorite(movie_id: int, request: Request):
+async def is_favorite(movie_id: int, user_id: int = Depends(get_current_user_id), favorites: FavoriteDAO = Depends()):
     """Check if a movie is in user's favorites"""
-    # Get user from JWT token
-    try:
-        import jwt
-        token = request.cookies.get("access_token")
-        if not token:
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        payload = jwt.decode(token, "your-secret-key", algorithms=["HS256"])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Authentication failed")
-    
-    is_fav = db.is_favorite(movie_id, user_id)
+    is_fav = await favorites.exists(movie_id, user_id)
     return {"is_favorite": is_fav}
@@ -0,0 +1,91 @@
+"""Conditional GET and a cache of serialized responses for catalog endpoints.
+
+A response depends on a few tables; its ETag is derived from their
+version counters (db.table_versions), which the write helpers bump. So
+the ETag of an unchanged resource can be checked without touching the
+database, and a matching If-None-Match gets 304. Serialized bodies are
+kept in a bounded LRU keyed by URL + versions, so a write makes the old
+entries unreachable and they age out. Bodies are rendered by
+app/responses.py, as JSON or (if the client asks for it) MessagePack.
+
+Writes made outside app/db.py must call db.notify_change (the admin
+panel does, see app/admin.py). The counters live in the process: with
+several worker processes, a write in one of them isn't seen by the others.
+"""
+import hashlib
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+from fastapi import Request, Response
+
+from app import db, responses
+from app.cache import TTLCache
+from app.config import HTTP_CACHE_MAX_AGE, HTTP_CACHE_SIZE
+
+# Changes when the process restarts, so ETags from before don't match
+_EPOCH = f"{time.time():.6f}"
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int = HTTP_CACHE_SIZE, max_age: int = HTTP_CACHE_MAX_AGE):
+        self.max_age = max_age
+        self._bodies = TTLCache(maxsize)
+        self.not_modified = 0
+
+    async def respond(self, request: Request, tables: Sequence[str], build: Callable[[], Awaitable[Any]],
+                      per_user: bool = False, user_id: Optional[int] = None) -> Response:
+        """Cached JSON (or MessagePack) response for ``request``.
+
+        ``build`` produces the content on a miss; HTTPExceptions it raises
+        pass through uncached. If the content depends on the user, pass
+        ``per_user=True`` and the user's id (None when anonymous): it becomes
+        part of the cache key and the response varies on the cookie.
+        """
+        versions = db.table_versions(*tables)
+        url = f"{request.url.path}?{request.url.query}"
+        media_type = responses.negotiate(request)
+        etag = '"%s"' % hashlib.sha1(f"{_EPOCH}|{url}|{user_id}|{versions}|{media_type}".encode()).hexdigest()[:20]
+        last_modified = db.tables_changed_at(*tables)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(last_modified, usegmt=True),
+            "Cache-Control": f"{'private' if user_id is not None else 'public'}, max-age={self.max_age}, must-revalidate",
+        }
+        vary = (["Accept"] if responses.msgpack is not None else []) + (["Cookie"] if per_user else [])
+        if vary:
+            headers["Vary"] = ", ".join(vary)
+
+        if self._not_modified(request, etag, last_modified):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        key = (url, user_id, versions, media_type)
+        body = self._bodies.get(key)
+        if body is None:
+            body = responses.render(await build(), media_type)
+            # Only store if nothing changed while building
+            if db.table_versions(*tables) == versions:
+                self._bodies.set(key, body)
+        return Response(body, media_type=media_type, headers=headers)
+
+    @staticmethod
+    def _not_modified(request: Request, etag: str, last_modified: float) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(last_modified) <= since
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._bodies.stats(), "not_modified": self.not_modified}
+
+
+response_cache = ResponseCache()
@@ -5,7 +5,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from fastapi import FastAPI, status
-from fastapi.responses import RedirectResponse, FileResponse
+from fastapi.responses import RedirectResponse, FileResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
@@ -13,8 +13,13 @@ from app.users.router import router as router_users
 from app.movies.router import router as router_movies
 from app.reviews.router import router as router_reviews
 from app.favorites.router import router as router_favorites
-from app import db
+from app.export.router import router as router_export
+from app import db, metrics, rankings, recommend, responses, stats
+from app.auth import auth_cache_stats
+from app.http_cache import response_cache
+from app.passwords import HasherBusy, hasher
 from app.admin import setup_admin
+from contextlib import asynccontextmanager
 import os
 
 # Initialize database if not exists
@@ -27,10 +32,30 @@ if not Path(__file__).parent.parent.joinpath('kinovzor.db').exists():
     seed_movies_and_reviews()
     print("\n✅ All ready!\n")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bring databases created by older versions up to the current indexes
+    from init_db import upgrade_db
+    with db.connection() as conn:
+        upgrade_db(conn)
+    hasher.start()
+    stats.snapshot.start()
+    recommend.refresher.start()
+    rankings.refresher.start()
+    yield
+    rankings.refresher.stop()
+    recommend.refresher.stop()
+    stats.snapshot.stop()
+    hasher.shutdown()
+    # Close pooled sqlite3 connections on shutdown
+    db.close_pool()
+
 app = FastAPI(
     title="KinoVzor API",
     description="Movie review and rating platform",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=responses.FastJSONResponse
 )
 
 # Add session middleware for admin authentication
@@ -50,11 +75,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request metrics for /metrics; added last, so it wraps the other middleware
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Password hashing queue is full
+@app.exception_handler(HasherBusy)
+async def hasher_busy_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Server is busy, try again later"},
+        headers={"Retry-After": "1"}
+    )
+
 # Include routers FIRST (before static files)
 app.include_router(router_users)
 app.include_router(router_movies)
 app.include_router(router_reviews)
 app.include_router(router_favorites)
+app.include_router(router_export)
 
 # Setup SQLAdmin
 setup_admin(app)
@@ -73,6 +111,22 @@ else:
 async def root():
     return RedirectResponse(url="/static/index.html", status_code=status.HTTP_303_SEE_OTHER)
 
+# Connection pool and cache counters
+@app.get('/api/health', tags=["service"])
+async def health():
+    return {
+        "status": "ok",
+        "pool": db.pool_stats(),
+        "auth_cache": auth_cache_stats(),
+        "password_hashing": hasher.stats(),
+        "response_cache": response_cache.stats(),
+    }
+
+# Prometheus scrape endpoint
+@app.get('/metrics', include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     
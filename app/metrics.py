@@ -0,0 +1,170 @@
+"""Request metrics in Prometheus text format.
+
+MetricsMiddleware records, per route template and method: a latency
+histogram, status counts, response sizes, and how many SQL statements a
+request ran and how long they took. GET /metrics renders them.
+
+SQL counts and time come from app/sqltrace.py, which attributes every
+statement to the request in progress. With SERVER_TIMING enabled, responses
+carry a Server-Timing header splitting the request into db, serialize
+(response rendering, see serializing()) and app (everything else) time.
+"""
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+from app import sqltrace
+from app.config import SERVER_TIMING
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+@contextmanager
+def serializing() -> Iterator[None]:
+    """Add the time spent in the block to the request's serialize time"""
+    stats = sqltrace.current_stats()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialize_time += time.perf_counter() - started
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    def escape(value: str) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        self._values[labels] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labels, key)} {value:g}" for key, value in sorted(self._values.items())]
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        self._values[labels] -= amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        if not self._values:
+            lines.append(f"{self.name} 0")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        # per label set: counts per bucket (last one is +Inf), sum
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[labels] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip([f"{b:g}" for b in self.buckets] + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {self._sums[key]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+ROUTE_LABELS = ("method", "route")
+
+requests_total = Counter("kinovzor_http_requests_total", "HTTP requests by route and status",
+                         ("method", "route", "status"))
+request_duration = Histogram("kinovzor_http_request_duration_seconds", "Time to produce the response",
+                             ROUTE_LABELS, LATENCY_BUCKETS)
+response_size = Histogram("kinovzor_http_response_size_bytes", "Response body size", ROUTE_LABELS, SIZE_BUCKETS)
+requests_in_flight = Gauge("kinovzor_http_requests_in_flight", "Requests being handled")
+db_queries = Histogram("kinovzor_http_db_queries", "SQL statements run per request", ROUTE_LABELS,
+                       QUERY_COUNT_BUCKETS)
+db_duration = Histogram("kinovzor_http_db_duration_seconds", "Time spent in SQLite per request", ROUTE_LABELS,
+                        LATENCY_BUCKETS)
+
+METRICS = [requests_total, request_duration, response_size, requests_in_flight, db_queries, db_duration]
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware feeding the metrics above (and Server-Timing, if enabled)"""
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = sqltrace.RequestStats(scope["path"])
+        started = time.perf_counter()
+        status, size = 500, 0
+
+        async def send_with_metrics(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", stats.server_timing(time.perf_counter() - started)
+                    )
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        requests_in_flight.inc()
+        try:
+            with sqltrace.collect(stats):
+                await self.app(scope, receive, send_with_metrics)
+        finally:
+            elapsed = time.perf_counter() - started
+            requests_in_flight.dec()
+            sqltrace.request_finished(stats)
+            # Route template, so /api/movies/1 and /api/movies/2 share a series
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", None) or "other")
+            requests_total.inc(labels + (str(status),))
+            request_duration.observe(labels, elapsed)
+            response_size.observe(labels, size)
+            db_queries.observe(labels, stats.queries)
+            db_duration.observe(labels, stats.db_time)
@@ -1,13 +1,71 @@
-from app.movies.models import Movie, Review, Rating, Favorite
+from typing import Dict, List, Optional
 
-class MovieDAO:
-    pass
+from app import db, rankings, recommend, search, stats
+from app.dao import BaseDAO
+from app.reviews.dao import ReviewDAO
+from app.favorites.dao import FavoriteDAO
 
-class ReviewDAO:
-    pass
 
-class RatingDAO:
-    pass
+class MovieDAO(BaseDAO):
+    async def list(self, **filters) -> Dict:
+        return await self._run(db.list_movies, **filters)
 
-class FavoriteDAO:
-    pass
+    async def get(self, movie_id: int) -> Optional[Dict]:
+        return await self._run(db.get_movie_by_id, movie_id)
+
+    async def get_many(self, movie_ids: List[int]) -> List[Dict]:
+        return await self._run(db.get_movies_by_ids, movie_ids)
+
+    async def get_full(self, movie_ids: List[int], user_id: int = None, approved_only: bool = True,
+                       reviews_limit: int = 20) -> List[Dict]:
+        return await self._run(
+            db.get_movies_full, movie_ids, user_id=user_id, approved_only=approved_only, reviews_limit=reviews_limit
+        )
+
+    async def create(self, **data) -> Dict:
+        return await self._run(db.create_movie, **data)
+
+    async def update(self, movie_id: int, **data) -> Optional[Dict]:
+        """Updated movie, or None if it doesn't exist"""
+        return await self._run(db.update_movie, movie_id, **data)
+
+    async def delete(self, movie_id: int) -> bool:
+        """False if the movie doesn't exist"""
+        return await self._run(db.delete_movie, movie_id)
+
+    async def rating_stats(self, movie_id: int) -> Optional[Dict]:
+        """Rating stats, or None if the movie doesn't exist"""
+        return await self._run(db.get_rating_stats, movie_id)
+
+    async def search(self, q: str, **params) -> Dict:
+        return await self._run(search.search_movies, q, **params)
+
+    async def stats(self) -> Dict:
+        return await self._run(stats.snapshot.get)
+
+    async def top(self, limit: int = 20, cursor: str = None) -> Dict:
+        return await self._run(rankings.top_movies, limit, cursor)
+
+    async def trending(self, limit: int = 20, cursor: str = None) -> Dict:
+        return await self._run(rankings.trending_movies, limit, cursor)
+
+    async def similar(self, movie_id: int, limit: int = 10) -> Optional[List[Dict]]:
+        """Nearest neighbors, or None if the movie doesn't exist"""
+        return await self._run(recommend.similar_movies, movie_id, limit)
+
+    async def recommended_for(self, user_id: int, limit: int = 20) -> Dict:
+        return await self._run(recommend.recommendations_for, user_id, limit)
+
+
+class RatingDAO(BaseDAO):
+    async def upsert(self, movie_id: int, user_id: int, value: float) -> Dict:
+        return await self._run(db.create_or_update_rating, movie_id, user_id, value)
+
+    async def get(self, rating_id: int) -> Optional[Dict]:
+        return await self._run(db.get_rating_by_id, rating_id)
+
+    async def list_for_movie(self, movie_id: int) -> List[Dict]:
+        return await self._run(db.get_movie_ratings, movie_id)
+
+
+__all__ = ["MovieDAO", "ReviewDAO", "RatingDAO", "FavoriteDAO"]
@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
-from typing import Optional
-from app import db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from app.auth import get_optional_user_id
+from app.http_cache import response_cache
+from app.movies.dao import MovieDAO
 
 router = APIRouter(prefix="/api/movies", tags=["movies"])
 
+# Tables the cached GET responses are read from
+MOVIE_TABLES = ("movies", "movie_rating_summary")
+MOVIE_FULL_TABLES = MOVIE_TABLES + ("reviews", "users", "favorites")
+SEARCH_TABLES = MOVIE_TABLES + ("reviews", "search_index")
+SIMILAR_TABLES = MOVIE_TABLES + ("movie_neighbors",)
+TOP_TABLES = MOVIE_TABLES + ("movie_rankings",)
+TRENDING_TABLES = TOP_TABLES + ("reviews", "favorites")
+
 
 class MovieCreate(BaseModel):
     title: str
@@ -22,58 +32,185 @@ class MovieUpdate(BaseModel):
     poster_url: Optional[str] = None
 
 
+class MovieBatch(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=20)
+    approved_only: bool = True
+    reviews_limit: int = Field(20, ge=1, le=100)
+
+
 # ========== MOVIES CRUD ==========
 
 @router.get("/")
-def get_movies(genre: Optional[str] = Query(None), sort: str = Query("popular")):
-    """Get all movies with optional filtering and sorting"""
-    movies = db.get_all_movies()
-    
-    if genre and genre != "all":
-        movies = [m for m in movies if m['genre'] == genre]
-    
-    if sort == "title":
-        movies = sorted(movies, key=lambda x: x['title'])
-    elif sort == "year":
-        movies = sorted(movies, key=lambda x: x['year'], reverse=True)
-    # Default is popular (by id desc, already done)
+async def get_movies(
+    request: Request,
+    genre: Optional[str] = Query(None),
+    year_from: Optional[int] = Query(None),
+    year_to: Optional[int] = Query(None),
+    sort: Literal["popular", "title", "year", "rating"] = Query("popular"),
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    with_total: bool = Query(False),
+    with_favorites: bool = Query(False, description="add is_favorite for the authenticated user"),
+    fields: Optional[str] = Query(None, description="comma-separated fields to return, e.g. id,title,year"),
+    user_id: Optional[int] = Depends(get_optional_user_id),
+    movies: MovieDAO = Depends(),
+):
+    """Get a page of movies with optional filtering and sorting"""
+    favorites_of = user_id if with_favorites else None
+
+    async def build():
+        try:
+            return await movies.list(
+                genre=genre if genre and genre != "all" else None,
+                year_from=year_from,
+                year_to=year_to,
+                sort=sort,
+                limit=limit,
+                offset=offset,
+                cursor=cursor,
+                with_total=with_total,
+                favorites_of=favorites_of,
+                fields=fields
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
-    return movies
+    if not with_favorites:
+        return await response_cache.respond(request, MOVIE_TABLES, build)
+    return await response_cache.respond(request, MOVIE_TABLES + ("favorites",), build,
+                                        per_user=True, user_id=favorites_of)
 
 
 @router.get("/stats")
-def get_stats():
+async def get_stats(movies: MovieDAO = Depends()):
     """Get overall site statistics"""
-    movies = db.get_all_movies()
-    movies_count = len(movies)
-    
-    # Count all reviews
-    reviews_count = 0
-    for movie in movies:
-        reviews = db.get_movie_reviews(movie['id'], approved_only=False)
-        reviews_count += len(reviews)
-    
-    return {
-        "movies_count": movies_count,
-        "reviews_count": reviews_count
-    }
+    return await movies.stats()
+
+
+@router.get("/top")
+async def get_top_movies(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    movies: MovieDAO = Depends(),
+):
+    """Best rated movies by Bayesian average of their review ratings"""
+    async def build():
+        try:
+            return await movies.top(limit=limit, cursor=cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return await response_cache.respond(request, TOP_TABLES, build)
+
+
+@router.get("/trending")
+async def get_trending_movies(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    movies: MovieDAO = Depends(),
+):
+    """Movies with the most recent review and favorite activity"""
+    async def build():
+        try:
+            return await movies.trending(limit=limit, cursor=cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return await response_cache.respond(request, TRENDING_TABLES, build)
+
+
+@router.get("/search")
+async def search_movies(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    with_total: bool = Query(False),
+    movies: MovieDAO = Depends(),
+):
+    """Full-text search over titles, descriptions and approved reviews"""
+    return await response_cache.respond(
+        request,
+        SEARCH_TABLES,
+        lambda: movies.search(q, limit=limit, offset=offset, with_total=with_total)
+    )
 
 
 @router.get("/{movie_id}")
-def get_movie(movie_id: int):
+async def get_movie(movie_id: int, request: Request, movies: MovieDAO = Depends()):
     """Get a single movie by ID"""
-    movie = db.get_movie_by_id(movie_id)
+    async def build():
+        movie = await movies.get(movie_id)
+        if not movie:
+            raise HTTPException(status_code=404, detail="Movie not found")
+        return movie
     
-    if not movie:
-        raise HTTPException(status_code=404, detail="Movie not found")
+    return await response_cache.respond(request, MOVIE_TABLES, build)
+
+
+@router.get("/{movie_id}/similar")
+async def get_similar_movies(
+    movie_id: int,
+    request: Request,
+    limit: int = Query(10, ge=1, le=50),
+    movies: MovieDAO = Depends(),
+):
+    """Movies liked by the same people (item-to-item neighbors), most similar first"""
+    async def build():
+        similar = await movies.similar(movie_id, limit)
+        if similar is None:
+            raise HTTPException(status_code=404, detail="Movie not found")
+        return similar
     
-    return movie
+    return await response_cache.respond(request, SIMILAR_TABLES, build)
+
+
+@router.get("/{movie_id}/full")
+async def get_movie_full(
+    movie_id: int,
+    request: Request,
+    approved_only: bool = Query(True),
+    reviews_limit: int = Query(20, ge=1, le=100),
+    user_id: Optional[int] = Depends(get_optional_user_id),
+    movies: MovieDAO = Depends(),
+):
+    """Movie with the first page of its reviews, rating stats and favorite flag in one request.
+
+    reviews_next_cursor continues the reviews in GET /api/reviews/movie/{movie_id}.
+    """
+    async def build():
+        full = await movies.get_full(
+            [movie_id], user_id=user_id, approved_only=approved_only, reviews_limit=reviews_limit
+        )
+        if not full:
+            raise HTTPException(status_code=404, detail="Movie not found")
+        return full[0]
+    
+    return await response_cache.respond(request, MOVIE_FULL_TABLES, build, per_user=True, user_id=user_id)
+
+
+@router.post("/batch")
+async def get_movies_batch(
+    data: MovieBatch,
+    user_id: Optional[int] = Depends(get_optional_user_id),
+    movies: MovieDAO = Depends(),
+):
+    """Same as /{movie_id}/full for up to 20 movies; unknown ids go to "missing" """
+    ids = list(dict.fromkeys(data.ids))
+    items = await movies.get_full(
+        ids, user_id=user_id, approved_only=data.approved_only, reviews_limit=data.reviews_limit
+    )
+    found = {item["movie"]["id"] for item in items}
+    return {"items": items, "missing": [movie_id for movie_id in ids if movie_id not in found]}
 
 
 @router.post("/")
-def create_movie(data: MovieCreate):
+async def create_movie(data: MovieCreate, movies: MovieDAO = Depends()):
     """Create a new movie (admin only)"""
-    movie = db.create_movie(
+    movie = await movies.create(
         title=data.title,
         description=data.description,
         genre=data.genre,
@@ -84,42 +221,38 @@ def create_movie(data: MovieCreate):
 
 
 @router.put("/{movie_id}")
-def update_movie(movie_id: int, data: MovieUpdate):
+async def update_movie(movie_id: int, data: MovieUpdate, movies: MovieDAO = Depends()):
     """Update a movie (admin only)"""
-    movie = db.get_movie_by_id(movie_id)
-    if not movie:
-        raise HTTPException(status_code=404, detail="Movie not found")
-    
-    db.update_movie(
-        movie_id=movie_id,
+    movie = await movies.update(
+        movie_id,
         title=data.title,
         description=data.description,
         genre=data.genre,
         year=data.year,
         poster_url=data.poster_url
     )
-    return db.get_movie_by_id(movie_id)
+    if not movie:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return movie
 
 
 @router.delete("/{movie_id}")
-def delete_movie(movie_id: int):
+async def delete_movie(movie_id: int, movies: MovieDAO = Depends()):
     """Delete a movie (admin only)"""
-    movie = db.get_movie_by_id(movie_id)
-    if not movie:
+    if not await movies.delete(movie_id):
         raise HTTPException(status_code=404, detail="Movie not found")
-    
-    db.delete_movie(movie_id)
     return {"status": "deleted"}
 
 
 # ========== RATING STATS ==========
 
 @router.get("/{movie_id}/rating-stats")
-def get_movie_rating_stats(movie_id: int):
+async def get_movie_rating_stats(movie_id: int, request: Request, movies: MovieDAO = Depends()):
     """Get rating statistics for a specific movie"""
-    movie = db.get_movie_by_id(movie_id)
-    if not movie:
-        raise HTTPException(status_code=404, detail="Movie not found")
+    async def build():
+        stats = await movies.rating_stats(movie_id)
+        if stats is None:
+            raise HTTPException(status_code=404, detail="Movie not found")
+        return stats
     
-    stats = db.get_rating_stats(movie_id)
-    return stats
+    return await response_cache.respond(request, MOVIE_TABLES, build)
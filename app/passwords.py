@@ -0,0 +1,150 @@
+"""Password hashing in a dedicated process pool.
+
+bcrypt costs ~250 ms of CPU per call; run inline it occupies a request
+thread (and the GIL) for that long. PasswordHasher runs it in worker
+processes and admits at most PASSWORD_HASH_MAX_PENDING calls at a time;
+beyond that it raises HasherBusy, which the app turns into 429.
+
+Besides bcrypt, verify() accepts the legacy formats found in older
+databases - unsalted SHA-256 hex digests (seed_db.hash_password) and
+plaintext - and reports that they need rehashing, as it does for bcrypt
+hashes below BCRYPT_ROUNDS (bulk imports, hash_imported_passwords).
+"""
+import asyncio
+import hashlib
+import hmac
+import re
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.config import BCRYPT_ROUNDS, IMPORT_BCRYPT_ROUNDS, PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_WORKERS
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS
+)
+import_context = pwd_context.copy(bcrypt__rounds=IMPORT_BCRYPT_ROUNDS, bcrypt__min_rounds=IMPORT_BCRYPT_ROUNDS)
+
+_SHA256_HEX = re.compile(r"[0-9a-f]{64}")
+
+
+class HasherBusy(Exception):
+    """Too many hashing calls queued; the client should retry later"""
+
+
+def hash_password(password: str) -> str:
+    """bcrypt hash of ``password`` (runs in a worker process)"""
+    return pwd_context.hash(password)
+
+
+def _hash_imported_password(password: str) -> str:
+    return import_context.hash(password)
+
+
+def import_hash_pool(workers: int = PASSWORD_HASH_WORKERS) -> Optional[ProcessPoolExecutor]:
+    """Worker processes for hash_imported_passwords, None if ``workers`` < 2.
+
+    Create one per import and shut it down afterwards; processes start on
+    first use.
+    """
+    return ProcessPoolExecutor(max_workers=workers) if workers >= 2 else None
+
+
+def hash_imported_passwords(passwords: List[str], executor: Optional[Executor] = None) -> List[str]:
+    """Cheap bcrypt hashes of plaintext ``passwords``, flagged for rehashing on login.
+
+    Large batches are spread over ``executor`` (see import_hash_pool).
+    """
+    if executor is None or len(passwords) < 100:
+        return [_hash_imported_password(password) for password in passwords]
+    return list(executor.map(_hash_imported_password, passwords, chunksize=64))
+
+
+def verify_password(password: str, hashed: str) -> Tuple[bool, bool]:
+    """(matches, needs_rehash) for ``password`` against a stored hash"""
+    if pwd_context.identify(hashed) is not None:
+        try:
+            return pwd_context.verify_and_update(password, hashed)[0], pwd_context.needs_update(hashed)
+        except ValueError:
+            return False, False
+    if _SHA256_HEX.fullmatch(hashed):
+        digest = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(digest, hashed), True
+    # Stored as plaintext
+    return hmac.compare_digest(password.encode(), hashed.encode()), True
+
+
+class PasswordHasher:
+    """Bounded front end to a ProcessPoolExecutor running the functions above.
+
+    With ``workers=0`` calls run in the default thread pool instead (for
+    platforms where worker processes are unavailable).
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.max_pending_seen = 0
+        self.total_time = 0.0
+
+    def start(self) -> None:
+        """Start the worker processes (otherwise done on first use)"""
+        with self._lock:
+            if self._executor is None and self.workers > 0:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(hash_password, password)
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, bool]:
+        return await self._submit(verify_password, password, hashed)
+
+    async def _submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusy()
+            self._pending += 1
+            self.submitted += 1
+            self.max_pending_seen = max(self.max_pending_seen, self._pending)
+        self.start()
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+                self.total_time += time.perf_counter() - started
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "queued": max(0, self._pending - max(self.workers, 1)),
+                "max_pending_seen": self.max_pending_seen,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "average_ms": round(self.total_time * 1000 / self.completed, 1) if self.completed else None,
+            }
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,164 @@
+"""Thread-safe pool of reusable sqlite3 connections"""
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Tuple
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out in time"""
+
+
+class ConnectionPool:
+    """Bounded pool of sqlite3 connections.
+
+    Connections are created lazily by ``factory`` (which applies the PRAGMAs
+    once per connection) and reused afterwards. A connection that sat idle for
+    longer than ``health_check_interval`` seconds is pinged before being handed
+    out and replaced if the ping fails.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], sqlite3.Connection],
+        size: int = 8,
+        timeout: float = 30.0,
+        health_check_interval: float = 30.0,
+    ):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self._factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle: Deque[Tuple[sqlite3.Connection, float]] = deque()
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._open = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._stats = {
+            "created": 0,
+            "checkouts": 0,
+            "checkins": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "timeouts": 0,
+            "health_checks": 0,
+            "discarded": 0,
+        }
+
+    def checkout(self) -> sqlite3.Connection:
+        """Take a connection from the pool, creating one if there is room"""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        started = time.monotonic()
+
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    conn, last_used = None, None
+                    self._open += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No free database connection after {self.timeout}s")
+                waited = True
+                self._available.wait(remaining)
+
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_time"] += time.monotonic() - started
+
+        try:
+            if conn is None:
+                conn = self._create()
+            elif time.monotonic() - last_used > self.health_check_interval and not self._ping(conn):
+                self._discard(conn)
+                conn = self._create()
+        except BaseException:
+            with self._available:
+                self._open -= 1
+                self._in_use -= 1
+                self._available.notify()
+            raise
+        return conn
+
+    def checkin(self, conn: sqlite3.Connection) -> None:
+        """Return a connection to the pool, rolling back any open transaction"""
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            healthy = False
+
+        with self._available:
+            self._in_use -= 1
+            self._stats["checkins"] += 1
+            if healthy and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._open -= 1
+            self._available.notify()
+
+        if not healthy or self._closed:
+            self._discard(conn)
+
+    def close(self) -> None:
+        """Close all idle connections; checked-out ones are closed on checkin"""
+        with self._available:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._available.notify_all()
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self) -> Dict:
+        """Snapshot of pool counters"""
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                **self._stats,
+                "wait_time": round(self._stats["wait_time"], 6),
+            }
+
+    def _create(self) -> sqlite3.Connection:
+        conn = self._factory()
+        with self._lock:
+            self._stats["created"] += 1
+        return conn
+
+    def _ping(self, conn: sqlite3.Connection) -> bool:
+        with self._lock:
+            self._stats["health_checks"] += 1
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            self._stats["discarded"] += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
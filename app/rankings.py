@@ -0,0 +1,279 @@
+"""Top-rated and trending leaderboards, kept ranked in movie_rankings.
+
+Top rated orders movies by the Bayesian average of their review ratings:
+every movie starts with TOP_PRIOR_WEIGHT ratings at the site-wide
+average, so one 5-star review doesn't outrank hundreds averaging 4.8:
+
+    top_score = (rating_sum + TOP_PRIOR_WEIGHT * prior_mean) / (rating_count + TOP_PRIOR_WEIGHT)
+
+TRIGGERS on movie_rating_summary keep top_score and the site-wide totals
+in ranking_state current with every rating change. The prior follows the
+site-wide average: once they differ by more than PRIOR_TOLERANCE,
+refresh() moves the prior and recomputes all scores from
+movie_rating_summary, in batches of RERANK_BATCH movies. It runs in the
+background (RANKINGS_REFRESH_SECONDS), so no user write waits for it.
+
+Trending sums approved reviews and new favorites, each decaying with a
+half-life of TRENDING_HALF_LIFE_HOURS. Instead of decaying every score
+over time, an event at time t adds 2 ** ((t - epoch) / half_life): later
+events weigh more, which keeps the order of the stored sums equal to the
+order of the decayed ones. record_activity() adds the events from
+app/db.py, in the same transaction as the write (for reviews, the
+approval).
+
+Both lists are read through partial indexes on movie_rankings, with
+keyset cursors, so a page costs the same however many movies there are.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+from app import db
+from app.config import RANKINGS_REFRESH_SECONDS, TOP_PRIOR_WEIGHT, TRENDING_HALF_LIFE_HOURS
+
+logger = logging.getLogger(__name__)
+
+# How far (in stars) the site-wide average may drift from the prior before all
+# top scores are recomputed
+PRIOR_TOLERANCE = 0.01
+# Movies rescored per write transaction once the prior moves
+RERANK_BATCH = 1000
+HALF_LIFE = TRENDING_HALF_LIFE_HOURS * 3600
+# Stored trending sums are rescaled once the epoch is this many half-lives old,
+# long before the weights could overflow
+RESCALE_AFTER = 64
+
+_PRIOR = "(SELECT prior_mean FROM ranking_state WHERE id = 1)"
+
+
+def _top_score(row: str) -> str:
+    return (
+        f"CASE WHEN {row}.rating_count > 0 THEN "
+        f"({row}.rating_sum + {TOP_PRIOR_WEIGHT!r} * {_PRIOR}) / ({row}.rating_count + {TOP_PRIOR_WEIGHT!r}) END"
+    )
+
+
+def _totals_sql(old: bool, new: bool) -> str:
+    """Move the site-wide totals from the ``old`` to the ``new`` summary row in one UPDATE"""
+    count, total = "rating_count", "rating_sum"
+    if old:
+        count, total = f"{count} - old.rating_count", f"{total} - old.rating_sum"
+    if new:
+        count, total = f"{count} + new.rating_count", f"{total} + new.rating_sum"
+    return f"UPDATE ranking_state SET rating_count = {count}, rating_sum = {total} WHERE id = 1;"
+
+
+_UPSERT_TOP = (
+    "INSERT INTO movie_rankings (movie_id, top_score) VALUES (new.movie_id, {score}) "
+    "ON CONFLICT(movie_id) DO UPDATE SET top_score = excluded.top_score;"
+).format(score=_top_score("new"))
+
+_RERANK_TOP = (
+    f"UPDATE movie_rankings SET top_score = {_top_score('s')} "
+    "FROM movie_rating_summary s WHERE s.movie_id = movie_rankings.movie_id"
+)
+
+TRIGGERS = [
+    # The totals go first, then this movie is scored against the current prior
+    "CREATE TRIGGER IF NOT EXISTS rankings_summary_insert AFTER INSERT ON movie_rating_summary BEGIN "
+    f"{_totals_sql(False, True)} {_UPSERT_TOP} END",
+    "CREATE TRIGGER IF NOT EXISTS rankings_summary_update AFTER UPDATE OF rating_count, rating_sum "
+    "ON movie_rating_summary BEGIN "
+    f"{_totals_sql(True, True)} {_UPSERT_TOP} END",
+    "CREATE TRIGGER IF NOT EXISTS rankings_summary_delete AFTER DELETE ON movie_rating_summary BEGIN "
+    f"{_totals_sql(True, False)} UPDATE movie_rankings SET top_score = NULL WHERE movie_id = old.movie_id; END",
+    "CREATE TRIGGER IF NOT EXISTS rankings_movies_delete AFTER DELETE ON movies BEGIN "
+    "DELETE FROM movie_rankings WHERE movie_id = old.id; END",
+]
+
+
+def _trending_weight(at: float, epoch: float) -> float:
+    return 2.0 ** ((at - epoch) / HALF_LIFE)
+
+
+def record_activity(cursor, movie_ids: List[int]) -> None:
+    """Count one trending event per entry of ``movie_ids``, on the caller's transaction"""
+    if not movie_ids:
+        return
+    now = time.time()
+    cursor.execute("SELECT trending_epoch FROM ranking_state WHERE id = 1")
+    row = cursor.fetchone()
+    if row is None:
+        # Rankings were never built; rebuild() will count this event
+        return
+    epoch = row[0]
+    if now - epoch > RESCALE_AFTER * HALF_LIFE:
+        cursor.execute("UPDATE movie_rankings SET trending_score = trending_score / ? WHERE trending_score > 0",
+                       (_trending_weight(now, epoch),))
+        cursor.execute("UPDATE ranking_state SET trending_epoch = ? WHERE id = 1", (now,))
+        epoch = now
+    weight = _trending_weight(now, epoch)
+    cursor.executemany(
+        "INSERT INTO movie_rankings (movie_id, trending_score) VALUES (?, ?) "
+        "ON CONFLICT(movie_id) DO UPDATE SET trending_score = trending_score + excluded.trending_score",
+        [(movie_id, weight * events) for movie_id, events in Counter(movie_ids).items()]
+    )
+
+
+def fill(cursor) -> int:
+    """Recompute both leaderboards on ``cursor``, without committing; returns the number of ranked movies.
+
+    Trending counts the approved reviews and favorites that still exist,
+    by the hour they were created.
+    """
+    now = time.time()
+    cursor.execute("INSERT OR IGNORE INTO ranking_state (id) VALUES (1)")
+    cursor.execute(
+        "UPDATE ranking_state SET rating_count = totals.rating_count, rating_sum = totals.rating_sum, "
+        "prior_mean = COALESCE(totals.rating_sum * 1.0 / NULLIF(totals.rating_count, 0), 0), trending_epoch = ? "
+        "FROM (SELECT COALESCE(SUM(rating_count), 0) AS rating_count, COALESCE(SUM(rating_sum), 0) AS rating_sum "
+        "FROM movie_rating_summary) totals WHERE id = 1",
+        (now,)
+    )
+    cursor.execute("DELETE FROM movie_rankings")
+    cursor.execute(
+        "INSERT INTO movie_rankings (movie_id, top_score) "
+        f"SELECT s.movie_id, {_top_score('s')} FROM movie_rating_summary s "
+        "WHERE s.rating_count > 0 AND s.movie_id IN (SELECT id FROM movies)"
+    )
+    cursor.execute("""
+        SELECT movie_id, CAST(strftime('%s', created_at) AS INTEGER) / 3600 AS hour, COUNT(*)
+        FROM (SELECT movie_id, created_at FROM reviews WHERE approved = 1 UNION ALL SELECT movie_id, created_at FROM favorites)
+        WHERE created_at IS NOT NULL AND movie_id IN (SELECT id FROM movies)
+        GROUP BY movie_id, hour
+    """)
+    trending: Dict[int, float] = Counter()
+    for movie_id, hour, events in cursor.fetchall():
+        if hour is not None:
+            # events of an hour count as if they happened half-way through it
+            trending[movie_id] += events * _trending_weight(hour * 3600 + 1800, now)
+    cursor.executemany(
+        "INSERT INTO movie_rankings (movie_id, trending_score) VALUES (?, ?) "
+        "ON CONFLICT(movie_id) DO UPDATE SET trending_score = excluded.trending_score",
+        list(trending.items())
+    )
+    cursor.execute("SELECT COUNT(*) FROM movie_rankings")
+    return cursor.fetchone()[0]
+
+
+def refresh(conn=None) -> int:
+    """Move the prior to the site-wide average if it drifted past PRIOR_TOLERANCE; returns the rescored movies"""
+    with (nullcontext(conn) if conn is not None else db.connection()) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE ranking_state SET prior_mean = rating_sum * 1.0 / rating_count "
+            f"WHERE id = 1 AND rating_count > 0 AND abs(rating_sum * 1.0 / rating_count - prior_mean) > {PRIOR_TOLERANCE}"
+        )
+        moved = cursor.rowcount
+        conn.commit()
+        if not moved:
+            return 0
+        # Ratings changed from here on are already scored against the new prior
+        cursor.execute("SELECT movie_id FROM movie_rankings WHERE top_score IS NOT NULL ORDER BY movie_id")
+        movie_ids = [row[0] for row in cursor.fetchall()]
+        for start in range(0, len(movie_ids), RERANK_BATCH):
+            batch = movie_ids[start:start + RERANK_BATCH]
+            cursor.execute(f"{_RERANK_TOP} AND movie_rankings.movie_id BETWEEN ? AND ?", (batch[0], batch[-1]))
+            conn.commit()
+    db.notify_change("movie_rankings")
+    return len(movie_ids)
+
+
+def rebuild(conn=None) -> int:
+    """fill() and commit; uses ``conn`` when given (e.g. during upgrade_db)"""
+    with (nullcontext(conn) if conn is not None else db.connection()) as conn:
+        ranked = fill(conn.cursor())
+        conn.commit()
+    db.notify_change("movie_rankings")
+    return ranked
+
+
+class Refresher:
+    """Runs refresh() every ``interval`` seconds in a daemon thread (0 = never)"""
+
+    def __init__(self, interval: float = RANKINGS_REFRESH_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rankings-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                refresh()
+            except Exception:
+                logger.exception("Rankings refresh failed")
+
+
+refresher = Refresher()
+
+
+_MOVIE_COLUMNS = (
+    "m.*, COALESCE(s.rating_count, 0) AS rating_count, "
+    "ROUND(s.rating_sum * 1.0 / NULLIF(s.rating_count, 0), 1) AS rating_average"
+)
+
+
+def _page(board: str, column: str, condition: str, limit: int, cursor: str = None) -> Dict[str, Any]:
+    """Page of movie_rankings by ``column`` (descending), with the raw score as "score" """
+    where, params = [f"r.{column} {condition}"], []
+    if cursor:
+        key = db.decode_cursor(cursor, board)
+        if len(key) != 2:
+            raise ValueError("Invalid cursor")
+        where.append(f"(r.{column}, r.movie_id) < (?, ?)")
+        params.extend(key)
+    with db.connection() as conn:
+        cursor_ = conn.cursor()
+        cursor_.execute(
+            f"""
+            SELECT {_MOVIE_COLUMNS}, r.{column} AS score
+            FROM movie_rankings r
+            JOIN movies m ON m.id = r.movie_id
+            LEFT JOIN movie_rating_summary s ON s.movie_id = m.id
+            WHERE {' AND '.join(where)}
+            ORDER BY r.{column} DESC, r.movie_id DESC
+            LIMIT ?
+            """,
+            params + [limit + 1]
+        )
+        rows = db.dicts_from_rows(cursor_.fetchall())
+        cursor_.execute("SELECT trending_epoch FROM ranking_state WHERE id = 1")
+        state = cursor_.fetchone()
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = db.encode_cursor(board, [items[-1]["score"], items[-1]["id"]])
+    return {"items": items, "next_cursor": next_cursor, "epoch": state[0] if state else None}
+
+
+def top_movies(limit: int = 20, cursor: str = None) -> Dict[str, Any]:
+    """Movies with review ratings by Bayesian average ("bayesian_rating"), best first"""
+    page = _page("top", "top_score", "IS NOT NULL", limit, cursor)
+    for item in page["items"]:
+        item["bayesian_rating"] = round(item.pop("score"), 2)
+    return {"items": page["items"], "next_cursor": page["next_cursor"]}
+
+
+def trending_movies(limit: int = 20, cursor: str = None) -> Dict[str, Any]:
+    """Movies by recent review and favorite activity; "trending_score" is the decayed event count"""
+    page = _page("trending", "trending_score", "> 0", limit, cursor)
+    now = time.time()
+    for item in page["items"]:
+        item["trending_score"] = float(f"{item.pop('score') / _trending_weight(now, page['epoch']):.4g}")
+    return {"items": page["items"], "next_cursor": page["next_cursor"]}
@@ -0,0 +1,412 @@
+"""Item-to-item recommendations from ratings, review ratings and favorites.
+
+Every (user, movie) interaction becomes a preference weight in
+user_preferences: ratings and review ratings of 1-5 map to 0, 0, 1/3,
+2/3, 1 and a favorite counts as 1; the strongest signal wins. Movies are
+vectors of these weights over users, and the similarity of two movies is
+their cosine, shrunk towards 0 when few users share them:
+
+    score = dot(i, j) / (|i| * |j|) * support / (support + SHRINKAGE)
+
+The top RECOMMEND_NEIGHBORS neighbors of each movie are kept in
+movie_neighbors, so GET /api/movies/{id}/similar and a user's
+recommendations are indexed lookups.
+
+TRIGGERS record every (user, movie) pair whose ratings, reviews or
+favorites change in preference_changes. refresh() recomputes those
+preferences and the neighbor lists of the movies involved, and enters
+each movie into the lists of its new neighbors; entries it leaves behind
+elsewhere are corrected by the neighbors' own refresh or by rebuild().
+Both read the similarities outside of any transaction (WAL readers don't
+block writers) and write the results in short transactions of a few
+movies or users each, so the app's writers never wait for a whole
+refresh. Refresher runs refresh() every RECOMMEND_REFRESH_SECONDS.
+"""
+import json
+import logging
+import math
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional
+
+from app import db
+from app.config import RECOMMEND_NEIGHBORS, RECOMMEND_REFRESH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SHRINKAGE = 10.0  # support at which a similarity counts half
+MIN_SUPPORT = 2   # users two movies must share to be neighbors
+# Users who liked more movies than this are left out of the similarities:
+# each contributes a pair for every two of their movies, so the few heaviest
+# users would cost most of the computation for little signal
+MAX_USER_PREFERENCES = 100
+# refresh() rebuilds everything when this share of the movies changed
+REBUILD_SHARE = 0.25
+# Movies and users written per transaction. Everything is computed before
+# the transaction, so a writer waits for one batch at most, not a refresh
+WRITE_BATCH = 10
+USER_WRITE_BATCH = 20
+
+
+def _signals_sql(where: str = "") -> str:
+    """(user_id, movie_id, weight) of every interaction, optionally filtered"""
+    condition = f" AND {where}" if where else ""
+    return f"""
+        SELECT user_id, movie_id, MIN(MAX((value - 2) / 3.0, 0), 1) AS weight
+        FROM ratings WHERE 1{condition}
+        UNION ALL
+        SELECT user_id, movie_id, MIN(MAX((rating - 2) / 3.0, 0), 1)
+        FROM reviews WHERE rating IS NOT NULL AND user_id IS NOT NULL{condition}
+        UNION ALL
+        SELECT user_id, movie_id, 1.0 FROM favorites WHERE 1{condition}
+    """
+
+
+def _preferences_sql(where: str = "") -> str:
+    """(user_id, movie_id, weight) preferences, the strongest signal of each pair"""
+    return f"SELECT user_id, movie_id, MAX(weight) FROM ({_signals_sql(where)}) GROUP BY user_id, movie_id"
+
+
+# Conditions on (user_id, movie_id) matching a JSON list of ids or of [user_id, movie_id] pairs
+_IN_USERS = "user_id IN (SELECT value FROM json_each(?))"
+_IN_MOVIES = "movie_id IN (SELECT value FROM json_each(?))"
+_IN_PAIRS = "(user_id, movie_id) IN (SELECT value ->> 0, value ->> 1 FROM json_each(?))"
+
+# The best neighbors of one movie (parameters: movie id, how many), by cosine similarity
+_NEIGHBORS_SQL = f"""
+    SELECT b.movie_id,
+           SUM(a.weight * b.weight) / (na.norm * nb.norm) * COUNT(*) / (COUNT(*) + {SHRINKAGE}) AS score,
+           COUNT(*)
+    FROM user_preferences a
+    JOIN preference_users u ON u.user_id = a.user_id AND u.liked <= {MAX_USER_PREFERENCES}
+    JOIN user_preferences b ON b.user_id = a.user_id AND b.movie_id != a.movie_id AND b.weight > 0
+    JOIN movie_pref_norms na ON na.movie_id = a.movie_id
+    JOIN movie_pref_norms nb ON nb.movie_id = b.movie_id
+    WHERE a.movie_id = ? AND a.weight > 0
+    GROUP BY b.movie_id
+    HAVING COUNT(*) >= {MIN_SUPPORT}
+    ORDER BY score DESC, b.movie_id
+    LIMIT ?
+"""
+
+
+def _mark_sql(row: str) -> str:
+    return f"INSERT OR IGNORE INTO preference_changes (user_id, movie_id) VALUES ({row}.user_id, {row}.movie_id);"
+
+
+def _triggers(table: str, columns: str, when: str = None) -> List[str]:
+    """Triggers recording the pairs touched by writes to ``table``"""
+    new_when = f" WHEN new.{when}" if when else ""
+    old_when = f" WHEN old.{when}" if when else ""
+    statements = [
+        f"CREATE TRIGGER IF NOT EXISTS recommend_{table}_insert AFTER INSERT ON {table}{new_when} BEGIN "
+        f"{_mark_sql('new')} END",
+        f"CREATE TRIGGER IF NOT EXISTS recommend_{table}_delete AFTER DELETE ON {table}{old_when} BEGIN "
+        f"{_mark_sql('old')} END",
+    ]
+    if columns:
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS recommend_{table}_update AFTER UPDATE OF {columns} ON {table} BEGIN "
+            f"{_mark_sql('old')} {_mark_sql('new')} END"
+        )
+    return statements
+
+
+TRIGGERS = (
+    _triggers("ratings", "value, user_id, movie_id")
+    + _triggers("reviews", "rating, user_id, movie_id", "rating IS NOT NULL")
+    + _triggers("favorites", "")
+)
+
+
+def _batches(items: List, size: int = WRITE_BATCH) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+@contextmanager
+def _writing(conn) -> Iterator:
+    """A short write transaction on ``conn``; everything it needs is computed before"""
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        yield cursor
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+@contextmanager
+def _claimed_changes(conn) -> Iterator[List]:
+    """Take the (user_id, movie_id) pairs out of preference_changes for the block.
+
+    Writes during the block record their pairs again, for the next
+    refresh. If the block fails, the claimed pairs are put back.
+    """
+    with _writing(conn) as cursor:
+        cursor.execute("DELETE FROM preference_changes RETURNING user_id, movie_id")
+        pairs = [tuple(row) for row in cursor.fetchall()]
+    try:
+        yield pairs
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        with _writing(conn) as cursor:
+            cursor.executemany("INSERT OR IGNORE INTO preference_changes (user_id, movie_id) VALUES (?, ?)", pairs)
+        raise
+
+
+def _update_users(cursor, user_ids: List[int]) -> None:
+    """Recompute preference_users for ``user_ids``, on the caller's transaction"""
+    params = (json.dumps(user_ids),)
+    cursor.execute(f"DELETE FROM preference_users WHERE {_IN_USERS}", params)
+    cursor.execute(
+        "INSERT INTO preference_users (user_id, liked) "
+        f"SELECT user_id, COUNT(*) FROM user_preferences WHERE weight > 0 AND {_IN_USERS} GROUP BY user_id",
+        params
+    )
+
+
+def _update_preferences(conn, user_ids: List[int], pairs: List = None) -> None:
+    """Recompute user_preferences and preference_users of ``user_ids``, USER_WRITE_BATCH users per transaction.
+
+    With ``pairs`` only those (user_id, movie_id) pairs are recomputed.
+    """
+    cursor = conn.cursor()
+    by_user: Dict[int, List] = {}
+    for user_id, movie_id in pairs or ():
+        by_user.setdefault(user_id, []).append([user_id, movie_id])
+    for batch in _batches(user_ids, USER_WRITE_BATCH):
+        if pairs is None:
+            where, params = _IN_USERS, (json.dumps(batch),)
+        else:
+            where, params = _IN_PAIRS, (json.dumps([pair for user_id in batch for pair in by_user[user_id]]),)
+        cursor.execute(_preferences_sql(where), params * 3)
+        preferences = cursor.fetchall()
+        with _writing(conn) as write:
+            write.execute(f"DELETE FROM user_preferences WHERE {where}", params)
+            write.executemany("INSERT INTO user_preferences (user_id, movie_id, weight) VALUES (?, ?, ?)", preferences)
+            _update_users(write, batch)
+
+
+def _update_norms(conn, movie_ids: List[int]) -> None:
+    """Recompute movie_pref_norms for ``movie_ids``, WRITE_BATCH movies per transaction"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT movie_id, SUM(weight * weight) FROM user_preferences "
+        f"WHERE weight > 0 AND user_id IN (SELECT user_id FROM preference_users WHERE liked <= {MAX_USER_PREFERENCES})"
+        f" AND {_IN_MOVIES} GROUP BY movie_id",
+        (json.dumps(movie_ids),)
+    )
+    norms = {movie_id: math.sqrt(sum_sq) for movie_id, sum_sq in cursor.fetchall()}
+    for batch in _batches(movie_ids):
+        with _writing(conn) as write:
+            write.execute(f"DELETE FROM movie_pref_norms WHERE {_IN_MOVIES}", (json.dumps(batch),))
+            write.executemany(
+                "INSERT INTO movie_pref_norms (movie_id, norm) VALUES (?, ?)",
+                [(movie_id, norms[movie_id]) for movie_id in batch if movie_id in norms]
+            )
+
+
+def _update_neighbors(conn, movie_ids: List[int], offer: bool) -> None:
+    """Recompute the neighbor lists of ``movie_ids``, WRITE_BATCH movies per transaction.
+
+    With ``offer`` each movie also enters the lists of its new neighbors,
+    which keep their top RECOMMEND_NEIGHBORS.
+    """
+    cursor = conn.cursor()
+    for batch in _batches(movie_ids):
+        neighbors = {}
+        for movie_id in batch:
+            cursor.execute(_NEIGHBORS_SQL, (movie_id, RECOMMEND_NEIGHBORS))
+            neighbors[movie_id] = cursor.fetchall()
+        with _writing(conn) as write:
+            write.execute(f"DELETE FROM movie_neighbors WHERE {_IN_MOVIES}", (json.dumps(batch),))
+            write.executemany(
+                "INSERT INTO movie_neighbors (movie_id, neighbor_id, score, support) VALUES (?, ?, ?, ?)",
+                [(movie_id, *row) for movie_id, rows in neighbors.items() for row in rows]
+            )
+            if not offer:
+                continue
+            # Similarity is symmetric: offer each movie to its neighbors' lists, keeping their top K
+            offered = [(neighbor_id, movie_id, score, support)
+                       for movie_id, rows in neighbors.items() for neighbor_id, score, support in rows]
+            write.executemany(
+                "INSERT INTO movie_neighbors (movie_id, neighbor_id, score, support) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(movie_id, neighbor_id) DO UPDATE SET score = excluded.score, support = excluded.support",
+                offered
+            )
+            write.executemany(
+                "DELETE FROM movie_neighbors WHERE movie_id = ? AND neighbor_id NOT IN ("
+                "SELECT neighbor_id FROM movie_neighbors WHERE movie_id = ? ORDER BY score DESC, neighbor_id LIMIT ?)",
+                [(neighbor_id, neighbor_id, RECOMMEND_NEIGHBORS) for neighbor_id in {row[0] for row in offered}]
+            )
+
+
+def _rebuild(conn) -> None:
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT user_id FROM ratings UNION SELECT user_id FROM reviews WHERE user_id IS NOT NULL "
+        "UNION SELECT user_id FROM favorites UNION SELECT user_id FROM user_preferences"
+    )
+    _update_preferences(conn, [row[0] for row in cursor.fetchall()])
+    cursor.execute(
+        "SELECT id FROM movies UNION SELECT movie_id FROM user_preferences "
+        "UNION SELECT movie_id FROM movie_pref_norms UNION SELECT movie_id FROM movie_neighbors"
+    )
+    movie_ids = [row[0] for row in cursor.fetchall()]
+    _update_norms(conn, movie_ids)
+    _update_neighbors(conn, movie_ids, offer=False)
+
+
+def rebuild(conn=None) -> int:
+    """Recompute all preferences and neighbor lists; returns the number of movies with neighbors"""
+    with (nullcontext(conn) if conn is not None else db.connection()) as conn:
+        with _claimed_changes(conn):
+            _rebuild(conn)
+        with_neighbors = conn.execute("SELECT COUNT(DISTINCT movie_id) FROM movie_neighbors").fetchone()[0]
+    db.notify_change("user_preferences")
+    db.notify_change("movie_neighbors")
+    return with_neighbors
+
+
+def refresh(conn=None) -> Dict[str, int]:
+    """Apply the changes recorded in preference_changes; {"pairs", "movies"} processed"""
+    with (nullcontext(conn) if conn is not None else db.connection()) as conn:
+        cursor = conn.cursor()
+        with _claimed_changes(conn) as pairs:
+            if not pairs:
+                return {"pairs": 0, "movies": 0}
+            movie_ids = sorted({movie_id for _, movie_id in pairs})
+            user_ids = sorted({user_id for user_id, _ in pairs})
+            cursor.execute("SELECT COUNT(*) FROM movies")
+            if len(movie_ids) > cursor.fetchone()[0] * REBUILD_SHARE:
+                _rebuild(conn)
+            else:
+                counted = (
+                    f"SELECT user_id FROM preference_users WHERE liked <= {MAX_USER_PREFERENCES} AND {_IN_USERS}"
+                )
+                cursor.execute(counted, (json.dumps(user_ids),))
+                counted_before = {row[0] for row in cursor.fetchall()}
+                _update_preferences(conn, user_ids, pairs)
+                cursor.execute(counted, (json.dumps(user_ids),))
+                # A user crossing MAX_USER_PREFERENCES changes the vectors of all their movies
+                crossed = counted_before ^ {row[0] for row in cursor.fetchall()}
+                if crossed:
+                    cursor.execute(
+                        f"SELECT DISTINCT movie_id FROM user_preferences WHERE weight > 0 AND {_IN_USERS}",
+                        (json.dumps(sorted(crossed)),)
+                    )
+                    movie_ids = sorted(set(movie_ids).union(row[0] for row in cursor.fetchall()))
+                _update_norms(conn, movie_ids)
+                _update_neighbors(conn, movie_ids, offer=True)
+    db.notify_change("user_preferences")
+    db.notify_change("movie_neighbors")
+    return {"pairs": len(pairs), "movies": len(movie_ids)}
+
+
+_MOVIE_COLUMNS = (
+    "m.*, COALESCE(s.rating_count, 0) AS rating_count, "
+    "ROUND(s.rating_sum * 1.0 / NULLIF(s.rating_count, 0), 1) AS rating_average"
+)
+
+
+def similar_movies(movie_id: int, limit: int = 10) -> Optional[List[Dict]]:
+    """Nearest neighbors of a movie with their "score"; None if the movie doesn't exist"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT {_MOVIE_COLUMNS}, n.score, n.support
+            FROM movie_neighbors n
+            JOIN movies m ON m.id = n.neighbor_id
+            LEFT JOIN movie_rating_summary s ON s.movie_id = m.id
+            WHERE n.movie_id = ?
+            ORDER BY n.score DESC, n.neighbor_id
+            LIMIT ?
+            """,
+            (movie_id, limit)
+        )
+        items = db.dicts_from_rows(cursor.fetchall())
+        if not items and db.get_movie_by_id(movie_id) is None:
+            return None
+        return items
+
+
+def recommendations_for(user_id: int, limit: int = 20) -> Dict:
+    """Movies similar to what the user liked and hasn't rated, reviewed or favorited yet.
+
+    Each neighbor's score is summed over the user's movies, weighted by the
+    user's preference. Users without preferences (or whose movies have no
+    neighbors) get the most-rated movies instead, with "source": "popular".
+    """
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT {_MOVIE_COLUMNS}, r.score
+            FROM (
+                SELECT n.neighbor_id AS movie_id, SUM(p.weight * n.score) AS score
+                FROM user_preferences p
+                JOIN movie_neighbors n ON n.movie_id = p.movie_id
+                WHERE p.user_id = ? AND p.weight > 0
+                  AND n.neighbor_id NOT IN (SELECT movie_id FROM user_preferences WHERE user_id = ?)
+                GROUP BY n.neighbor_id
+                ORDER BY score DESC, n.neighbor_id
+                LIMIT ?
+            ) r
+            JOIN movies m ON m.id = r.movie_id
+            LEFT JOIN movie_rating_summary s ON s.movie_id = m.id
+            ORDER BY r.score DESC, m.id
+            """,
+            (user_id, user_id, limit)
+        )
+        items = db.dicts_from_rows(cursor.fetchall())
+        if items:
+            return {"items": items, "source": "neighbors"}
+
+        cursor.execute(
+            f"""
+            SELECT {_MOVIE_COLUMNS}, NULL AS score
+            FROM movie_rating_summary s
+            JOIN movies m ON m.id = s.movie_id
+            WHERE m.id NOT IN (SELECT movie_id FROM user_preferences WHERE user_id = ?)
+            ORDER BY s.rating_count DESC, m.id
+            LIMIT ?
+            """,
+            (user_id, limit)
+        )
+        return {"items": db.dicts_from_rows(cursor.fetchall()), "source": "popular"}
+
+
+class Refresher:
+    """Runs refresh() every ``interval`` seconds in a daemon thread (0 = never)"""
+
+    def __init__(self, interval: float = RECOMMEND_REFRESH_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="recommend-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                refresh()
+            except Exception:
+                logger.exception("Recommendations refresh failed")
+
+
+refresher = Refresher()
@@ -0,0 +1,67 @@
+"""Response rendering: JSON through orjson, MessagePack on request.
+
+FastJSONResponse is the app's default response class. orjson writes the
+dicts and lists coming out of app/db.py straight to UTF-8 bytes, in C;
+anything it doesn't know (pydantic models, sets, ...) falls back to
+FastAPI's jsonable_encoder. response_cache renders its bodies with
+render() directly, so the cached list endpoints skip jsonable_encoder
+altogether.
+
+MessagePack is optional: with the msgpack package installed, clients
+sending ``Accept: application/msgpack`` get the cached endpoints as
+MessagePack (see negotiate()). Rendering time counts as the request's
+serialize time (Server-Timing, app/metrics.py).
+"""
+from typing import Any
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from app.metrics import serializing
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+# Older clients ask for the unregistered name
+_MSGPACK_ACCEPT = (MSGPACK, "application/x-msgpack")
+
+
+def to_json(content: Any) -> bytes:
+    # Like json.dumps, non-string keys (e.g. the star counts in rating-stats) become strings
+    return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
+
+
+def to_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=jsonable_encoder)
+
+
+def negotiate(request: Request) -> str:
+    """MSGPACK if the client accepts it and msgpack is installed, otherwise JSON"""
+    if msgpack is None:
+        return JSON
+    accept = request.headers.get("accept", "")
+    return MSGPACK if any(media_type in accept for media_type in _MSGPACK_ACCEPT) else JSON
+
+
+def render(content: Any, media_type: str = JSON) -> bytes:
+    """``content`` as ``media_type`` (JSON or MSGPACK)"""
+    with serializing():
+        return to_msgpack(content) if media_type == MSGPACK else to_json(content)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return render(content)
+
+
+class MsgpackResponse(Response):
+    media_type = MSGPACK
+
+    def render(self, content: Any) -> bytes:
+        return render(content, MSGPACK)
@@ -1 +1,41 @@
-# Reviews DAO
\ No newline at end of file
+# Reviews DAO
+from typing import Dict, List, Optional
+
+from app import db
+from app.dao import BaseDAO
+
+
+class ReviewDAO(BaseDAO):
+    async def get(self, review_id: int) -> Optional[Dict]:
+        return await self._run(db.get_review_by_id, review_id)
+
+    async def list_for_movie(self, movie_id: int, approved_only: bool = True, sort: str = "newest", limit: int = 20,
+                             cursor: str = None, text_preview: int = None, fields=None) -> Dict:
+        return await self._run(db.list_reviews, movie_id=movie_id, approved_only=approved_only, sort=sort,
+                               limit=limit, cursor=cursor, text_preview=text_preview, fields=fields)
+
+    async def list_for_user(self, user_id: int, sort: str = "newest", limit: int = 20, cursor: str = None,
+                            text_preview: int = None, fields=None) -> Dict:
+        """Approved reviews written by the user"""
+        return await self._run(db.list_reviews, user_id=user_id, sort=sort, limit=limit, cursor=cursor,
+                               text_preview=text_preview, fields=fields)
+
+    async def create(self, movie_id: int, user_id: int, text: str, rating: int = None) -> Optional[Dict]:
+        """New review, or None if the movie doesn't exist"""
+        return await self._run(db.create_review, movie_id=movie_id, user_id=user_id, text=text, rating=rating)
+
+    async def update(self, review_id: int, text: str = None, rating: int = None) -> Optional[Dict]:
+        return await self._run(db.update_review, review_id, text, rating)
+
+    async def pending(self, limit: int = 50, cursor: str = None, with_total: bool = False) -> Dict:
+        return await self._run(db.get_pending_reviews, limit=limit, cursor=cursor, with_total=with_total)
+
+    async def moderate(self, approve_ids: List[int], reject_ids: List[int]) -> Dict:
+        """Approve and reject pending reviews in one transaction"""
+        return await self._run(db.moderate_reviews, approve_ids, reject_ids)
+
+    async def approve(self, review_id: int) -> bool:
+        return await self._run(db.approve_review, review_id)
+
+    async def delete(self, review_id: int) -> bool:
+        return await self._run(db.delete_review, review_id)
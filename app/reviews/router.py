@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Query, Request
-from pydantic import BaseModel
-from typing import Optional
-from app import db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
+from app.auth import get_current_moderator, get_current_user_id
+from app.http_cache import response_cache
+from app.reviews.dao import ReviewDAO
 
 router = APIRouter(prefix="/api/reviews", tags=["reviews"])
 
@@ -17,69 +19,86 @@ class ReviewUpdate(BaseModel):
     rating: Optional[int] = None
 
 
+class ModerationRequest(BaseModel):
+    approve: List[int] = Field(default_factory=list, max_length=10000)
+    reject: List[int] = Field(default_factory=list, max_length=10000)
+
+
 @router.post("/")
-def create_review(data: ReviewCreate, request: Request):
+async def create_review(data: ReviewCreate, user_id: int = Depends(get_current_user_id), reviews: ReviewDAO = Depends()):
     """Create a review for a movie"""
-    # Get user from JWT token
-    try:
-        import jwt
-        token = request.cookies.get("access_token")
-        if not token:
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        payload = jwt.decode(token, "your-secret-key", algorithms=["HS256"])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Authentication failed")
-    
-    # Check if movie exists
-    movie = db.get_movie_by_id(data.movie_id)
-    if not movie:
-        raise HTTPException(status_code=404, detail="Movie not found")
-    
-    review = db.create_review(
+    review = await reviews.create(
         movie_id=data.movie_id,
         user_id=user_id,
         text=data.text,
         rating=data.rating
     )
+    if not review:
+        raise HTTPException(status_code=404, detail="Movie not found")
     return review
 
 
 @router.get("/movie/{movie_id}")
-def get_reviews(movie_id: int, approved_only: bool = Query(True)):
-    """Get reviews for a movie"""
-    reviews = db.get_movie_reviews(movie_id, approved_only=approved_only)
-    return reviews
+async def get_reviews(
+    movie_id: int,
+    request: Request,
+    approved_only: bool = Query(True),
+    sort: Literal["newest", "highest", "lowest"] = Query("newest"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    text_preview: Optional[int] = Query(None, ge=1, le=2000, description="cut the text to this many characters"),
+    fields: Optional[str] = Query(None, description="comma-separated fields to return, e.g. id,rating,text"),
+    reviews: ReviewDAO = Depends(),
+):
+    """Get a page of reviews for a movie"""
+    async def build():
+        try:
+            return await reviews.list_for_movie(movie_id, approved_only=approved_only, sort=sort, limit=limit,
+                                                cursor=cursor, text_preview=text_preview, fields=fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return await response_cache.respond(request, ("reviews", "users"), build)
+
+
+@router.get("/pending")
+async def get_pending_reviews(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    with_total: bool = Query(False),
+    moderator: Dict = Depends(get_current_moderator),
+    reviews: ReviewDAO = Depends(),
+):
+    """Reviews awaiting moderation, oldest first (moderator only)"""
+    try:
+        return await reviews.pending(limit=limit, cursor=cursor, with_total=with_total)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/moderate")
+async def moderate_reviews(data: ModerationRequest, moderator: Dict = Depends(get_current_moderator),
+                           reviews: ReviewDAO = Depends()):
+    """Approve and reject (delete) pending reviews in one batch (moderator only)"""
+    try:
+        return await reviews.moderate(data.approve, data.reject)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/{review_id}")
-def get_review(review_id: int):
+async def get_review(review_id: int, reviews: ReviewDAO = Depends()):
     """Get a specific review by ID"""
-    review = db.get_review_by_id(review_id)
+    review = await reviews.get(review_id)
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
     return review
 
 
 @router.put("/{review_id}")
-def update_review(review_id: int, data: ReviewUpdate, request: Request):
+async def update_review(review_id: int, data: ReviewUpdate, user_id: int = Depends(get_current_user_id), reviews: ReviewDAO = Depends()):
     """Update a review (only by author)"""
-    # Get user from JWT token
-    try:
-        import jwt
-        token = request.cookies.get("access_token")
-        if not token:
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        payload = jwt.decode(token, "your-secret-key", algorithms=["HS256"])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Authentication failed")
-    
-    review = db.get_review_by_id(review_id)
+    review = await reviews.get(review_id)
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
     
@@ -88,27 +107,13 @@ def update_review(review_id: int, data: ReviewUpdate, request: Request):
         raise HTTPException(status_code=403, detail="Not authorized to update this review")
     
     # Update review
-    db.update_review(review_id, data.text, data.rating)
-    return db.get_review_by_id(review_id)
+    return await reviews.update(review_id, data.text, data.rating)
 
 
 @router.delete("/{review_id}")
-def delete_review(review_id: int, request: Request):
+async def delete_review(review_id: int, user_id: int = Depends(get_current_user_id), reviews: ReviewDAO = Depends()):
     """Delete a review (author or admin)"""
-    # Get user from JWT token
-    try:
-        import jwt
-        token = request.cookies.get("access_token")
-        if not token:
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        payload = jwt.decode(token, "your-secret-key", algorithms=["HS256"])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Authentication failed")
-    
-    review = db.get_review_by_id(review_id)
+    review = await reviews.get(review_id)
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
     
@@ -116,16 +121,14 @@ def delete_review(review_id: int, request: Request):
     if review['user_id'] != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this review")
     
-    db.delete_review(review_id)
+    await reviews.delete(review_id)
     return {"status": "deleted"}
 
 
 @router.put("/{review_id}/approve")
-def approve_review(review_id: int):
+async def approve_review(review_id: int, moderator: Dict = Depends(get_current_moderator),
+                         reviews: ReviewDAO = Depends()):
     """Approve a review (moderator only)"""
-    review = db.get_review_by_id(review_id)
-    if not review:
+    if not await reviews.approve(review_id):
         raise HTTPException(status_code=404, detail="Review not found")
-    
-    db.approve_review(review_id)
     return {"status": "approved"}
@@ -0,0 +1,285 @@
+"""Full-text search over movies and their approved reviews (SQLite FTS5).
+
+search_index holds one row per movie (rowid = movies.id) with the title
+and the description; review_search_index one row per approved review
+(rowid = reviews.id), so writing a review reindexes only that review. A
+movie matches when each word occurs in its title, its description or any
+of its reviews; its rank adds the best review's bm25 to the movie's.
+Reviews are only scored among the newest REVIEW_HITS_PER_TERM matches of
+each word, so a movie found by its reviews alone needs one of those.
+
+The unicode61 tokenizer case-folds Cyrillic and strips diacritics from
+Latin letters, but keeps "ё" distinct from "е", so indexed text and
+queries are folded with ``fold()`` first. The tables are created by
+init_db.upgrade_db together with TRIGGERS, which keep them in sync with
+every write, including the admin panel.
+"""
+import html
+import re
+import sqlite3
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+
+from app import db
+
+# bm25 weights of title and description, and of the best matching review
+WEIGHTS = (10.0, 3.0, 1.0)
+# Matching reviews scored per search term, newest first: bm25() reads every
+# row it scores, so common words would otherwise score most of the reviews
+REVIEW_HITS_PER_TERM = 1000
+
+_FOLD = str.maketrans("ёЁ", "еЕ")
+
+
+def fold(text: str) -> str:
+    """Text as stored in the search tables (one char per char, so offsets match)"""
+    return text.translate(_FOLD)
+
+
+def _fold_sql(expr: str) -> str:
+    return f"replace(replace(COALESCE({expr}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_movies_insert AFTER INSERT ON movies BEGIN
+        INSERT INTO search_index (rowid, title, description)
+        VALUES (new.id, {_fold_sql('new.title')}, {_fold_sql('new.description')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_movies_update AFTER UPDATE OF title, description ON movies BEGIN
+        UPDATE search_index SET title = {_fold_sql('new.title')}, description = {_fold_sql('new.description')}
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_movies_delete AFTER DELETE ON movies BEGIN
+        DELETE FROM search_index WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_reviews_insert AFTER INSERT ON reviews WHEN new.approved = 1 BEGIN
+        INSERT INTO review_search_index (rowid, text) VALUES (new.id, {_fold_sql('new.text')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_reviews_update AFTER UPDATE OF text, approved ON reviews
+    WHEN old.approved = 1 OR new.approved = 1 BEGIN
+        DELETE FROM review_search_index WHERE rowid = old.id;
+        INSERT INTO review_search_index (rowid, text) SELECT new.id, {_fold_sql('new.text')} WHERE new.approved = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_reviews_delete AFTER DELETE ON reviews WHEN old.approved = 1 BEGIN
+        DELETE FROM review_search_index WHERE rowid = old.id;
+    END
+    """,
+]
+
+TRIGGER_NAMES = [
+    "search_movies_insert",
+    "search_movies_update",
+    "search_movies_delete",
+    "search_reviews_insert",
+    "search_reviews_update",
+    "search_reviews_delete",
+]
+
+
+# Refill search_index from movies and review_search_index from approved reviews
+REBUILD = [
+    "DELETE FROM search_index",
+    "INSERT INTO search_index (rowid, title, description) "
+    f"SELECT id, {_fold_sql('title')}, {_fold_sql('description')} FROM movies",
+    "DELETE FROM review_search_index",
+    f"INSERT INTO review_search_index (rowid, text) SELECT id, {_fold_sql('text')} FROM reviews WHERE approved = 1",
+]
+
+
+def rebuild_search_index(conn: sqlite3.Connection = None) -> int:
+    """Reindex all movies and approved reviews; returns the number of movies"""
+    with (nullcontext(conn) if conn is not None else db.connection()) as conn:
+        cursor = conn.cursor()
+        for statement in REBUILD:
+            cursor.execute(statement)
+        indexed = conn.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
+        for table in ("search_index", "review_search_index"):
+            cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+        conn.commit()
+        db.notify_change("search_index")
+        return indexed
+
+
+def match_terms(q: str) -> Optional[List[str]]:
+    """FTS5 terms for user input: the words quoted, the last one as a prefix.
+
+    Quoting matches FTS5 operators in the input literally. None if ``q``
+    has no words.
+    """
+    words = re.findall(r"\w+", fold(q))
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return terms
+
+
+# Private-use characters mark matches in snippet()/highlight() output; they
+# are turned into <mark> after the text is escaped
+_OPEN, _CLOSE, _ELLIPSIS, _SEPARATOR = "\ue000", "\ue001", "\ue002", "\ue003"
+
+
+def _render(fragment: str, original: str) -> str:
+    """Escape a snippet and put back the "ё" that fold() replaced"""
+    plain = fragment.replace(_OPEN, "").replace(_CLOSE, "").replace(_ELLIPSIS, "")
+    start = fold(original).find(plain)
+    if start >= 0:
+        restored, i = [], start
+        for ch in fragment:
+            if ch in (_OPEN, _CLOSE, _ELLIPSIS):
+                restored.append(ch)
+            else:
+                restored.append(original[i])
+                i += 1
+        fragment = "".join(restored)
+    return (
+        html.escape(fragment)
+        .replace(_OPEN, "<mark>")
+        .replace(_CLOSE, "</mark>")
+        .replace(_ELLIPSIS, "…")
+    )
+
+
+def _matched_sql(terms: int) -> str:
+    """Movies having each of the terms in their own row or in any approved review"""
+    # Compound operators associate left to right, so each term's union is a subquery
+    return " INTERSECT ".join(
+        f"SELECT * FROM (SELECT rowid FROM search_index WHERE search_index MATCH :term{i} "
+        "UNION SELECT r.movie_id FROM review_search_index JOIN reviews r ON r.id = review_search_index.rowid "
+        f"WHERE review_search_index MATCH :term{i})"
+        for i in range(terms)
+    )
+
+
+def _ranked_sql(terms: int) -> str:
+    """Matching movies with their rank and best review.
+
+    Rows and reviews are scored against any of the terms, so a movie's
+    rank is its own bm25 plus its best review's, the terms split between
+    them as they may be. Reviews are scored one term at a time, on the
+    newest :per_term matches of each (FTS5 walks a term's rows by rowid
+    and stops at the LIMIT); bm25 adds up over the terms, so summing a
+    review's scores gives its bm25 against all of them. The hits are
+    materialized: bm25() can't be used inside the aggregates directly.
+    """
+    term_hits = ",\n    ".join(
+        f"""review_hits_{i} AS MATERIALIZED (
+        SELECT rowid AS review_id, bm25(review_search_index) * {WEIGHTS[2]} AS rank
+        FROM review_search_index WHERE review_search_index MATCH :term{i} ORDER BY rowid DESC LIMIT :per_term
+    )"""
+        for i in range(terms)
+    )
+    return f"""
+    WITH movie_hits AS MATERIALIZED (
+        SELECT rowid AS movie_id, bm25(search_index, {WEIGHTS[0]}, {WEIGHTS[1]}) AS rank
+        FROM search_index WHERE search_index MATCH :any
+    ),
+    {term_hits},
+    review_hits AS (
+        SELECT review_id, SUM(rank) AS rank FROM (
+            {" UNION ALL ".join(f"SELECT * FROM review_hits_{i}" for i in range(terms))}
+        )
+        GROUP BY review_id
+    ),
+    best_reviews AS (
+        -- review_id comes from the row holding the MIN
+        SELECT r.movie_id, MIN(h.rank) AS rank, h.review_id
+        FROM review_hits h JOIN reviews r ON r.id = h.review_id
+        GROUP BY r.movie_id
+    ),
+    ranked AS (
+        SELECT movie_id, SUM(rank) AS rank, MAX(review_id) AS review_id FROM (
+            SELECT movie_id, rank, NULL AS review_id FROM movie_hits
+            UNION ALL
+            SELECT movie_id, rank, review_id FROM best_reviews
+        )
+        {f"WHERE movie_id IN ({_matched_sql(terms)})" if terms > 1 else ""}
+        GROUP BY movie_id
+    )
+    """
+
+
+def search_movies(q: str, limit: int = 20, offset: int = 0, with_total: bool = False) -> Dict:
+    """Movies matching ``q`` ranked by bm25, with highlighted title and snippet.
+
+    Returns {"items": [...], "total": int or None}; each item is the movie
+    (as in list_movies) plus "rank", "title_highlight" and "snippet".
+    """
+    terms = match_terms(q)
+    if terms is None:
+        return {"items": [], "total": 0 if with_total else None}
+    params = {
+        "any": " OR ".join(terms), "per_term": REVIEW_HITS_PER_TERM,
+        **{f"term{i}": term for i, term in enumerate(terms)},
+    }
+
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        # Highlights only for the page. Review snippets come from one scan over
+        # the page's range of rowids: looking a review up by rowid would expand
+        # a prefix term over the whole index again for each row.
+        cursor.execute(
+            f"""
+            {_ranked_sql(len(terms))},
+            page AS MATERIALIZED (SELECT * FROM ranked ORDER BY rank LIMIT :limit OFFSET :offset),
+            review_snippets AS MATERIALIZED (
+                SELECT rowid AS review_id,
+                       snippet(review_search_index, 0, '{_OPEN}', '{_CLOSE}', '{_ELLIPSIS}', 16) AS snippet
+                FROM review_search_index
+                WHERE review_search_index MATCH :any
+                  AND rowid BETWEEN (SELECT MIN(review_id) FROM page) AND (SELECT MAX(review_id) FROM page)
+                  AND +rowid IN (SELECT review_id FROM page)
+            )
+            SELECT m.*, COALESCE(s.rating_count, 0) AS rating_count,
+                   ROUND(s.rating_sum * 1.0 / NULLIF(s.rating_count, 0), 1) AS rating_average,
+                   f.rank,
+                   (
+                       SELECT highlight(search_index, 0, '{_OPEN}', '{_CLOSE}') || '{_SEPARATOR}'
+                              || snippet(search_index, 1, '{_OPEN}', '{_CLOSE}', '{_ELLIPSIS}', 16)
+                       FROM search_index WHERE search_index MATCH :any AND rowid = f.movie_id
+                   ) AS movie_highlights,
+                   rs.snippet AS reviews_snippet,
+                   rv.text AS review_text
+            FROM page f
+            JOIN movies m ON m.id = f.movie_id
+            LEFT JOIN movie_rating_summary s ON s.movie_id = m.id
+            LEFT JOIN review_snippets rs ON rs.review_id = f.review_id
+            LEFT JOIN reviews rv ON rv.id = f.review_id
+            ORDER BY f.rank
+            """,
+            {**params, "limit": limit, "offset": offset}
+        )
+        items = []
+        for row in cursor.fetchall():
+            item = dict(row)
+            movie_highlights = item.pop("movie_highlights")
+            reviews_snippet = item.pop("reviews_snippet")
+            review_text = item.pop("review_text")
+            title_highlight, description_snippet = (
+                movie_highlights.split(_SEPARATOR, 1) if movie_highlights is not None else (fold(item["title"]), "")
+            )
+            item["title_highlight"] = _render(title_highlight, item["title"])
+            # Prefer the description; fall back to the best review when only it matches
+            if _OPEN not in description_snippet and reviews_snippet is not None:
+                item["snippet"] = _render(reviews_snippet, review_text)
+            else:
+                item["snippet"] = _render(description_snippet, item["description"] or "")
+            items.append(item)
+
+        total = None
+        if with_total:
+            # the movies the pages walk through
+            cursor.execute(f"{_ranked_sql(len(terms))} SELECT COUNT(*) FROM ranked", params)
+            total = cursor.fetchone()[0]
+        return {"items": items, "total": total}
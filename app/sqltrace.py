@@ -0,0 +1,222 @@
+"""SQL statement tracing for the sqlite3 connections of app/db.py.
+
+TimedConnection (the connection class behind db.get_db) times every
+execute and fetch and attributes it to the RequestStats of the request
+in progress, kept in a context variable that also reaches the DAO worker
+threads. On top of that:
+
+- statements slower than SQL_SLOW_QUERY_MS are logged with their
+  EXPLAIN QUERY PLAN;
+- a statement shape (the SQL with literals and IN lists collapsed)
+  repeated SQL_N_PLUS_ONE_THRESHOLD times within one request is reported
+  as a likely N+1 - logged with SQL_N_PLUS_ONE=warn, raised as
+  NPlusOneDetected with SQL_N_PLUS_ONE=raise;
+- with SQL_TRACE=true every statement, including those run by triggers,
+  is logged at DEBUG level through sqlite3's trace callback;
+- query_budget() lets tests assert how many statements code runs.
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Iterator, List, Optional
+
+from app.config import SQL_N_PLUS_ONE, SQL_N_PLUS_ONE_THRESHOLD, SQL_SLOW_QUERY_MS, SQL_TRACE
+
+logger = logging.getLogger("kinovzor.sql")
+
+
+class NPlusOneDetected(RuntimeError):
+    """The same statement shape ran too often within one request"""
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Code inside query_budget() ran more statements than allowed"""
+
+
+class RequestStats:
+    """SQL (and serialization, see app/metrics.py) cost of one request"""
+
+    __slots__ = ("path", "queries", "db_time", "serialize_time", "shapes")
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.shapes: Counter = Counter()
+
+    def server_timing(self, total: float) -> str:
+        app_time = max(total - self.db_time - self.serialize_time, 0.0)
+        return (
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries", '
+            f"serialize;dur={self.serialize_time * 1000:.2f}, "
+            f"app;dur={app_time * 1000:.2f}, total;dur={total * 1000:.2f}"
+        )
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("kinovzor_request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """Stats of the request being handled, None outside requests"""
+    return _current.get()
+
+
+@contextmanager
+def collect(stats: RequestStats) -> Iterator[RequestStats]:
+    """Attribute statements run inside the block to ``stats``"""
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+# Called with the stats of every finished request (see app/metrics.py)
+_finished_listeners: List[Callable[[RequestStats], None]] = []
+_listeners_lock = threading.Lock()
+
+
+def request_finished(stats: RequestStats) -> None:
+    with _listeners_lock:
+        listeners = list(_finished_listeners)
+    for listener in listeners:
+        listener(stats)
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def statement_shape(sql: str) -> str:
+    """``sql`` with literals and placeholder lists collapsed, for grouping"""
+    shape = _LITERALS.sub("?", sql)
+    shape = _IN_LIST.sub("(?)", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+def _explain(conn: sqlite3.Connection, sql: str, parameters) -> str:
+    if sql.lstrip()[:6].upper() not in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT"):
+        return "-"
+    try:
+        # A plain cursor, so the EXPLAIN itself isn't traced
+        rows = sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except (sqlite3.Error, ValueError):
+        return "-"
+    return "; ".join(row[-1] for row in rows) or "-"
+
+
+def _traced(cursor: sqlite3.Cursor, sql: str, parameters, elapsed: float, count: bool) -> None:
+    """Bookkeeping after a statement (``count``) or a fetch ran for ``elapsed`` seconds"""
+    stats = _current.get()
+    if stats is not None:
+        stats.db_time += elapsed
+        if count:
+            stats.queries += 1
+            shape = statement_shape(sql)
+            stats.shapes[shape] += 1
+            if stats.shapes[shape] == SQL_N_PLUS_ONE_THRESHOLD and SQL_N_PLUS_ONE != "off":
+                message = f"N+1 suspected: {SQL_N_PLUS_ONE_THRESHOLD}x in {stats.path}: {shape}"
+                if SQL_N_PLUS_ONE == "raise":
+                    raise NPlusOneDetected(message)
+                logger.warning(message)
+    if count and SQL_SLOW_QUERY_MS and elapsed * 1000 >= SQL_SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query (%.1f ms)%s: %s | plan: %s",
+            elapsed * 1000, f" in {stats.path}" if stats is not None and stats.path else "",
+            _SPACES.sub(" ", sql).strip(), _explain(cursor.connection, sql, parameters),
+        )
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _traced(self, sql, parameters, time.perf_counter() - started, True)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _traced(self, sql, (), time.perf_counter() - started, True)
+
+    # SQLite steps through the result while rows are fetched
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _traced(self, "", (), time.perf_counter() - started, False)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        finally:
+            _traced(self, "", (), time.perf_counter() - started, False)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _traced(self, "", (), time.perf_counter() - started, False)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are timed and traced"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if SQL_TRACE:
+            self.set_trace_callback(lambda statement: logger.debug("SQL %s", statement))
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+@contextmanager
+def query_budget(max_queries: int) -> Iterator[List[RequestStats]]:
+    """Fail if code in the block runs more than ``max_queries`` statements.
+
+    Direct db.* calls inside the block are counted together; every HTTP
+    request that finishes inside the block (e.g. through TestClient) is
+    checked on its own. Raises QueryBudgetExceeded on exit.
+
+        with sqltrace.query_budget(2):
+            client.get("/api/movies/1/full")
+    """
+    direct = RequestStats("query_budget")
+    finished: List[RequestStats] = []
+    with _listeners_lock:
+        _finished_listeners.append(finished.append)
+    try:
+        with collect(direct):
+            yield finished
+    finally:
+        with _listeners_lock:
+            _finished_listeners.remove(finished.append)
+    over = [stats for stats in [direct] + finished if stats.queries > max_queries]
+    if over:
+        raise QueryBudgetExceeded("; ".join(
+            f"{stats.path}: {stats.queries} queries (budget {max_queries}): "
+            + ", ".join(f"{n}x {shape}" for shape, n in stats.shapes.most_common(3))
+            for stats in over
+        ))
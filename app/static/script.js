@@ -11,8 +11,14 @@ let currentUser = null;
 let currentGenre = 'all';
 let currentSort = 'popular';
 let allMovies = [];
+let moviesCursor = null; // next_cursor of the movie list, null once it is all loaded
+let moviesRequest = 0; // bumped by loadMovies, so pages of an older list are dropped
+let moviesLoading = false;
+let moviesObserver = null; // loads the next page when the end of the list shows up
+let knownGenres = []; // Genres of the whole catalog, from /movies/stats (server filters by genre)
 let currentMovieRating = null; // Track current rating in modal
 let currentMovieId = null; // Track current movie in modal
+let reviewsCursor = null; // next_cursor of the reviews shown in the modal
 
 // ===== Utilities =====
 const $ = (sel, root = document) => root.querySelector(sel);
@@ -60,6 +66,7 @@ async function login() {
     saveLS(LS_KEYS.CURRENT_USER, currentUser);
     renderUserArea();
     renderProfile();
+    loadMovies();
     alert('Успешный вход!');
     $('#loginUsername').value = '';
     $('#loginPassword').value = '';
@@ -111,13 +118,27 @@ function logout() {
   localStorage.removeItem(LS_KEYS.CURRENT_USER);
   renderUserArea();
   renderProfile();
+  loadMovies();
   alert('Вы вышли');
 }
 
 // ===== Movies =====
+function movieListParams() {
+  // Filtering and sorting happen on the server
+  // The cards only show these columns (the modal loads the full movie)
+  const params = new URLSearchParams({ sort: currentSort, limit: 60, fields: 'id,title,genre,year,poster_url' });
+  if (currentGenre !== 'all') params.set('genre', currentGenre);
+  // Favorite stars come with the list, no request per movie
+  if (currentUser && !currentUser.is_guest) params.set('with_favorites', 'true');
+  return params;
+}
+
 async function loadMovies() {
+  const request = ++moviesRequest;
+  moviesCursor = null;
   try {
-    const data = await apiCall('GET', '/movies/');
+    const data = await apiCall('GET', `/movies/?${movieListParams()}`);
+    if (request !== moviesRequest) return;
     if (Array.isArray(data)) {
       allMovies = data;
     } else if (data && Array.isArray(data.items)) {
@@ -127,6 +148,7 @@ async function loadMovies() {
     } else {
       allMovies = [];
     }
+    moviesCursor = (data && data.next_cursor) || null;
     renderFilms();
     renderGenres();
     updateCounters();
@@ -139,13 +161,28 @@ async function loadMovies() {
   }
 }
 
+async function loadMoreMovies() {
+  if (!moviesCursor || moviesLoading) return;
+  const request = moviesRequest;
+  moviesLoading = true;
+  try {
+    // Следующая страница по курсору, карточки дописываются в конец
+    const params = movieListParams();
+    params.set('cursor', moviesCursor);
+    const data = await apiCall('GET', `/movies/?${params}`);
+    if (request !== moviesRequest) return; // genre or sort changed meanwhile
+    allMovies = allMovies.concat(data.items);
+    moviesCursor = data.next_cursor;
+    appendFilms(data.items);
+  } catch (e) {
+    console.error('Load more movies error:', e);
+  } finally {
+    moviesLoading = false;
+  }
+}
+
 function getGenres() {
-  if (!Array.isArray(allMovies) || allMovies.length === 0) return ['all'];
-  const set = new Set();
-  allMovies.forEach(m => {
-    if (m && m.genre) set.add(m.genre);
-  });
-  return ['all', ...Array.from(set).sort()];
+  return ['all', ...knownGenres];
 }
 
 function renderGenres() {
@@ -158,27 +195,67 @@ function renderGenres() {
     btn.textContent = g === 'all' ? 'Все жанры' : g;
     btn.onclick = () => {
       currentGenre = g;
-      renderGenres();
-      renderFilms();
+      loadMovies();
     };
     cont.appendChild(btn);
   });
 }
 
 function getFiltered() {
+  // Movies come already filtered and sorted by the server
   if (!Array.isArray(allMovies)) return [];
-  let list = [...allMovies];
-  if (currentGenre !== 'all') {
-    list = list.filter(m => m && m.genre === currentGenre);
-  }
-  if (currentSort === 'title') {
-    list.sort((a, b) => (a.title || '').localeCompare(b.title || '', 'ru'));
-  } else if (currentSort === 'year') {
-    list.sort((a, b) => (b.year || 0) - (a.year || 0));
-  } else {
-    list.sort((a, b) => (b.id || 0) - (a.id || 0));
+  return allMovies;
+}
+
+function filmCard(m) {
+  const card = document.createElement('article');
+  card.className = 'kv-film-card';
+  
+  const posterUrl = m.poster_url || '';
+  const title = m.title || 'Без названия';
+  const genre = m.genre || '';
+  const year = m.year || '';
+  
+  card.innerHTML = `
+    <div class="kv-film-poster-wrap">
+      <img src="${posterUrl}" alt="${title}" class="kv-film-poster">
+      <button class="kv-fav-btn${m.is_favorite ? ' kv-fav-btn-active' : ''}" onclick="toggleFavorite(event, ${m.id})">${m.is_favorite ? '★' : '☆'}</button>
+    </div>
+    <div class="kv-film-body">
+      <h3 class="kv-film-title">${title}</h3>
+      <div class="kv-film-meta">
+        <span>${year}</span>
+        <span>•</span>
+        <span>${genre}</span>
+      </div>
+    </div>
+  `;
+  
+  card.onclick = e => {
+    if (e.target.closest('.kv-fav-btn')) return;
+    openMovie(m.id);
+  };
+  return card;
+}
+
+function watchFilmListEnd(cont) {
+  // An empty grid row after the last card; seeing it loads the next page.
+  // Observing a new one reports it at once, so a list shorter than the
+  // screen keeps loading until it fills up or runs out.
+  const old = cont.querySelector('.kv-film-list-end');
+  if (old) old.remove();
+  if (moviesObserver) moviesObserver.disconnect();
+  if (!moviesCursor || !('IntersectionObserver' in window)) return;
+  const end = document.createElement('div');
+  end.className = 'kv-film-list-end';
+  end.style.gridColumn = '1 / -1';
+  cont.appendChild(end);
+  if (!moviesObserver) {
+    moviesObserver = new IntersectionObserver(entries => {
+      if (entries.some(entry => entry.isIntersecting)) loadMoreMovies();
+    });
   }
-  return list;
+  moviesObserver.observe(end);
 }
 
 function renderFilms() {
@@ -193,39 +270,26 @@ function renderFilms() {
 
   cont.innerHTML = '';
   films.forEach(m => {
-    if (!m) return;
-    const card = document.createElement('article');
-    card.className = 'kv-film-card';
-    
-    const posterUrl = m.poster_url || '';
-    const title = m.title || 'Без названия';
-    const genre = m.genre || '';
-    const year = m.year || '';
-    
-    card.innerHTML = `
-      <div class="kv-film-poster-wrap">
-        <img src="${posterUrl}" alt="${title}" class="kv-film-poster">
-        <button class="kv-fav-btn" onclick="toggleFavorite(event, ${m.id})">☆</button>
-      </div>
-      <div class="kv-film-body">
-        <h3 class="kv-film-title">${title}</h3>
-        <div class="kv-film-meta">
-          <span>${year}</span>
-          <span>•</span>
-          <span>${genre}</span>
-        </div>
-      </div>
-    `;
-    
-    card.onclick = e => {
-      if (e.target.closest('.kv-fav-btn')) return;
-      openMovie(m.id);
-    };
-    cont.appendChild(card);
+    if (m) cont.appendChild(filmCard(m));
   });
+  watchFilmListEnd(cont);
+}
+
+function appendFilms(films) {
+  const cont = $('#filmList');
+  if (!cont) return;
+  films.forEach(m => {
+    if (m) cont.appendChild(filmCard(m));
+  });
+  watchFilmListEnd(cont);
 }
 
 // ===== Favorites =====
+function setFavoriteFlag(movieId, isFavorite) {
+  const movie = allMovies.find(m => m && m.id === movieId);
+  if (movie) movie.is_favorite = isFavorite;
+}
+
 async function toggleFavorite(event, movieId) {
   event.stopPropagation();
   
@@ -246,6 +310,7 @@ async function toggleFavorite(event, movieId) {
       button.classList.add('kv-fav-btn-active');
       button.textContent = '★';
     }
+    setFavoriteFlag(movieId, !isFavorite);
     
     renderProfile();
   } catch (e) {
@@ -274,22 +339,53 @@ async function deleteReview(reviewId, movieId) {
 }
 
 // ===== Modal =====
+function renderReview(r, mid, isModerator) {
+  // Получаем username из API или показываем Гость если user_id = null
+  const authorName = r.username || (r.user_id ? 'Unknown' : 'Гость');
+  return `
+    <div class="kv-review">
+      <div class="kv-review-top">
+        <div class="kv-review-header">
+          <strong class="kv-review-author">✨ ${authorName}</strong>
+          ${r.rating ? `<span class="kv-review-rating">${r.rating} ★</span>` : ''}
+          ${isModerator ? `<button class="kv-review-delete-btn" onclick="deleteReview(${r.id}, ${mid})">x</button>` : ''}
+        </div>
+      </div>
+      <p class="kv-review-text">${r.text}</p>
+    </div>
+  `;
+}
+
+function updateMoreReviews() {
+  const count = $$('#reviewList .kv-review').length;
+  $('#modalReviewCount').textContent = reviewsCursor ? `${count}+` : count;
+  $('#moreReviews').style.display = reviewsCursor ? '' : 'none';
+}
+
+async function loadMoreReviews(mid) {
+  if (!reviewsCursor) return;
+  try {
+    // Следующая страница рецензий по курсору
+    const params = new URLSearchParams({ approved_only: 'false', cursor: reviewsCursor });
+    const page = await apiCall('GET', `/reviews/movie/${mid}?${params}`);
+    if (currentMovieId !== mid) return; // the modal moved on to another movie
+    const isModerator = currentUser && currentUser.is_moderator;
+    $('#reviewList').insertAdjacentHTML('beforeend', page.items.map(r => renderReview(r, mid, isModerator)).join(''));
+    reviewsCursor = page.next_cursor;
+    updateMoreReviews();
+  } catch (e) {
+    alert('Ошибка: ' + e.message);
+  }
+}
+
 async function openMovie(mid) {
   currentMovieRating = null; // Reset rating
   currentMovieId = mid; // Store current movie id
   
   try {
-    const movie = await apiCall('GET', `/movies/${mid}`);
-    const reviews = await apiCall('GET', `/reviews/movie/${mid}?approved_only=false`);
-    
-    // Получаем рейтинги из таблицы ratings
-    let ratingStats = null;
-    try {
-      ratingStats = await apiCall('GET', `/movies/${mid}/rating-stats`);
-    } catch (e) {
-      console.error('Rating stats error:', e);
-      ratingStats = null;
-    }
+    // Фильм, первая страница рецензий и рейтинг одним запросом
+    const { movie, reviews, reviews_next_cursor } = await apiCall('GET', `/movies/${mid}/full?approved_only=false`);
+    reviewsCursor = reviews_next_cursor;
 
     const modal = $('#movieModal');
     const canWrite = currentUser && !currentUser.is_guest;
@@ -301,9 +397,9 @@ async function openMovie(mid) {
     const year = movie.year || '';
     const desc = movie.description || 'Нет описания';
 
-    // Используем среднее из рейтингов таблицы (не рецензий)
-    const avgRating = (ratingStats && ratingStats.average !== null) 
-      ? ratingStats.average.toFixed(1)
+    // Средний рейтинг приходит вместе с фильмом (movie_rating_summary)
+    const avgRating = (movie.rating_average !== null && movie.rating_average !== undefined)
+      ? movie.rating_average.toFixed(1)
       : null;
 
     modal.innerHTML = `
@@ -346,31 +442,18 @@ async function openMovie(mid) {
               </div>
             ` : ''}
             <div class="kv-review-section">
-              <div class="kv-review-section-title">Рецензии (${reviews.length})</div>
-              <div class="kv-review-list">
-                ${!reviews.length ? '<div class="kv-empty">Нет рецензий</div>' : reviews.map(r => {
-                  // Получаем username из API или показываем Гость если user_id = null
-                  const authorName = r.username || (r.user_id ? 'Unknown' : 'Гость');
-                  return `
-                    <div class="kv-review">
-                      <div class="kv-review-top">
-                        <div class="kv-review-header">
-                          <strong class="kv-review-author">✨ ${authorName}</strong>
-                          ${r.rating ? `<span class="kv-review-rating">${r.rating} ★</span>` : ''}
-                          ${isModerator ? `<button class="kv-review-delete-btn" onclick="deleteReview(${r.id}, ${mid})">x</button>` : ''}
-                        </div>
-                      </div>
-                      <p class="kv-review-text">${r.text}</p>
-                    </div>
-                  `;
-                }).join('')}
+              <div class="kv-review-section-title">Рецензии (<span id="modalReviewCount"></span>)</div>
+              <div class="kv-review-list" id="reviewList">
+                ${!reviews.length ? '<div class="kv-empty">Нет рецензий</div>' : reviews.map(r => renderReview(r, mid, isModerator)).join('')}
               </div>
+              <button class="kv-btn kv-btn-secondary" id="moreReviews" onclick="loadMoreReviews(${mid})" style="width: 100%;">Показать ещё</button>
             </div>
           </div>
         </div>
       </div>
     `;
 
+    updateMoreReviews();
     modal.classList.add('kv-modal-open');
     modal.querySelector('.kv-modal-close').onclick = () => modal.classList.remove('kv-modal-open');
     modal.querySelector('.kv-modal-backdrop').onclick = () => modal.classList.remove('kv-modal-open');
@@ -442,6 +525,7 @@ async function removeFavorite(movieId) {
   
   try {
     await apiCall('DELETE', `/favorites/${movieId}`);
+    setFavoriteFlag(movieId, false);
     renderProfile();
     renderFilms(); // Обновим звёзды на карточках
   } catch (e) {
@@ -508,6 +592,9 @@ async function updateCounters() {
     
     if (rc) rc.textContent = stats.movies_count || 0;
     if (rwc) rwc.textContent = stats.reviews_count || 0;
+    // Every genre of the catalog, not only those on the loaded pages
+    knownGenres = (stats.genres || []).map(g => g.genre).filter(Boolean).sort();
+    renderGenres();
   } catch (e) {
     console.error('Counter update error:', e);
     // Fallback: использовать текущие фильмы
@@ -540,7 +627,7 @@ function setupButtons() {
   if (guestBtn) guestBtn.onclick = loginGuest;
   if (sortSel) sortSel.onchange = e => {
     currentSort = e.target.value;
-    renderFilms();
+    loadMovies();
   };
 }
 
@@ -0,0 +1,137 @@
+"""Catalog-wide statistics computed in a single aggregate query"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app import db
+from app.config import STATS_REFRESH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# One round trip: scalar subqueries for the totals, and the per-genre
+# breakdown folded into a JSON array by SQLite itself.
+STATS_QUERY = """
+SELECT
+    (SELECT COUNT(*) FROM movies) AS movies_count,
+    r.reviews_count,
+    r.approved_reviews_count,
+    r.reviews_count - r.approved_reviews_count AS pending_reviews_count,
+    r.rated_reviews_count,
+    r.average_review_rating,
+    (SELECT COUNT(*) FROM ratings) AS ratings_count,
+    (SELECT AVG(value) FROM ratings) AS ratings_average,
+    (SELECT COUNT(*) FROM users) AS users_count,
+    (SELECT COUNT(*) FROM favorites) AS favorites_count,
+    (
+        SELECT json_group_array(json_object(
+            'genre', g.genre,
+            'movies_count', g.movies_count,
+            'reviews_count', g.reviews_count,
+            'average_rating', g.average_rating
+        ))
+        FROM (
+            SELECT m.genre AS genre,
+                   COUNT(*) AS movies_count,
+                   COALESCE(SUM(rv.reviews_count), 0) AS reviews_count,
+                   SUM(rv.rating_sum) * 1.0 / NULLIF(SUM(rv.rated_count), 0) AS average_rating
+            FROM movies m
+            LEFT JOIN (
+                SELECT movie_id,
+                       COUNT(*) AS reviews_count,
+                       COUNT(rating) AS rated_count,
+                       SUM(rating) AS rating_sum
+                FROM reviews
+                GROUP BY movie_id
+            ) rv ON rv.movie_id = m.id
+            GROUP BY m.genre
+            ORDER BY movies_count DESC, m.genre
+        ) g
+    ) AS genres
+FROM (
+    SELECT COUNT(*) AS reviews_count,
+           COALESCE(SUM(approved = 1), 0) AS approved_reviews_count,
+           COUNT(rating) AS rated_reviews_count,
+           AVG(rating) AS average_review_rating
+    FROM reviews
+) r
+"""
+
+
+def compute_stats() -> Dict[str, Any]:
+    """Run the aggregate query and shape the result"""
+    with db.connection() as conn:
+        row = conn.execute(STATS_QUERY).fetchone()
+
+    stats = dict(row)
+    genres = json.loads(stats.pop("genres") or "[]")
+    for genre in genres:
+        if genre["average_rating"] is not None:
+            genre["average_rating"] = round(genre["average_rating"], 2)
+    for key in ("average_review_rating", "ratings_average"):
+        if stats[key] is not None:
+            stats[key] = round(stats[key], 2)
+
+    stats["genres"] = genres
+    stats["generated_at"] = datetime.utcnow().isoformat()
+    return stats
+
+
+class StatsSnapshot:
+    """In-process copy of compute_stats() refreshed every ``interval`` seconds.
+
+    With interval 0 every get() recomputes. Otherwise get() returns the
+    cached snapshot, recomputing inline only when it is older than the
+    interval (e.g. when the background refresher isn't running).
+    """
+
+    def __init__(self, interval: float = STATS_REFRESH_SECONDS):
+        self.interval = interval
+        self._stats: Optional[Dict[str, Any]] = None
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self) -> Dict[str, Any]:
+        if self.interval <= 0:
+            return compute_stats()
+        # Leave slack for the background refresher before refreshing inline
+        max_age = self.interval * 2 if self._thread is not None else self.interval
+        if self._stats is None or time.monotonic() - self._refreshed_at > max_age:
+            self.refresh()
+        return self._stats
+
+    def refresh(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = compute_stats()
+            self._stats = stats
+            self._refreshed_at = time.monotonic()
+        return stats
+
+    def start(self) -> None:
+        """Refresh in a daemon thread so requests never wait for the query"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stats-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Stats refresh failed")
+            self._stop.wait(self.interval)
+
+
+snapshot = StatsSnapshot()
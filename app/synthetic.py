@@ -0,0 +1,155 @@
+"""Reproducible synthetic datasets for benchmarks, loaded through app/bulk.py.
+
+Sizes scale linearly with the scale factor; SF1 is 10k movies, 100k
+users, 2M reviews and 1M ratings. Titles, descriptions, posters and
+review texts are variations of the hand-written data in seed_db.py, with
+its genre mix. Activity is skewed the way real catalogs are:
+
+- movie popularity is Zipfian (a few titles get most reviews and ratings);
+- reviews per user follow a power law (Pareto-distributed user weights);
+- each movie has a "quality" around which its ratings scatter.
+
+The same seed and scale factor always produce the same rows.
+"""
+import itertools
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List
+
+from app import bulk
+
+# Row counts at scale factor 1
+SF1 = {"movies": 10_000, "users": 100_000, "reviews": 2_000_000, "ratings": 1_000_000}
+
+ZIPF_EXPONENT = 1.0     # movie popularity: weight of rank r is 1 / r**s
+PARETO_ALPHA = 1.2      # user activity: lower means heavier tail
+APPROVED_SHARE = 0.9
+REVIEW_PERIOD_DAYS = 3 * 365
+PASSWORD = "viewer123"  # of every generated user
+
+
+def sizes_for(scale: float) -> Dict[str, int]:
+    """Row counts for a scale factor (at least 1 movie and user)"""
+    sizes = {table: int(round(count * scale)) for table, count in SF1.items()}
+    sizes["movies"] = max(sizes["movies"], 1)
+    sizes["users"] = max(sizes["users"], 1)
+    return sizes
+
+
+class Dataset:
+    """Record streams of one synthetic dataset, in the format app/bulk.py reads"""
+
+    def __init__(self, scale: float = 1.0, seed: int = 42, now: datetime = datetime(2025, 1, 1)):
+        from seed_db import hash_password, movies_data, reviews_templates, viewers_data
+
+        self.scale = scale
+        self.seed = seed
+        self.now = now
+        self.sizes = sizes_for(scale)
+        self._movies_data = movies_data
+        self._viewers = viewers_data
+        self._templates = reviews_templates
+        self._password = hash_password(PASSWORD)
+
+        rnd = self._random("setup")
+        # Genre mix of seed_db.movies_data
+        genres = Counter(movie["genre"] for movie in movies_data)
+        self._genres = sorted(genres)
+        self._genre_weights = list(itertools.accumulate(genres[g] for g in self._genres))
+        self._by_genre = {g: [m for m in movies_data if m["genre"] == g] for g in self._genres}
+
+        # Zipf over popularity ranks, with ranks shuffled across movies
+        ranks = list(range(1, self.sizes["movies"] + 1))
+        rnd.shuffle(ranks)
+        self._movie_weights = list(itertools.accumulate(1 / rank ** ZIPF_EXPONENT for rank in ranks))
+        self._user_weights = list(itertools.accumulate(
+            rnd.paretovariate(PARETO_ALPHA) for _ in range(self.sizes["users"])
+        ))
+        self._movie_keys: List[tuple] = []
+        self._quality: List[float] = []
+
+    def _random(self, stream: str) -> random.Random:
+        """Independent generator per stream, so one table's rows don't depend on another's"""
+        return random.Random(f"{self.seed}:{self.scale}:{stream}")
+
+    def users(self) -> Iterator[Dict[str, Any]]:
+        yield {"email": "moderator@kinovzor.ru", "username": "moderator", "password": self._password,
+               "is_moderator": True}
+        for i in range(1, self.sizes["users"]):
+            viewer = self._viewers[i % len(self._viewers)]
+            yield {"email": f"user{i}@example.com", "username": f"{viewer['username']} {i}", "password": self._password}
+
+    def movies(self) -> Iterator[Dict[str, Any]]:
+        rnd = self._random("movies")
+        seen = Counter()
+        self._movie_keys, self._quality = [], []
+        for _ in range(self.sizes["movies"]):
+            genre = rnd.choices(self._genres, cum_weights=self._genre_weights)[0]
+            base = rnd.choice(self._by_genre[genre])
+            seen[base["title"]] += 1
+            title = base["title"] if seen[base["title"]] == 1 else f"{base['title']} {seen[base['title']]}"
+            year = int(rnd.triangular(1950, 2025, 2015))
+            self._movie_keys.append((title, year, genre))
+            self._quality.append(min(max(rnd.gauss(3.6, 0.6), 1.0), 5.0))
+            yield {"title": title, "year": year, "genre": genre, "description": base["desc"], "poster_url": base["poster"]}
+
+    def _ensure_movies(self) -> None:
+        if len(self._movie_keys) != self.sizes["movies"]:
+            for _ in self.movies():
+                pass
+
+    def _activity(self, stream: str, count: int, make: Callable[[random.Random, int, int], Dict]) -> Iterator[Dict]:
+        """``count`` records for (movie index, user index) pairs drawn by popularity and activity"""
+        self._ensure_movies()
+        rnd = self._random(stream)
+        movies, users = range(self.sizes["movies"]), range(1, self.sizes["users"] + 1)
+        batch = 10_000
+        for start in range(0, count, batch):
+            n = min(batch, count - start)
+            picked_movies = rnd.choices(movies, cum_weights=self._movie_weights, k=n)
+            picked_users = rnd.choices(users, cum_weights=self._user_weights, k=n)
+            for movie, user in zip(picked_movies, picked_users):
+                yield make(rnd, movie, user)
+
+    def _rating(self, rnd: random.Random, movie: int) -> int:
+        return min(max(round(rnd.gauss(self._quality[movie], 1.0)), 1), 5)
+
+    def _user_email(self, user: int) -> str:
+        # user 1 is the moderator
+        return "moderator@kinovzor.ru" if user == 1 else f"user{user - 1}@example.com"
+
+    def reviews(self) -> Iterator[Dict[str, Any]]:
+        period = REVIEW_PERIOD_DAYS * 86400
+
+        def make(rnd, movie, user):
+            title, year, genre = self._movie_keys[movie]
+            rating = self._rating(rnd, movie)
+            templates = self._templates.get(genre, self._templates["Драма"])
+            text = min(templates, key=lambda t: (abs(t["rating"] - rating), rnd.random()))["text"]
+            created_at = self.now - timedelta(seconds=rnd.randrange(period))
+            return {
+                "movie_title": title, "movie_year": year, "user_email": self._user_email(user),
+                "text": text, "rating": rating, "approved": rnd.random() < APPROVED_SHARE,
+                "created_at": created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+
+        return self._activity("reviews", self.sizes["reviews"], make)
+
+    def ratings(self) -> Iterator[Dict[str, Any]]:
+        def make(rnd, movie, user):
+            title, year, _ = self._movie_keys[movie]
+            return {"movie_title": title, "movie_year": year, "user_email": self._user_email(user),
+                    "value": float(self._rating(rnd, movie))}
+
+        return self._activity("ratings", self.sizes["ratings"], make)
+
+
+def generate(scale: float = 1.0, seed: int = 42, chunk_size: int = bulk.CHUNK_SIZE,
+             progress: Callable[[str, int], None] = None) -> Dict[str, Dict[str, Any]]:
+    """Load a synthetic dataset into the database via the bulk importer"""
+    dataset = Dataset(scale, seed)
+    return bulk.import_records(
+        users=dataset.users(), movies=dataset.movies(), reviews=dataset.reviews(), ratings=dataset.ratings(),
+        chunk_size=chunk_size, progress=progress,
+    )
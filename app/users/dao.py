@@ -1,4 +1,24 @@
-from app.users.models import User
+from typing import Dict, Optional
 
-class UserDAO:
-    pass
+from app import db
+from app.dao import BaseDAO
+
+
+class UserDAO(BaseDAO):
+    async def get(self, user_id: int) -> Optional[Dict]:
+        return await self._run(db.get_user_by_id, user_id)
+
+    async def get_by_email(self, email: str) -> Optional[Dict]:
+        return await self._run(db.get_user_by_email, email)
+
+    async def get_by_username(self, username: str) -> Optional[Dict]:
+        return await self._run(db.get_user_by_username, username)
+
+    async def create(self, email: str, password: str, username: str, is_moderator: bool = False) -> Dict:
+        return await self._run(db.create_user, email, password, username, is_moderator)
+
+    async def update(self, user_id: int, email: str = None, username: str = None, password: str = None) -> Optional[Dict]:
+        return await self._run(db.update_user, user_id, email=email, username=username, password=password)
+
+    async def delete(self, user_id: int) -> bool:
+        return await self._run(db.delete_user, user_id)
@@ -1,27 +1,18 @@
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, EmailStr
-from app import db
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
-import jwt
+from typing import Literal, Optional
+from app.auth import create_jwt_token, get_current_user, get_current_user_id
+from app.config import TOKEN_EXPIRE_HOURS
+from app.http_cache import response_cache
+from app.movies.dao import MovieDAO
+from app.passwords import HasherBusy, hasher
+from app.reviews.dao import ReviewDAO
+from app.users.dao import UserDAO
 import json
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
-# JWT Configuration
-SECRET_KEY = "your-secret-key"  # TODO: Move to .env
-ALGORITHM = "HS256"
-TOKEN_EXPIRE_HOURS = 24
-
-# Password hashing context with flexible schemes to support old passwords
-pwd_context = CryptContext(
-    schemes=["bcrypt", "plaintext"],
-    deprecated="auto",
-    bcrypt__rounds=12
-)
-
-
 class UserRegister(BaseModel):
     email: EmailStr
     password: str
@@ -39,48 +30,19 @@ class UserUpdate(BaseModel):
     password: str = None
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    try:
-        # Try standard verification first
-        return pwd_context.verify(plain_password, hashed_password)
-    except Exception as e:
-        # If verification fails, try plaintext comparison as fallback
-        # (for users created without proper hashing)
-        try:
-            return plain_password == hashed_password
-        except:
-            return False
-
-
-def hash_password(password: str) -> str:
-    """Hash a password"""
-    return pwd_context.hash(password)
-
-
-def create_jwt_token(user_id: int) -> str:
-    """Create a JWT token for a user"""
-    payload = {
-        "user_id": user_id,
-        "exp": datetime.utcnow() + timedelta(hours=TOKEN_EXPIRE_HOURS),
-        "iat": datetime.utcnow()
-    }
-    token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
-    return token
-
-
 @router.post("/register")
-def register(data: UserRegister, response: Response):
+async def register(data: UserRegister, response: Response, users: UserDAO = Depends()):
     """Register a new user"""
     # Check if user already exists
-    existing = db.get_user_by_email(data.email)
+    existing = await users.get_by_email(data.email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already exists")
     
-    # Hash password
-    hashed_password = hash_password(data.password)
+    # Hash password, without holding a pooled connection during bcrypt
+    await users.release()
+    hashed_password = await hasher.hash(data.password)
     
-    user = db.create_user(data.email, hashed_password, data.username)
+    user = await users.create(data.email, hashed_password, data.username)
     
     # Generate JWT token
     token = create_jwt_token(user['id'])
@@ -98,20 +60,29 @@ def register(data: UserRegister, response: Response):
 
 
 @router.post("/login")
-def login(data: UserLogin, response: Response):
+async def login(data: UserLogin, response: Response, users: UserDAO = Depends()):
     """Login user by username"""
     print(f"Login attempt with: {json.dumps({'username': data.username, 'password': '***'})}")
     
     # Get user by username
-    user = db.get_user_by_username(data.username)
+    user = await users.get_by_username(data.username)
     
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    # Verify password against hash
-    if not verify_password(data.password, user['password']):
+    # Verify password against hash, without holding a pooled connection during bcrypt
+    await users.release()
+    valid, needs_rehash = await hasher.verify(data.password, user['password'])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Upgrade legacy SHA-256 / plaintext passwords to bcrypt
+    if needs_rehash:
+        try:
+            user = await users.update(user['id'], password=await hasher.hash(data.password))
+        except HasherBusy:
+            pass
+    
     # Generate JWT token
     token = create_jwt_token(user['id'])
     
@@ -128,58 +99,102 @@ def login(data: UserLogin, response: Response):
 
 
 @router.get("/me")
-def get_current_user(user_id: int):
-    """Get current user info"""
-    user = db.get_user_by_id(user_id)
-    
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+async def get_me(user: dict = Depends(get_current_user)):
+    """Get current user info (from the access_token cookie)"""
     return user
 
 
+@router.get("/me/recommendations")
+async def get_my_recommendations(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    user_id: int = Depends(get_current_user_id),
+    movies: MovieDAO = Depends(),
+):
+    """Movies similar to the ones the user liked; the most-rated ones for new users"""
+    return await response_cache.respond(
+        request,
+        ("movies", "movie_rating_summary", "movie_neighbors", "user_preferences"),
+        lambda: movies.recommended_for(user_id, limit),
+        per_user=True,
+        user_id=user_id
+    )
+
+
+@router.get("/{user_id}/reviews")
+async def get_user_reviews(
+    user_id: int,
+    request: Request,
+    sort: Literal["newest", "highest", "lowest"] = Query("newest"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    text_preview: Optional[int] = Query(None, ge=1, le=2000, description="cut the text to this many characters"),
+    fields: Optional[str] = Query(None, description="comma-separated fields to return, e.g. id,rating,text"),
+    reviews: ReviewDAO = Depends(),
+):
+    """Get a page of the approved reviews written by a user"""
+    async def build():
+        try:
+            return await reviews.list_for_user(user_id, sort=sort, limit=limit, cursor=cursor,
+                                               text_preview=text_preview, fields=fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return await response_cache.respond(request, ("reviews", "users"), build)
+
+
 @router.put("/{user_id}")
-def update_user(user_id: int, data: UserUpdate, current_user_id: int):
+async def update_user(
+    user_id: int,
+    data: UserUpdate,
+    current_user_id: int = Depends(get_current_user_id),
+    users: UserDAO = Depends(),
+):
     """Update user profile (can only update own profile)"""
     # Check if user can update this profile
     if user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Not authorized to update this user")
     
-    user = db.get_user_by_id(user_id)
+    user = await users.get(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Check if new email already exists (if email is being changed)
     if data.email and data.email != user['email']:
-        existing = db.get_user_by_email(data.email)
+        existing = await users.get_by_email(data.email)
         if existing:
             raise HTTPException(status_code=400, detail="Email already exists")
     
     # Hash new password if provided
     hashed_password = None
     if data.password:
-        hashed_password = hash_password(data.password)
+        await users.release()
+        hashed_password = await hasher.hash(data.password)
     
-    db.update_user(
+    return await users.update(
         user_id=user_id,
         email=data.email,
         username=data.username,
         password=hashed_password
     )
-    
-    return db.get_user_by_id(user_id)
 
 
 @router.delete("/{user_id}")
-def delete_user(user_id: int, current_user_id: int):
+async def delete_user(
+    user_id: int,
+    response: Response,
+    current_user_id: int = Depends(get_current_user_id),
+    users: UserDAO = Depends(),
+):
     """Delete user account (can only delete own account)"""
     # Check if user can delete this profile
     if user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this user")
     
-    user = db.get_user_by_id(user_id)
+    user = await users.get(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    db.delete_user(user_id)
+    await users.delete(user_id)
+    response.delete_cookie("access_token")
     return {"status": "deleted"}
@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+"""Throughput and latency percentiles of every API endpoint, in process.
+
+Boots app.main:app (lifespan included) against a copy of a synthetic
+database (app/synthetic.py) and drives each endpoint through httpx's ASGI
+transport at fixed concurrency levels. Results are written as JSON; the
+compare command flags endpoints whose throughput dropped or p95 latency
+grew by more than a threshold.
+
+    python benchmarks/api_bench.py run --scale 0.01 --concurrency 1,16 --out before.json
+    python benchmarks/api_bench.py run --scale 0.01 --concurrency 1,16 --out after.json
+    python benchmarks/api_bench.py compare before.json after.json --threshold 0.1
+
+--db keeps the generated database between runs (it is copied, never
+modified). Without it the dataset is generated into a temporary directory.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+
+import init_db
+from app import db, synthetic
+from app.synthetic import PASSWORD
+
+TABLES = ("users", "movies", "reviews", "ratings", "favorites", "movie_rating_summary", "search_index",
+          "user_preferences", "movie_neighbors", "movie_rankings")
+MODERATION_BATCH = 50  # pending reviews per POST /api/reviews/moderate
+
+# (path, request options) of one request
+Request = Tuple[str, Dict[str, Any]]
+
+
+class Fixtures:
+    """Ids, users and tokens the endpoints draw from; rows consumed by deletes come from pools"""
+
+    def __init__(self, conn: sqlite3.Connection, pool_size: int):
+        from app.auth import create_jwt_token
+
+        self.movie_count = conn.execute("SELECT MAX(id) FROM movies").fetchone()[0]
+        self.user_count = conn.execute("SELECT MAX(id) FROM users").fetchone()[0]
+        self.review_count = conn.execute("SELECT MAX(id) FROM reviews").fetchone()[0]
+        # the moderator of app/synthetic.py
+        self.moderator_id = conn.execute("SELECT id FROM users WHERE is_moderator = 1 ORDER BY id").fetchone()[0]
+        self.usernames = [row[0] for row in conn.execute("SELECT username FROM users ORDER BY id LIMIT 1000")]
+        self.words = sorted({
+            word for (title,) in conn.execute("SELECT title FROM movies ORDER BY id LIMIT 500") for word in title.split()
+            if len(word) > 3
+        })
+        self.genres = [row[0] for row in conn.execute("SELECT DISTINCT genre FROM movies ORDER BY genre")]
+        # Reviews with their authors: the oldest are updated, the newest deleted
+        self.editable = conn.execute(
+            "SELECT id, user_id FROM reviews WHERE user_id IS NOT NULL ORDER BY id LIMIT ?", (pool_size,)
+        ).fetchall()
+        self.deletable = conn.execute(
+            "SELECT id, user_id FROM reviews WHERE user_id IS NOT NULL ORDER BY id DESC LIMIT ?", (pool_size,)
+        ).fetchall()
+        # Moderation batches of MODERATION_BATCH pending reviews
+        self.pending = [
+            row[0] for row in conn.execute(
+                "SELECT id FROM reviews WHERE approved = 0 ORDER BY id LIMIT ?", (pool_size * MODERATION_BATCH,)
+            )
+        ]
+        # at most a quarter of the catalog, so reads after the deletes still find movies
+        self.deletable_movies = [
+            row[0] for row in conn.execute(
+                "SELECT id FROM movies ORDER BY id DESC LIMIT ?", (min(pool_size, self.movie_count // 4),)
+            )
+        ]
+        self.deletable_users = [
+            row[0] for row in conn.execute(
+                "SELECT id FROM users WHERE is_moderator = 0 ORDER BY id DESC LIMIT ?", (pool_size,)
+            )
+        ]
+        self.registered = 0
+        self._create_token = create_jwt_token
+        self._tokens: Dict[int, str] = {}
+
+    def cookie(self, user_id: int) -> Dict[str, str]:
+        token = self._tokens.get(user_id)
+        if token is None:
+            token = self._tokens[user_id] = self._create_token(user_id)
+        return {"Cookie": f"access_token={token}"}
+
+    def movie(self, rnd: random.Random) -> int:
+        return rnd.randint(1, self.movie_count)
+
+    def user(self, rnd: random.Random) -> int:
+        return rnd.randint(1, self.user_count)
+
+    @staticmethod
+    def take(pool: list) -> Any:
+        return pool.pop() if pool else None
+
+
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    make: Callable[[Fixtures, random.Random], Request]
+
+
+def _movies_list(f: Fixtures, rnd: random.Random) -> Request:
+    params = {"sort": rnd.choice(["popular", "title", "year", "rating"]), "limit": 20, "offset": rnd.randrange(0, 200, 20)}
+    if rnd.random() < 0.5:
+        params["genre"] = rnd.choice(f.genres)
+    return "/api/movies/", {"params": params}
+
+
+def _review_update(f: Fixtures, rnd: random.Random) -> Request:
+    review_id, user_id = rnd.choice(f.editable)
+    return f"/api/reviews/{review_id}", {"json": {"rating": rnd.randint(1, 5)}, "headers": f.cookie(user_id)}
+
+
+def _review_delete(f: Fixtures, rnd: random.Random) -> Request:
+    review_id, user_id = f.take(f.deletable) or (0, f.moderator_id)
+    return f"/api/reviews/{review_id}", {"headers": f.cookie(user_id)}
+
+
+def _favorites_batch(f: Fixtures, rnd: random.Random) -> Request:
+    movies = rnd.sample(range(1, f.movie_count + 1), min(20, f.movie_count))
+    return "/api/favorites/batch", {
+        "json": {"add": movies[:10], "remove": movies[10:]}, "headers": f.cookie(f.user(rnd))
+    }
+
+
+def _moderate(f: Fixtures, rnd: random.Random) -> Request:
+    batch = [f.take(f.pending) for _ in range(MODERATION_BATCH)]
+    batch = [review_id for review_id in batch if review_id is not None]
+    half = len(batch) // 2
+    return "/api/reviews/moderate", {
+        "json": {"approve": batch[:half], "reject": batch[half:]}, "headers": f.cookie(f.moderator_id)
+    }
+
+
+def _register(f: Fixtures, rnd: random.Random) -> Request:
+    f.registered += 1
+    return "/api/users/register", {"json": {
+        "email": f"bench{f.registered}@example.com", "username": f"bench{f.registered}", "password": PASSWORD,
+    }}
+
+
+def _user_update(f: Fixtures, rnd: random.Random) -> Request:
+    user_id = f.user(rnd)
+    return f"/api/users/{user_id}", {"json": {"username": f"bench{user_id}"}, "headers": f.cookie(user_id)}
+
+
+def _user_delete(f: Fixtures, rnd: random.Random) -> Request:
+    user_id = f.take(f.deletable_users) or 0
+    return f"/api/users/{user_id}", {"headers": f.cookie(user_id)}
+
+
+# Reads first, then writes, deletes last
+ENDPOINTS = [
+    Endpoint("movies.list", "GET", _movies_list),
+    Endpoint("movies.list_cards", "GET", lambda f, rnd: (
+        "/api/movies/", {"params": {"limit": 200, "fields": "id,title,genre,year,poster_url"}}
+    )),
+    Endpoint("movies.list_favorites", "GET", lambda f, rnd: (
+        "/api/movies/", {"params": {"limit": 20, "with_favorites": "true"}, "headers": f.cookie(f.user(rnd))}
+    )),
+    Endpoint("movies.top", "GET", lambda f, rnd: ("/api/movies/top", {"params": {"limit": 20}})),
+    Endpoint("movies.trending", "GET", lambda f, rnd: ("/api/movies/trending", {"params": {"limit": 20}})),
+    Endpoint("movies.stats", "GET", lambda f, rnd: ("/api/movies/stats", {})),
+    Endpoint("movies.search", "GET", lambda f, rnd: ("/api/movies/search", {"params": {"q": rnd.choice(f.words)}})),
+    Endpoint("movies.get", "GET", lambda f, rnd: (f"/api/movies/{f.movie(rnd)}", {})),
+    Endpoint("movies.full", "GET", lambda f, rnd: (f"/api/movies/{f.movie(rnd)}/full", {})),
+    Endpoint("movies.rating_stats", "GET", lambda f, rnd: (f"/api/movies/{f.movie(rnd)}/rating-stats", {})),
+    Endpoint("movies.similar", "GET", lambda f, rnd: (f"/api/movies/{f.movie(rnd)}/similar", {})),
+    Endpoint("movies.batch", "POST", lambda f, rnd: (
+        "/api/movies/batch", {"json": {"ids": [f.movie(rnd) for _ in range(20)]}}
+    )),
+    Endpoint("reviews.for_movie", "GET", lambda f, rnd: (f"/api/reviews/movie/{f.movie(rnd)}", {})),
+    Endpoint("reviews.for_movie_by_rating", "GET", lambda f, rnd: (
+        f"/api/reviews/movie/{f.movie(rnd)}", {"params": {"sort": "highest", "text_preview": 200}}
+    )),
+    Endpoint("reviews.get", "GET", lambda f, rnd: (f"/api/reviews/{rnd.randint(1, f.review_count)}", {})),
+    Endpoint("reviews.pending", "GET", lambda f, rnd: (
+        "/api/reviews/pending", {"params": {"limit": 50}, "headers": f.cookie(f.moderator_id)}
+    )),
+    Endpoint("favorites.list", "GET", lambda f, rnd: ("/api/favorites/", {"headers": f.cookie(f.user(rnd))})),
+    Endpoint("favorites.check", "GET", lambda f, rnd: (
+        f"/api/favorites/check/{f.movie(rnd)}", {"headers": f.cookie(f.user(rnd))}
+    )),
+    Endpoint("favorites.check_many", "POST", lambda f, rnd: (
+        "/api/favorites/check", {"json": {"ids": [f.movie(rnd) for _ in range(50)]}, "headers": f.cookie(f.user(rnd))}
+    )),
+    Endpoint("users.reviews", "GET", lambda f, rnd: (f"/api/users/{f.user(rnd)}/reviews", {})),
+    Endpoint("users.me", "GET", lambda f, rnd: ("/api/users/me", {"headers": f.cookie(f.user(rnd))})),
+    Endpoint("users.recommendations", "GET", lambda f, rnd: (
+        "/api/users/me/recommendations", {"headers": f.cookie(f.user(rnd))}
+    )),
+    Endpoint("users.login", "POST", lambda f, rnd: (
+        "/api/users/login", {"json": {"username": rnd.choice(f.usernames), "password": PASSWORD}}
+    )),
+    Endpoint("users.register", "POST", _register),
+    Endpoint("users.update", "PUT", _user_update),
+    Endpoint("movies.create", "POST", lambda f, rnd: ("/api/movies/", {"json": {
+        "title": f"Бенчмарк {rnd.random()}", "genre": rnd.choice(f.genres), "year": rnd.randint(1950, 2025),
+    }})),
+    Endpoint("movies.update", "PUT", lambda f, rnd: (
+        f"/api/movies/{f.movie(rnd)}", {"json": {"year": rnd.randint(1950, 2025)}}
+    )),
+    Endpoint("reviews.create", "POST", lambda f, rnd: ("/api/reviews/", {
+        "json": {"movie_id": f.movie(rnd), "text": "Бенчмарк", "rating": rnd.randint(1, 5)},
+        "headers": f.cookie(f.user(rnd)),
+    })),
+    Endpoint("reviews.update", "PUT", _review_update),
+    Endpoint("reviews.approve", "PUT", lambda f, rnd: (
+        f"/api/reviews/{rnd.randint(1, f.review_count)}/approve", {"headers": f.cookie(f.moderator_id)}
+    )),
+    Endpoint("favorites.add", "POST", lambda f, rnd: (
+        f"/api/favorites/{f.movie(rnd)}", {"headers": f.cookie(f.user(rnd))}
+    )),
+    Endpoint("favorites.remove", "DELETE", lambda f, rnd: (
+        f"/api/favorites/{f.movie(rnd)}", {"headers": f.cookie(f.user(rnd))}
+    )),
+    Endpoint("favorites.batch", "POST", _favorites_batch),
+    Endpoint("reviews.moderate", "POST", _moderate),
+    Endpoint("reviews.delete", "DELETE", _review_delete),
+    Endpoint("movies.delete", "DELETE", lambda f, rnd: (f"/api/movies/{f.take(f.deletable_movies) or 0}", {})),
+    Endpoint("users.delete", "DELETE", _user_delete),
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def drive(client: httpx.AsyncClient, endpoint: Endpoint, fixtures: Fixtures,
+                concurrency: int, requests: int, seed: int) -> Dict[str, Any]:
+    """Send ``requests`` requests from ``concurrency`` workers; latency and status counters"""
+    rnd = random.Random(f"{seed}:{endpoint.name}:{concurrency}")
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            path, options = endpoint.make(fixtures, rnd)
+            started = time.perf_counter()
+            response = await client.request(endpoint.method, path, **options)
+            latencies.append(time.perf_counter() - started)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "endpoint": endpoint.name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if not status.startswith(("2", "3"))),
+        "statuses": statuses,
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        **{f"p{q}_ms": round(percentile(latencies, q) * 1000, 3) for q in (50, 95, 99)},
+    }
+
+
+async def run_level(fixtures: Fixtures, concurrency: int, requests: int, warmup: int,
+                    seed: int, only: Optional[str]) -> List[Dict[str, Any]]:
+    from app.main import app
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for endpoint in ENDPOINTS:
+            if only and not endpoint.name.startswith(only):
+                continue
+            # the routers print, e.g. on login
+            with contextlib.redirect_stdout(io.StringIO()):
+                if warmup:
+                    await drive(client, endpoint, fixtures, concurrency, warmup, seed + 1)
+                result = await drive(client, endpoint, fixtures, concurrency, requests, seed)
+            results.append(result)
+            print(f"{endpoint.name:<22} c={concurrency:<4} {result['rps']:>9.1f} req/s  "
+                  f"p50 {result['p50_ms']:>8.2f}  p95 {result['p95_ms']:>8.2f}  p99 {result['p99_ms']:>8.2f} ms"
+                  + (f"  errors {result['errors']}" if result['errors'] else ""))
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> int:
+    levels = [int(level) for level in args.concurrency.split(",")]
+    with tempfile.TemporaryDirectory() as tmp:
+        template = args.db or Path(tmp) / "template.db"
+        if not template.exists():
+            print(f"Generating SF{args.scale} (seed {args.seed}) into {template}")
+            init_db.DB_PATH = db.DB_PATH = template
+            with contextlib.redirect_stdout(io.StringIO()):
+                init_db.init_db()
+                synthetic.generate(args.scale, args.seed)
+        results = []
+        # Each level starts from a fresh copy, so earlier deletes don't turn into 404s
+        for concurrency in levels:
+            work = Path(tmp) / f"bench_c{concurrency}.db"
+            work.write_bytes(template.read_bytes())
+            init_db.DB_PATH = db.DB_PATH = work
+            # the file was replaced under the caches
+            for table in TABLES:
+                db.notify_change(table)
+            with sqlite3.connect(work) as conn:
+                fixtures = Fixtures(conn, args.requests + args.warmup)
+            results += asyncio.run(run_level(fixtures, concurrency, args.requests, args.warmup, args.seed, args.only))
+
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "scale": args.scale,
+            "seed": args.seed,
+            "database": str(args.db) if args.db else None,
+            "requests": args.requests,
+            "concurrency": levels,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"\nResults written to {args.out}")
+    return 0
+
+
+def compare(args) -> int:
+    old, new = (json.loads(path.read_text()) for path in (args.old, args.new))
+    old_results = {(r["endpoint"], r["concurrency"]): r for r in old["results"]}
+    regressions = 0
+    print(f"{'endpoint':<22} {'c':>4} {'req/s old':>10} {'new':>10} {'Δ':>7}   {'p95 old':>9} {'new':>9} {'Δ':>7}")
+    for result in new["results"]:
+        before = old_results.get((result["endpoint"], result["concurrency"]))
+        if before is None:
+            continue
+        rps_change = result["rps"] / before["rps"] - 1
+        p95_change = result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        regressed = rps_change < -args.threshold or p95_change > args.threshold
+        regressions += regressed
+        print(f"{result['endpoint']:<22} {result['concurrency']:>4} {before['rps']:>10.1f} {result['rps']:>10.1f} "
+              f"{rps_change:>+7.1%}   {before['p95_ms']:>9.2f} {result['p95_ms']:>9.2f} {p95_change:>+7.1%}"
+              + ("   ⚠️  regression" if regressed else ""))
+    print(f"\n{regressions} regression(s) beyond ±{args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="benchmark the endpoints")
+    run_parser.add_argument("--scale", type=float, default=0.01, help="scale factor of the generated dataset")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--db", type=Path, help="generated database to reuse (created if missing)")
+    run_parser.add_argument("--concurrency", default="1,16", help="comma-separated concurrency levels")
+    run_parser.add_argument("--requests", type=int, default=300, help="requests per endpoint and level")
+    run_parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each run")
+    run_parser.add_argument("--only", help="only endpoints whose name starts with this, e.g. movies.")
+    run_parser.add_argument("--out", type=Path, help="write results as JSON")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("old", type=Path)
+    compare_parser.add_argument("new", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative drop in req/s or growth in p95 that counts as a regression")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
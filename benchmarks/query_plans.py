@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""EXPLAIN QUERY PLAN and timings of the app/db.py lookups with and without
+the secondary indexes from init_db.INDEXES.
+
+    python benchmarks/query_plans.py --movies 20000 --users 5000 --reviews 200000
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import init_db
+
+# name -> (sql, function building params from the random generator)
+QUERIES = {
+    "get_user_by_username": (
+        "SELECT * FROM users WHERE username = ?",
+        lambda rnd, n: (f"user{rnd.randint(1, n['users'])}",),
+    ),
+    "get_movie_reviews (approved)": (
+        "SELECT r.*, u.username FROM reviews r LEFT JOIN users u ON r.user_id = u.id "
+        "WHERE r.movie_id = ? AND r.approved = 1 ORDER BY r.created_at DESC",
+        lambda rnd, n: (rnd.randint(1, n['movies']),),
+    ),
+    "get_movie_reviews (all)": (
+        "SELECT r.*, u.username FROM reviews r LEFT JOIN users u ON r.user_id = u.id "
+        "WHERE r.movie_id = ? ORDER BY r.created_at DESC",
+        lambda rnd, n: (rnd.randint(1, n['movies']),),
+    ),
+    "list_reviews (movie, newest)": (
+        "SELECT r.*, u.username FROM reviews r LEFT JOIN users u ON r.user_id = u.id "
+        "WHERE r.movie_id = ? AND r.approved = 1 ORDER BY r.created_at DESC, r.id DESC LIMIT 21",
+        lambda rnd, n: (rnd.randint(1, n['movies']),),
+    ),
+    "list_reviews (movie, highest)": (
+        "SELECT r.*, u.username FROM reviews r LEFT JOIN users u ON r.user_id = u.id "
+        "WHERE r.movie_id = ? AND r.approved = 1 AND r.rating IS NOT NULL "
+        "ORDER BY r.rating DESC, r.created_at DESC, r.id DESC LIMIT 21",
+        lambda rnd, n: (rnd.randint(1, n['movies']),),
+    ),
+    "list_reviews (user, newest)": (
+        "SELECT r.*, u.username FROM reviews r LEFT JOIN users u ON r.user_id = u.id "
+        "WHERE r.user_id = ? AND r.approved = 1 ORDER BY r.created_at DESC, r.id DESC LIMIT 21",
+        lambda rnd, n: (rnd.randint(1, n['users']),),
+    ),
+    "is_favorite": (
+        "SELECT 1 FROM favorites WHERE movie_id = ? AND user_id = ?",
+        lambda rnd, n: (rnd.randint(1, n['movies']), rnd.randint(1, n['users'])),
+    ),
+    "get_user_favorites": (
+        "SELECT m.* FROM movies m JOIN favorites f ON m.id = f.movie_id WHERE f.user_id = ?",
+        lambda rnd, n: (rnd.randint(1, n['users']),),
+    ),
+    "rating lookup (movie, user)": (
+        "SELECT * FROM ratings WHERE movie_id = ? AND user_id = ?",
+        lambda rnd, n: (rnd.randint(1, n['movies']), rnd.randint(1, n['users'])),
+    ),
+    "get_movie_ratings": (
+        "SELECT * FROM ratings WHERE movie_id = ?",
+        lambda rnd, n: (rnd.randint(1, n['movies']),),
+    ),
+    "delete_user (reviews of user)": (
+        "SELECT id FROM reviews WHERE user_id = ?",
+        lambda rnd, n: (rnd.randint(1, n['users']),),
+    ),
+    "delete_movie (favorites of movie)": (
+        "SELECT id FROM favorites WHERE movie_id = ?",
+        lambda rnd, n: (rnd.randint(1, n['movies']),),
+    ),
+    "list_movies (genre, title)": (
+        "SELECT m.* FROM movies m WHERE m.genre = ? ORDER BY m.title ASC, m.id ASC LIMIT 50",
+        lambda rnd, n: (rnd.choice(GENRES),),
+    ),
+}
+
+GENRES = ["Драма", "Комедия", "Боевик", "Фантастика", "Триллер", "Мелодрама", "Приключения", "Ужасы"]
+
+
+def build_database(path: Path, sizes: dict, seed: int) -> None:
+    """Create the schema via init_db and fill it with random rows"""
+    init_db.DB_PATH = path
+    init_db.init_db()
+
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO users (email, password, username) VALUES (?, ?, ?)",
+        ((f"user{i}@example.com", "x", f"user{i}") for i in range(1, sizes['users'] + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO movies (title, description, genre, year) VALUES (?, ?, ?, ?)",
+        ((f"Фильм {i}", "", rnd.choice(GENRES), rnd.randint(1950, 2025)) for i in range(1, sizes['movies'] + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO reviews (movie_id, user_id, text, rating, approved, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (rnd.randint(1, sizes['movies']), rnd.randint(1, sizes['users']), "Текст рецензии",
+             rnd.randint(1, 5), rnd.random() < 0.8, f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}")
+            for _ in range(sizes['reviews'])
+        ),
+    )
+    pairs = {(rnd.randint(1, sizes['movies']), rnd.randint(1, sizes['users'])) for _ in range(sizes['ratings'])}
+    conn.executemany(
+        "INSERT INTO ratings (movie_id, user_id, value) VALUES (?, ?, ?)",
+        ((m, u, float(rnd.randint(1, 5))) for m, u in pairs),
+    )
+    pairs = {(rnd.randint(1, sizes['movies']), rnd.randint(1, sizes['users'])) for _ in range(sizes['favorites'])}
+    conn.executemany("INSERT INTO favorites (movie_id, user_id) VALUES (?, ?)", pairs)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def drop_secondary_indexes(path: Path) -> None:
+    conn = sqlite3.connect(path)
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+    )]
+    for name in names:
+        conn.execute(f"DROP INDEX {name}")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, params: tuple) -> str:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return "; ".join(row[3] for row in rows)
+
+
+def time_query(conn: sqlite3.Connection, sql: str, make_params, sizes: dict, repeat: int, seed: int) -> float:
+    """Average milliseconds per execution"""
+    rnd = random.Random(seed)
+    params = [make_params(rnd, sizes) for _ in range(repeat)]
+    started = time.perf_counter()
+    for p in params:
+        conn.execute(sql, p).fetchall()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movies", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--reviews", type=int, default=200000)
+    parser.add_argument("--ratings", type=int, default=100000)
+    parser.add_argument("--favorites", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=200, help="executions per query")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    sizes = {k: getattr(args, k) for k in ("movies", "users", "reviews", "ratings", "favorites")}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path, after_path = Path(tmp) / "before.db", Path(tmp) / "after.db"
+        print(f"Building databases: {sizes}")
+        build_database(after_path, sizes, args.seed)
+        before_path.write_bytes(after_path.read_bytes())
+        drop_secondary_indexes(before_path)
+
+        before, after = sqlite3.connect(before_path), sqlite3.connect(after_path)
+        print(f"\n{'query':<36} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+        plans = []
+        for name, (sql, make_params) in QUERIES.items():
+            sample = make_params(random.Random(args.seed), sizes)
+            plans.append((name, query_plan(before, sql, sample), query_plan(after, sql, sample)))
+            t_before = time_query(before, sql, make_params, sizes, args.repeat, args.seed)
+            t_after = time_query(after, sql, make_params, sizes, args.repeat, args.seed)
+            print(f"{name:<36} {t_before:>10.3f} {t_after:>10.3f} {t_before / t_after:>7.1f}x")
+
+        print("\nQuery plans")
+        for name, plan_before, plan_after in plans:
+            print(f"\n{name}\n  before: {plan_before}\n  after:  {plan_after}")
+        before.close()
+        after.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""Rendering time of large movie and review lists: the old JSON path against app/responses.py.
+
+"before" is what every response used to cost: jsonable_encoder over the
+dicts from app/db.py, then JSONResponse (json.dumps). "orjson" is
+responses.render(), the default response class and the response cache
+path now; "msgpack" is shown when the package is installed. "rows->dicts"
+is dicts_from_rows on the same rows, the conversion both paths share.
+
+    python benchmarks/serialization.py --scale 0.05 --repeat 100
+"""
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+import init_db
+from app import db, responses, synthetic
+
+
+def average_ms(fn: Callable[[], Any], repeat: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def payloads(limit: int) -> dict:
+    """name -> (content, SQL rows it was built from)"""
+    with db.connection() as conn:
+        movie_id = conn.execute(
+            "SELECT movie_id FROM reviews WHERE approved = 1 GROUP BY movie_id ORDER BY COUNT(*) DESC LIMIT 1"
+        ).fetchone()[0]
+        movie_rows = conn.execute(f"{db._MOVIE_SELECT} ORDER BY m.id DESC LIMIT ?", (limit,)).fetchall()
+        review_rows = conn.execute(
+            "SELECT r.*, u.username FROM reviews r LEFT JOIN users u ON r.user_id = u.id "
+            "WHERE r.movie_id = ? AND r.approved = 1 ORDER BY r.created_at DESC", (movie_id,)
+        ).fetchall()
+    movies, reviews = len(movie_rows), len(review_rows)
+    return {
+        f"movies x{movies}": (db.list_movies(limit=limit), movie_rows),
+        f"movies x{movies} (cards)": (db.list_movies(limit=limit, fields="id,title,genre,year,poster_url"), None),
+        f"reviews x{min(reviews, 100)}": (db.list_reviews(movie_id=movie_id, limit=100), None),
+        f"reviews x{reviews} (all)": (db.get_movie_reviews(movie_id), review_rows),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=0.05, help="synthetic dataset scale factor")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", type=Path, help="reuse (or create) this database instead of a temporary one")
+    parser.add_argument("--limit", type=int, default=200, help="movies per list")
+    parser.add_argument("--repeat", type=int, default=100, help="renderings per payload")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or Path(tmp) / "serialization.db"
+        init_db.DB_PATH = db.DB_PATH = path
+        if not path.exists():
+            print(f"Generating SF{args.scale} (seed {args.seed}) into {path}")
+            with contextlib.redirect_stdout(io.StringIO()):
+                init_db.init_db()
+                synthetic.generate(args.scale, args.seed)
+
+        print(f"\n{'payload':<28} {'KB':>7} {'before ms':>10} {'orjson ms':>10} {'speedup':>8} "
+              f"{'msgpack ms':>11} {'rows->dicts':>12}")
+        for name, (content, rows) in payloads(args.limit).items():
+            size = len(responses.to_json(content)) / 1024
+            before = average_ms(lambda: JSONResponse(jsonable_encoder(content)).body, args.repeat)
+            after = average_ms(lambda: responses.render(content), args.repeat)
+            packed = "-"
+            if responses.msgpack is not None:
+                packed = f"{average_ms(lambda: responses.render(content, responses.MSGPACK), args.repeat):.3f}"
+            to_dicts = "-" if rows is None else f"{average_ms(lambda: db.dicts_from_rows(rows), args.repeat):.3f}"
+            print(f"{name:<28} {size:>7.1f} {before:>10.3f} {after:>10.3f} {before / after:>7.1f}x "
+                  f"{packed:>11} {to_dicts:>12}")
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
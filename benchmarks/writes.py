@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Writes/sec of the app/db.py write helpers against the pre-RETURNING write path.
+
+"before" replays what a write used to cost: a fresh connection per helper
+call, the write and commit, then another connection to re-read the row,
+plus the existence checks the routers did around update/delete. "after"
+runs the current helpers on the connection pool.
+
+    python benchmarks/writes.py --ops 2000
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import init_db
+from app import db
+from benchmarks.query_plans import GENRES, build_database
+
+
+class Legacy:
+    """The write path before pooling and RETURNING (connect, write, reconnect, re-read)"""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def fetch(self, sql: str, params: tuple):
+        conn = self.connect()
+        try:
+            row = conn.execute(sql, params).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def write(self, sql: str, params: tuple) -> int:
+        conn = self.connect()
+        try:
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def get_movie(self, movie_id):
+        return self.fetch("SELECT * FROM movies WHERE id = ?", (movie_id,))
+
+    def create_movie(self, title, genre, year):
+        movie_id = self.write("INSERT INTO movies (title, description, genre, year) VALUES (?, '', ?, ?)", (title, genre, year))
+        return self.get_movie(movie_id)
+
+    def update_movie(self, movie_id, year):
+        # router: existence check, update, then update_movie's own re-read
+        if self.get_movie(movie_id) is None:
+            return None
+        self.write("UPDATE movies SET year = ? WHERE id = ?", (year, movie_id))
+        return self.get_movie(movie_id)
+
+    def get_review(self, review_id):
+        return self.fetch(
+            "SELECT r.*, u.username FROM reviews r LEFT JOIN users u ON r.user_id = u.id WHERE r.id = ?", (review_id,)
+        )
+
+    def create_review(self, movie_id, user_id, text, rating):
+        if self.get_movie(movie_id) is None:
+            return None
+        review_id = self.write(
+            "INSERT INTO reviews (movie_id, user_id, text, rating, approved) VALUES (?, ?, ?, ?, 0)",
+            (movie_id, user_id, text, rating),
+        )
+        return self.get_review(review_id)
+
+    def update_review(self, review_id, rating):
+        self.write("UPDATE reviews SET rating = ? WHERE id = ?", (rating, review_id))
+        return self.get_review(review_id)
+
+    def create_or_update_rating(self, movie_id, user_id, value):
+        conn = self.connect()
+        try:
+            existing = conn.execute(
+                "SELECT * FROM ratings WHERE movie_id = ? AND user_id = ?", (movie_id, user_id)
+            ).fetchone()
+            if existing:
+                conn.execute("UPDATE ratings SET value = ? WHERE movie_id = ? AND user_id = ?", (value, movie_id, user_id))
+                rating_id = existing['id']
+            else:
+                rating_id = conn.execute(
+                    "INSERT INTO ratings (movie_id, user_id, value) VALUES (?, ?, ?)", (movie_id, user_id, value)
+                ).lastrowid
+            conn.commit()
+        finally:
+            conn.close()
+        return self.fetch("SELECT * FROM ratings WHERE id = ?", (rating_id,))
+
+
+class Current:
+    """The app/db.py helpers"""
+
+    create_movie = staticmethod(lambda title, genre, year: db.create_movie(title, "", genre, year))
+    update_movie = staticmethod(lambda movie_id, year: db.update_movie(movie_id, year=year))
+    create_review = staticmethod(db.create_review)
+    update_review = staticmethod(lambda review_id, rating: db.update_review(review_id, rating=rating))
+    create_or_update_rating = staticmethod(db.create_or_update_rating)
+
+
+def workloads(sizes: dict):
+    """name -> function(helpers, rnd) performing one write"""
+    return {
+        "create_movie": lambda h, rnd: h.create_movie(f"Новый фильм {rnd.random()}", rnd.choice(GENRES), rnd.randint(1950, 2025)),
+        "update_movie": lambda h, rnd: h.update_movie(rnd.randint(1, sizes['movies']), rnd.randint(1950, 2025)),
+        "create_review": lambda h, rnd: h.create_review(
+            rnd.randint(1, sizes['movies']), rnd.randint(1, sizes['users']), "Текст рецензии", rnd.randint(1, 5)
+        ),
+        "update_review": lambda h, rnd: h.update_review(rnd.randint(1, sizes['reviews']), rnd.randint(1, 5)),
+        "create_or_update_rating": lambda h, rnd: h.create_or_update_rating(
+            rnd.randint(1, sizes['movies']), rnd.randint(1, sizes['users']), float(rnd.randint(1, 5))
+        ),
+    }
+
+
+def run(helpers, write, ops: int, seed: int) -> float:
+    """Writes per second"""
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    for _ in range(ops):
+        write(helpers, rnd)
+    return ops / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movies", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--reviews", type=int, default=20000)
+    parser.add_argument("--ops", type=int, default=2000, help="writes per workload")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    sizes = {"movies": args.movies, "users": args.users, "reviews": args.reviews, "ratings": args.reviews // 2, "favorites": 0}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = Path(tmp) / "template.db"
+        print(f"Building database: {sizes}")
+        build_database(template, sizes, args.seed)
+        with sqlite3.connect(template) as conn:
+            init_db.upgrade_db(conn)
+            db.rebuild_rating_summary(conn)
+
+        print(f"\n{'write':<26} {'before/s':>10} {'after/s':>10} {'speedup':>8}")
+        for name, write in workloads(sizes).items():
+            before_path, after_path = Path(tmp) / f"{name}_before.db", Path(tmp) / f"{name}_after.db"
+            before_path.write_bytes(template.read_bytes())
+            after_path.write_bytes(template.read_bytes())
+
+            before = run(Legacy(before_path), write, args.ops, args.seed)
+            db.close_pool()
+            db.DB_PATH = after_path
+            after = run(Current, write, args.ops, args.seed)
+            db.close_pool()
+            print(f"{name:<26} {before:>10.0f} {after:>10.0f} {after / before:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
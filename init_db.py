@@ -5,6 +5,213 @@ from pathlib import Path
 
 DB_PATH = Path(__file__).parent / "kinovzor.db"
 
+# Columns added to existing tables, (table, column) -> definition; upgrade_db() adds them when missing
+COLUMNS = {
+    # Sort key of GET /api/movies?sort=rating (ix_movie_rating_summary_average)
+    ("movie_rating_summary", "rating_average"):
+        "REAL GENERATED ALWAYS AS (ROUND(COALESCE(rating_sum * 1.0 / NULLIF(rating_count, 0), 0), 1)) VIRTUAL",
+}
+
+# Tables added after the initial schema, created by upgrade_db() when missing
+TABLES = {
+    # Per-movie aggregates of review ratings, maintained by the review helpers in app/db.py;
+    # every movie has a row (db.RATING_SUMMARY_TRIGGERS)
+    "movie_rating_summary": f"""
+    CREATE TABLE IF NOT EXISTS movie_rating_summary (
+        movie_id INTEGER PRIMARY KEY,
+        rating_count INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        rating_1 INTEGER NOT NULL DEFAULT 0,
+        rating_2 INTEGER NOT NULL DEFAULT 0,
+        rating_3 INTEGER NOT NULL DEFAULT 0,
+        rating_4 INTEGER NOT NULL DEFAULT 0,
+        rating_5 INTEGER NOT NULL DEFAULT 0,
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        rating_average {COLUMNS[("movie_rating_summary", "rating_average")]},
+        FOREIGN KEY (movie_id) REFERENCES movies(id)
+    )
+    """,
+    # Full-text indexes of movies and of approved reviews, maintained by the triggers in app/search.py
+    "search_index": """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        title, description,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    "review_search_index": """
+    CREATE VIRTUAL TABLE IF NOT EXISTS review_search_index USING fts5(
+        text,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    # Item-to-item recommendations, see app/recommend.py: preference weight per
+    # user and movie, how many movies each user liked, the length of each
+    # movie's preference vector, the top neighbors of each movie, and the
+    # pairs changed since the last refresh
+    "user_preferences": """
+    CREATE TABLE IF NOT EXISTS user_preferences (
+        user_id INTEGER NOT NULL,
+        movie_id INTEGER NOT NULL,
+        weight REAL NOT NULL,
+        PRIMARY KEY (user_id, movie_id)
+    ) WITHOUT ROWID
+    """,
+    "preference_users": """
+    CREATE TABLE IF NOT EXISTS preference_users (
+        user_id INTEGER PRIMARY KEY,
+        liked INTEGER NOT NULL
+    )
+    """,
+    "movie_pref_norms": """
+    CREATE TABLE IF NOT EXISTS movie_pref_norms (
+        movie_id INTEGER PRIMARY KEY,
+        norm REAL NOT NULL
+    )
+    """,
+    "movie_neighbors": """
+    CREATE TABLE IF NOT EXISTS movie_neighbors (
+        movie_id INTEGER NOT NULL,
+        neighbor_id INTEGER NOT NULL,
+        score REAL NOT NULL,
+        support INTEGER NOT NULL,
+        PRIMARY KEY (movie_id, neighbor_id)
+    ) WITHOUT ROWID
+    """,
+    "preference_changes": """
+    CREATE TABLE IF NOT EXISTS preference_changes (
+        user_id INTEGER NOT NULL,
+        movie_id INTEGER NOT NULL,
+        PRIMARY KEY (user_id, movie_id)
+    ) WITHOUT ROWID
+    """,
+    # Top-rated and trending leaderboards, see app/rankings.py: the scores of
+    # each movie, and the site-wide rating totals, prior and trending epoch
+    "movie_rankings": """
+    CREATE TABLE IF NOT EXISTS movie_rankings (
+        movie_id INTEGER PRIMARY KEY,
+        top_score REAL,
+        trending_score REAL NOT NULL DEFAULT 0
+    )
+    """,
+    "ranking_state": """
+    CREATE TABLE IF NOT EXISTS ranking_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        rating_count INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        prior_mean REAL NOT NULL DEFAULT 0,
+        trending_epoch REAL NOT NULL DEFAULT 0
+    )
+    """,
+}
+
+# Secondary indexes. IF NOT EXISTS lets upgrade_db() add them to databases
+# created before the index was introduced.
+INDEXES = [
+    # GET /api/movies: genre/year filters and title/year/popular sort orders
+    "CREATE INDEX IF NOT EXISTS ix_movies_title ON movies (title)",
+    "CREATE INDEX IF NOT EXISTS ix_movies_year ON movies (year)",
+    "CREATE INDEX IF NOT EXISTS ix_movies_genre ON movies (genre)",
+    "CREATE INDEX IF NOT EXISTS ix_movies_genre_title ON movies (genre, title)",
+    "CREATE INDEX IF NOT EXISTS ix_movies_genre_year ON movies (genre, year)",
+    # sort=rating: every movie by its rounded average rating
+    "CREATE INDEX IF NOT EXISTS ix_movie_rating_summary_average ON movie_rating_summary (rating_average, movie_id)",
+    # get_user_by_username (login)
+    "CREATE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+    # One index per review feed order, every review write maintains all of them.
+    # Pages of all reviews (approved_only=False) merge the approved = 1 and
+    # approved = 0 ranges of the same index (see list_reviews).
+    # list_reviews / get_movies_full: reviews of a movie, newest first
+    # (the rowid every index ends with breaks the created_at ties); delete_movie
+    "CREATE INDEX IF NOT EXISTS ix_reviews_movie_approved_created ON reviews (movie_id, approved, created_at)",
+    # list_reviews of a movie by rating; covers the rating aggregates (movie_rating_summary)
+    "CREATE INDEX IF NOT EXISTS ix_reviews_movie_approved_rating ON reviews (movie_id, approved, rating, created_at)",
+    # list_reviews of a user, newest first or by rating; delete_user
+    "CREATE INDEX IF NOT EXISTS ix_reviews_user_approved_created ON reviews (user_id, approved, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_reviews_user_approved_rating ON reviews (user_id, approved, rating, created_at)",
+    # Moderation queue (get_pending_reviews): only the unapproved reviews, oldest first
+    "CREATE INDEX IF NOT EXISTS ix_reviews_pending ON reviews (created_at, id) WHERE approved = 0",
+    # One rating / one favorite per user and movie: the targets of the ON CONFLICT
+    # upserts in create_or_update_rating and add_favorite, and the lookups by user
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_ratings_user_movie ON ratings (user_id, movie_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_favorites_user_movie ON favorites (user_id, movie_id)",
+    # get_movie_ratings, delete_movie
+    "CREATE INDEX IF NOT EXISTS ix_ratings_movie ON ratings (movie_id)",
+    "CREATE INDEX IF NOT EXISTS ix_favorites_movie ON favorites (movie_id)",
+    # Recommendations: users of a movie (app/recommend.py)
+    "CREATE INDEX IF NOT EXISTS ix_user_preferences_movie ON user_preferences (movie_id, weight)",
+    # GET /api/movies/top and /trending: ranked movies only, best first
+    "CREATE INDEX IF NOT EXISTS ix_movie_rankings_top ON movie_rankings (top_score, movie_id) WHERE top_score IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS ix_movie_rankings_trending ON movie_rankings (trending_score, movie_id) "
+    "WHERE trending_score > 0",
+]
+
+# Indexes replaced by wider ones in INDEXES, or by the approved = 1 / 0 ranges
+# of the (movie_id, approved, ...) indexes; upgrade_db() drops them
+SUPERSEDED_INDEXES = [
+    "ix_reviews_movie_rating", "ix_reviews_user", "ix_reviews_movie_rating_created", "ix_reviews_movie_created",
+]
+
+# Triggers whose work moved elsewhere; upgrade_db() drops them. rankings_prior
+# rescored every movie inside a rating write, now rankings.refresh() does
+SUPERSEDED_TRIGGERS = ["rankings_prior"]
+
+# Duplicates left by the old check-then-insert helpers would make the
+# unique indexes above fail, so they are removed first
+DEDUPLICATE = [
+    # keep the latest rating of each user for a movie
+    "DELETE FROM ratings WHERE id NOT IN (SELECT MAX(id) FROM ratings GROUP BY user_id, movie_id)",
+    "DELETE FROM favorites WHERE id NOT IN (SELECT MIN(id) FROM favorites GROUP BY user_id, movie_id)",
+]
+
+def upgrade_db(conn: sqlite3.Connection = None):
+    """Apply schema additions (tables, indexes, triggers) to an existing database"""
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(DB_PATH)
+    try:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+        from app import db, rankings, recommend, search
+        # search_index used to hold the reviews of each movie too; replaced with
+        # review_search_index, and its triggers with the current ones
+        if "reviews" in {row[1] for row in conn.execute("PRAGMA table_info(search_index)")}:
+            for name in search.TRIGGER_NAMES:
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+            conn.execute("DROP TABLE search_index")
+            existing.discard("search_index")
+        for statement in TABLES.values():
+            conn.execute(statement)
+        for (table, column), definition in COLUMNS.items():
+            if table in existing and column not in {row[1] for row in conn.execute(f"PRAGMA table_xinfo({table})")}:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        if not {"ux_ratings_user_movie", "ux_favorites_user_movie"} <= existing:
+            for statement in DEDUPLICATE:
+                conn.execute(statement)
+        for statement in INDEXES:
+            conn.execute(statement)
+        for name in SUPERSEDED_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        for name in SUPERSEDED_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for statement in db.RATING_SUMMARY_TRIGGERS + search.TRIGGERS + recommend.TRIGGERS + rankings.TRIGGERS:
+            conn.execute(statement)
+        if "movie_rating_summary" in existing:
+            # movies added before the summary had a row for every movie
+            conn.execute(db.RATING_SUMMARY_FILL)
+        conn.commit()
+        
+        # Fill new derived tables from the data already in the database
+        if "movie_rating_summary" not in existing:
+            db.rebuild_rating_summary(conn)
+        if not {"search_index", "review_search_index"} <= existing:
+            search.rebuild_search_index(conn)
+        if "movie_neighbors" not in existing:
+            recommend.rebuild(conn)
+        if "movie_rankings" not in existing:
+            rankings.rebuild(conn)
+    finally:
+        if own_conn:
+            conn.close()
+
 def init_db():
     """Create all tables"""
     
@@ -87,12 +294,12 @@ def init_db():
     )
     """)
     
-    conn.commit()
+    upgrade_db(conn)
     conn.close()
     
     print(f"✅ Database initialized successfully!")
     print(f"📁 File: {DB_PATH}")
-    print(f"🗓️ Tables: users, movies, reviews, ratings, favorites")
+    print(f"🗓️ Tables: users, movies, reviews, ratings, favorites, {', '.join(TABLES)}")
 
 if __name__ == "__main__":
     init_db()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""KinoVzor maintenance commands
+
+    python kinovzor.py ratings rebuild   # recompute movie_rating_summary from reviews
+    python kinovzor.py ratings verify    # compare movie_rating_summary with reviews
+    python kinovzor.py search rebuild    # refill the full-text search index
+    python kinovzor.py recommend rebuild # recompute all similar-movie lists
+    python kinovzor.py recommend refresh # apply rating/favorite changes since the last refresh
+    python kinovzor.py rankings rebuild  # recompute the top-rated and trending lists
+    python kinovzor.py rankings refresh  # move the top-rated prior to the site-wide average
+    python kinovzor.py import --movies movies.csv --reviews reviews.jsonl
+                                         # bulk-load CSV / JSON Lines files
+    python kinovzor.py export reviews --format csv --since 2026-10-01 --gzip -o reviews.csv.gz
+                                         # stream a table as NDJSON (default) or CSV
+    python kinovzor.py --db bench.db generate --scale 0.1
+                                         # new database with a synthetic dataset
+
+--db selects the database file (default: kinovzor.db next to this script).
+"""
+import argparse
+import sys
+from contextlib import nullcontext
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import init_db
+from app import bulk, db, dump, rankings, recommend, search, synthetic
+
+
+def ratings_rebuild(args) -> int:
+    movies = db.rebuild_rating_summary()
+    print(f"✅ Rating summary rebuilt for {movies} movies")
+    return 0
+
+
+def ratings_verify(args) -> int:
+    mismatches = db.verify_rating_summary()
+    if not mismatches:
+        print("✅ Rating summary matches reviews")
+        return 0
+    print(f"⚠️  {len(mismatches)} movies out of sync:")
+    for item in mismatches[:args.show]:
+        print(f"   movie {item['movie_id']}: {item['difference']}")
+    print("   Run `python kinovzor.py ratings rebuild` to fix")
+    return 1
+
+
+def search_rebuild(args) -> int:
+    movies = search.rebuild_search_index()
+    print(f"✅ Search index rebuilt for {movies} movies")
+    return 0
+
+
+def recommend_rebuild(args) -> int:
+    movies = recommend.rebuild()
+    print(f"✅ Similar movies computed for {movies} movies")
+    return 0
+
+
+def recommend_refresh(args) -> int:
+    result = recommend.refresh()
+    print(f"✅ {result['pairs']} changed preferences applied, {result['movies']} movies updated")
+    return 0
+
+
+def rankings_rebuild(args) -> int:
+    movies = rankings.rebuild()
+    print(f"✅ Top-rated and trending lists rebuilt for {movies} movies")
+    return 0
+
+
+def rankings_refresh(args) -> int:
+    movies = rankings.refresh()
+    if movies:
+        print(f"✅ Top-rated prior moved to the site-wide average, {movies} movies rescored")
+    else:
+        print("✅ Top-rated prior already matches the site-wide average")
+    return 0
+
+
+def import_data(args) -> int:
+    sources = {table: getattr(args, table) for table in ("users", "movies", "reviews", "ratings")}
+    if not any(sources.values()):
+        print("⚠️  Nothing to import: pass --users, --movies, --reviews and/or --ratings")
+        return 2
+
+    def progress(table, rows):
+        print(f"   {table}: {rows} rows read", end="\r", flush=True)
+
+    report = bulk.import_files(**sources, chunk_size=args.chunk_size, defer_indexes=not args.keep_indexes,
+                               progress=progress)
+    print()
+    for table, counts in report.items():
+        print(f"✅ {table}: {counts['inserted']} imported, {counts['skipped']} duplicates, "
+              f"{counts['invalid']} invalid ({counts['read']} rows in {counts['seconds']}s, "
+              f"{counts['rows_per_sec']} rows/s)")
+    return 0
+
+
+def export_data(args) -> int:
+    try:
+        chunks = dump.export(args.table, args.format, since=args.since, compress=args.gzip)
+    except ValueError as e:
+        print(f"⚠️  {e}", file=sys.stderr)
+        return 2
+    with (open(args.output, "wb") if args.output else nullcontext(sys.stdout.buffer)) as out:
+        for chunk in chunks:
+            out.write(chunk)
+    if args.output:
+        print(f"✅ {args.table} exported to {args.output}")
+    return 0
+
+
+def generate_data(args) -> int:
+    if db.DB_PATH.exists() and not args.replace:
+        print(f"⚠️  {db.DB_PATH} exists; pass --replace to overwrite it or --db to pick another file")
+        return 2
+    init_db.init_db()
+    sizes = synthetic.sizes_for(args.scale)
+    print(f"🎲 Scale factor {args.scale}, seed {args.seed}: {sizes}")
+
+    def progress(table, rows):
+        print(f"   {table}: {rows}/{sizes[table]}", end="\r", flush=True)
+
+    report = synthetic.generate(args.scale, args.seed, chunk_size=args.chunk_size, progress=progress)
+    print()
+    for table, counts in report.items():
+        print(f"✅ {table}: {counts['inserted']} rows ({counts['rows_per_sec']} rows/s)")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="kinovzor", description="KinoVzor maintenance commands")
+    parser.add_argument("--db", type=Path, help="database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ratings = commands.add_parser("ratings", help="per-movie rating aggregates")
+    ratings_commands = ratings.add_subparsers(dest="action", required=True)
+    ratings_commands.add_parser("rebuild", help="recompute from reviews").set_defaults(func=ratings_rebuild)
+    verify = ratings_commands.add_parser("verify", help="check against reviews")
+    verify.add_argument("--show", type=int, default=20, help="how many mismatches to print")
+    verify.set_defaults(func=ratings_verify)
+
+    search_parser = commands.add_parser("search", help="full-text search index")
+    search_commands = search_parser.add_subparsers(dest="action", required=True)
+    search_commands.add_parser("rebuild", help="reindex movies and reviews").set_defaults(func=search_rebuild)
+
+    recommend_parser = commands.add_parser("recommend", help="similar movies and recommendations")
+    recommend_commands = recommend_parser.add_subparsers(dest="action", required=True)
+    recommend_commands.add_parser("rebuild", help="recompute all neighbor lists").set_defaults(func=recommend_rebuild)
+    recommend_commands.add_parser("refresh", help="apply recorded changes").set_defaults(func=recommend_refresh)
+
+    rankings_parser = commands.add_parser("rankings", help="top-rated and trending lists")
+    rankings_commands = rankings_parser.add_subparsers(dest="action", required=True)
+    rankings_commands.add_parser("rebuild", help="recompute both lists").set_defaults(func=rankings_rebuild)
+    rankings_commands.add_parser("refresh", help="rescore top-rated if the average moved").set_defaults(
+        func=rankings_refresh)
+
+    import_parser = commands.add_parser("import", help="bulk-load users, movies, reviews and ratings")
+    for table in ("users", "movies", "reviews", "ratings"):
+        import_parser.add_argument(f"--{table}", type=Path, help=f"{table} file (.csv or .jsonl)")
+    import_parser.add_argument("--chunk-size", type=int, default=bulk.CHUNK_SIZE, help="rows per transaction")
+    import_parser.add_argument("--keep-indexes", action="store_true",
+                               help="keep secondary indexes and search triggers during the import")
+    import_parser.set_defaults(func=import_data)
+
+    export = commands.add_parser("export", help="stream a table as NDJSON or CSV (users without passwords)")
+    export.add_argument("table", choices=list(dump.TABLES))
+    export.add_argument("--format", choices=list(dump.FORMATS), default="ndjson")
+    export.add_argument("--since", help="only rows created or changed at or after this ISO date/datetime (UTC)")
+    export.add_argument("--gzip", action="store_true", help="gzip the output")
+    export.add_argument("-o", "--output", type=Path, help="output file (default: stdout)")
+    export.set_defaults(func=export_data)
+
+    generate = commands.add_parser("generate", help="create a database with a synthetic dataset")
+    generate.add_argument("--scale", type=float, default=1.0,
+                          help="scale factor; 1 = 10k movies, 100k users, 2M reviews, 1M ratings")
+    generate.add_argument("--seed", type=int, default=42)
+    generate.add_argument("--chunk-size", type=int, default=bulk.CHUNK_SIZE, help="rows per transaction")
+    generate.add_argument("--replace", action="store_true", help="overwrite an existing database file")
+    generate.set_defaults(func=generate_data, upgrade=False)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.db is not None:
+        db.DB_PATH = init_db.DB_PATH = args.db
+    if getattr(args, "upgrade", True):
+        # Make sure tables added by newer versions exist
+        init_db.upgrade_db()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
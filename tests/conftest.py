@@ -0,0 +1,46 @@
+"""Fixtures shared by the tests: a small synthetic database and a client of the app"""
+import contextlib
+import io
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Read by app.config on import: no background refreshes competing with the
+# requests under test, and N+1 patterns fail the request
+os.environ.setdefault("STATS_REFRESH_SECONDS", "0")
+os.environ.setdefault("RECOMMEND_REFRESH_SECONDS", "0")
+os.environ.setdefault("RANKINGS_REFRESH_SECONDS", "0")
+os.environ.setdefault("SQL_N_PLUS_ONE", "raise")
+
+import pytest
+
+import init_db
+from app import db, synthetic
+
+SCALE = 0.01  # 100 movies, 1000 users, 20k reviews
+
+
+@pytest.fixture(scope="session")
+def database(tmp_path_factory) -> Path:
+    """SF0.01 generated once per test run"""
+    path = tmp_path_factory.mktemp("db") / "kinovzor.db"
+    init_db.DB_PATH = db.DB_PATH = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db.init_db()
+        synthetic.generate(SCALE, seed=42)
+    yield path
+    db.close_pool()
+
+
+@pytest.fixture(scope="session")
+def client(database):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        # Open the pooled connection (its PRAGMAs count as statements too)
+        client.get("/api/movies/stats")
+        yield client
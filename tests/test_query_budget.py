@@ -0,0 +1,113 @@
+"""Statements per request of the hot read endpoints, held with sqltrace.query_budget().
+
+Each page is a fixed number of statements however many rows it returns;
+a budget failure lists the statement shapes that ran most often.
+"""
+import pytest
+
+from app import sqltrace
+from app.auth import create_jwt_token
+
+# with an unknown id, the most POST /api/movies/batch takes
+MOVIE_IDS = list(range(1, 20))
+MISSING_ID = 10 ** 6
+
+
+@pytest.fixture
+def user_client(client):
+    """``client`` signed in as a viewer, with the user already in the auth cache"""
+    client.cookies.set("access_token", create_jwt_token(3))
+    client.get("/api/users/me")
+    yield client
+    client.cookies.clear()
+
+
+def get(client, url: str, budget: int, **params):
+    with sqltrace.query_budget(budget) as finished:
+        response = client.get(url, params=params)
+    assert response.status_code == 200, response.text
+    assert len(finished) == 1
+    return response.json()
+
+
+@pytest.mark.parametrize("params, budget", [
+    ({}, 1),
+    ({"sort": "rating", "limit": 100}, 1),
+    ({"genre": "Драма", "sort": "year"}, 1),
+    ({"sort": "title", "with_total": True}, 2),
+])
+def test_movie_list(client, params, budget):
+    page = get(client, "/api/movies/", budget, **params)
+    assert page["items"]
+
+
+def test_movie_list_next_page(client):
+    first = get(client, "/api/movies/", 1, sort="rating", limit=10, fields="id,title")
+    following = get(client, "/api/movies/", 1, sort="rating", limit=10, fields="id,title",
+                    cursor=first["next_cursor"])
+    assert {m["id"] for m in first["items"]}.isdisjoint(m["id"] for m in following["items"])
+
+
+def test_movie_list_with_favorites(user_client):
+    get(user_client, "/api/movies/", 1, with_favorites=True)
+
+
+@pytest.mark.parametrize("movie_id", [1, 7])
+def test_movie_full(client, movie_id):
+    full = get(client, f"/api/movies/{movie_id}/full", 2, reviews_limit=50)
+    assert full["movie"]["id"] == movie_id
+
+
+def test_movie_full_signed_in(user_client):
+    get(user_client, "/api/movies/2/full", 2, approved_only=False)
+
+
+@pytest.mark.parametrize("count", [1, len(MOVIE_IDS)])
+def test_movie_batch(client, count):
+    with sqltrace.query_budget(2):
+        response = client.post("/api/movies/batch", json={"ids": MOVIE_IDS[:count] + [MISSING_ID]})
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == count
+    assert response.json()["missing"] == [MISSING_ID]
+
+
+def test_movie_batch_signed_in(user_client):
+    with sqltrace.query_budget(2):
+        response = user_client.post("/api/movies/batch", json={"ids": MOVIE_IDS, "reviews_limit": 5})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("params, budget", [
+    ({"q": "фильм"}, 1),
+    ({"q": "любовь", "limit": 100}, 1),
+    ({"q": "фильм", "with_total": True}, 2),
+])
+def test_search(client, params, budget):
+    get(client, "/api/movies/search", budget, **params)
+
+
+@pytest.mark.parametrize("params", [
+    {},
+    {"sort": "highest", "limit": 100},
+    {"sort": "lowest", "approved_only": False},
+    {"text_preview": 80, "fields": "id,rating,text"},
+])
+def test_movie_reviews(client, params):
+    page = get(client, "/api/reviews/movie/1", 1, **params)
+    assert page["items"]
+
+
+def test_movie_reviews_next_page(client):
+    first = get(client, "/api/reviews/movie/1", 1, limit=5)
+    get(client, "/api/reviews/movie/1", 1, limit=5, cursor=first["next_cursor"])
+
+
+@pytest.mark.parametrize("params", [{}, {"sort": "highest"}, {"sort": "lowest", "limit": 100}])
+def test_user_reviews(client, params):
+    get(client, "/api/users/5/reviews", 1, **params)
+
+
+def test_budget_exceeded(client):
+    with pytest.raises(sqltrace.QueryBudgetExceeded, match="/api/movies/3/full"):
+        with sqltrace.query_budget(1):
+            client.get("/api/movies/3/full", params={"reviews_limit": 7})